@@ -0,0 +1,92 @@
+"""
+Offline benchmark for step 4 extraction with and without a process pool.
+
+Builds a scratch directory holding a synthetic schedule.csv and timeline
+store (mock_sportradar's generator, --matches timelines), then runs
+step4_extract_own_goals.py --full as a subprocess once per --workers value
+(with --parallel-min 0, so the pool is used whatever the size; step 4 still
+caps workers at the CPU count). It prints the wall time and speedup of each
+run and checks that every run wrote the same own_goals.csv as the serial one.
+
+Forced onto a single CPU (before that cap existed) the pool never paid: 0.93x
+at 300 matches, 0.87x at 1000, 1.04x (noise) at 3000 with --workers 2; the
+cap now makes such runs serial. Timed in-process, extraction costs
+~0.75 ms/match and the pool adds ~25 ms plus ~0.11 ms/match of result
+pickling, so it needs several cores and a backfill of a thousand or more
+matches to come out ahead; step 4 stays serial below
+EXTRACT_PARALLEL_MIN_MATCHES and caps --workers at the CPU count.
+
+Usage:
+  python bench_extract.py --matches 3000 --workers 1,2,4
+"""
+
+from __future__ import annotations
+
+import argparse
+import filecmp
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import timeline_store
+from config import OWN_GOALS_CSV, SCHEDULE_CSV, TIMELINES_DB
+from mock_sportradar import synthetic_schedule, synthetic_timeline
+from step2_get_schedule import parse_schedule, save_csv
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def build_fixture(workdir: str, matches: int, seed: int) -> None:
+    entries = synthetic_schedule(matches, random.Random(seed))
+    save_csv(parse_schedule(entries), os.path.join(workdir, SCHEDULE_CSV))
+    store = timeline_store.SqliteStore(os.path.join(workdir, TIMELINES_DB))
+    for entry in entries:
+        store.put(entry["sport_event"]["id"], synthetic_timeline(entry, seed))
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--matches", type=int, default=3000, help="synthetic timelines to extract (default 3000)")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated step 4 worker counts")
+    parser.add_argument("--low-memory", action="store_true", help="pass --low-memory to step 4")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_extract_")
+    env = dict(os.environ, SUPABASE_URL="", TIMELINE_STORE="sqlite", PYTHONUTF8="1")
+    try:
+        t0 = time.perf_counter()
+        build_fixture(workdir, args.matches, args.seed)
+        print(f"Fixture: {args.matches} synthetic timelines in {time.perf_counter() - t0:.1f}s ({workdir}), "
+              f"{os.cpu_count() or 1} CPU(s)\n")
+        print(f"{'run':<14} {'seconds':>8} {'speedup':>8}  output")
+
+        output = os.path.join(workdir, OWN_GOALS_CSV)
+        reference = os.path.join(workdir, "own_goals.serial.csv")
+        baseline = None
+        for workers in [int(w) for w in args.workers.split(",")]:
+            cmd = [sys.executable, os.path.join(HERE, "step4_extract_own_goals.py"),
+                   "--full", "--workers", str(workers), "--parallel-min", "0"]
+            if args.low_memory:
+                cmd.append("--low-memory")
+            t0 = time.perf_counter()
+            subprocess.run(cmd, cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - t0
+            if baseline is None:
+                baseline = elapsed
+                shutil.copyfile(output, reference)
+                same = "reference"
+            else:
+                same = "identical" if filecmp.cmp(output, reference, shallow=False) else "DIFFERS"
+            print(f"{f'workers={workers}':<14} {elapsed:>8.2f} {baseline / elapsed:>7.2f}x  {same}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Offline throughput benchmark for step 2 and step 3 against mock_sportradar.py.
+
+Starts the stand-in server in-process, then runs step2_get_schedule.py and
+step3_fetch_timelines.py as subprocesses in a scratch directory (Supabase
+disabled) for each --workers value, and prints wall time and requests/second.
+
+Usage:
+  python bench_fetch.py --limit 60 --latency 150 --delay 0.2 --workers 1,4
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_sportradar import ServerOptions, start_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_step(script: str, workdir: str, env: dict, *args: str) -> float:
+    t0 = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(HERE, script), *args],
+        cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--limit", type=int, default=60, help="schedule entries served (default 60)")
+    parser.add_argument("--latency", type=float, default=150.0, help="server latency per request (ms)")
+    parser.add_argument("--jitter", type=float, default=50.0, help="± latency jitter (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 5xx responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--rps", type=float, default=0.0, help="server-enforced requests/second")
+    parser.add_argument("--delay", type=float, default=0.2, help="client REQUEST_DELAY_SECONDS")
+    parser.add_argument("--workers", default="1,4", help="comma-separated step 3 worker counts")
+    args = parser.parse_args()
+
+    server, base_url = start_server(ServerOptions(
+        latency_ms=args.latency, jitter_ms=args.jitter, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, rps=args.rps, max_matches=args.limit,
+    ))
+    env = dict(
+        os.environ,
+        SPORTRADAR_BASE_URL=base_url,
+        SPORTRADAR_REQUEST_DELAY=str(args.delay),
+        SPORTRADAR_API_KEY=os.environ.get("SPORTRADAR_API_KEY") or "bench",
+        SUPABASE_URL="",  # local mode only
+        PYTHONUTF8="1",
+    )
+    print(f"Mock server: {base_url}  ({len(server.data.schedules)} events, "
+          f"{args.latency:.0f}±{args.jitter:.0f} ms, client delay {args.delay}s)\n")
+    print(f"{'run':<22} {'requests':>9} {'seconds':>9} {'req/s':>7}")
+
+    for workers in [int(w) for w in args.workers.split(",")]:
+        workdir = tempfile.mkdtemp(prefix="bench_fetch_")
+        try:
+            before = server.requests
+            elapsed = run_step("step2_get_schedule.py", workdir, env)
+            n = server.requests - before
+            print(f"{'step2 (full)':<22} {n:>9} {elapsed:>9.2f} {n / elapsed:>7.2f}")
+
+            before = server.requests
+            elapsed = run_step("step3_fetch_timelines.py", workdir, env, "--workers", str(workers))
+            n = server.requests - before
+            print(f"{f'step3 workers={workers}':<22} {n:>9} {elapsed:>9.2f} {n / elapsed:>7.2f}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\nServer responses by status: {dict(sorted(server.counts.items()))}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,50 +7,16 @@ Usage:
 
 from __future__ import annotations
 
-import csv
 import html
-import os
 import sys
 
+import own_goal
+from own_goal import OwnGoal
 
-def load_rows(path: str) -> list[dict]:
-    if not os.path.exists(path) or os.path.getsize(path) == 0:
-        return []
-    with open(path, newline="", encoding="utf-8") as f:
-        return list(csv.DictReader(f))
 
-
-def row_key(row: dict) -> tuple:
-    return (
-        row.get("sport_event_id", ""),
-        row.get("og_player_id", ""),
-        row.get("minute", ""),
-        row.get("stoppage_time", ""),
-        row.get("home_score_after", ""),
-        row.get("away_score_after", ""),
-    )
-
-
-def format_minute(row: dict) -> str:
-    minute = row.get("minute", "")
-    stoppage = row.get("stoppage_time", "")
-    if not minute:
-        return "—"
-    if stoppage:
-        return f"{minute}+{stoppage}'"
-    return f"{minute}'"
-
-
-def display_name(raw: str) -> str:
-    if ", " in raw:
-        last, first = raw.split(", ", 1)
-        return f"{first} {last}"
-    return raw
-
-
-def build_summary(previous_rows: list[dict], current_rows: list[dict]) -> str:
-    previous_keys = {row_key(row) for row in previous_rows}
-    new_rows = [row for row in current_rows if row_key(row) not in previous_keys]
+def build_summary(previous_rows: list[OwnGoal], current_rows: list[OwnGoal]) -> str:
+    previous_keys = {og.identity for og in previous_rows}
+    new_rows = [og for og in current_rows if og.identity not in previous_keys]
 
     if not previous_rows:
         return (
@@ -69,19 +35,16 @@ def build_summary(previous_rows: list[dict], current_rows: list[dict]) -> str:
     )
 
     items = []
-    for row in new_rows:
-        match_label = f"{row.get('home_team', '')} vs {row.get('away_team', '')}"
-        scorer = display_name(row.get("og_player", "Unknown"))
-        minute = format_minute(row)
-        benefiting = row.get("benefiting_team", "")
-        commentary = row.get("commentary", "")
+    for og in new_rows:
+        match_label = f"{og.home_team} vs {og.away_team}"
+        commentary = og.commentary
         items.append(
             "<li>"
             f"<strong>{html.escape(match_label)}</strong> "
-            f"({html.escape(row.get('match_date', ''))})"
-            f"<br>Own goal scorer: {html.escape(scorer)}"
-            f"<br>Minute: {html.escape(minute)}"
-            f"<br>Benefited team: {html.escape(benefiting)}"
+            f"({html.escape(og.match_date)})"
+            f"<br>Own goal scorer: {html.escape(og.display_name)}"
+            f"<br>Minute: {html.escape(og.minute_display)}"
+            f"<br>Benefited team: {html.escape(og.benefiting_team)}"
             + (
                 f"<br>Commentary: <em>{html.escape(commentary)}</em>"
                 if commentary
@@ -99,8 +62,8 @@ def main() -> int:
         return 1
 
     previous_path, current_path, output_path = sys.argv[1:4]
-    previous_rows = load_rows(previous_path)
-    current_rows = load_rows(current_path)
+    previous_rows = own_goal.load_csv(previous_path)
+    current_rows = own_goal.load_csv(current_path)
     summary_html = build_summary(previous_rows, current_rows)
 
     with open(output_path, "w", encoding="utf-8") as f:
@@ -0,0 +1,271 @@
+"""
+Bookkeeping that sits next to the timeline cache.
+
+  - atomic_write() — write a file via temp file + fsync + rename, so a crash
+    never leaves a truncated file behind
+  - load_stale_ids() / mark_stale() / clear_stale() — sport_event_ids whose
+    schedule entry changed since their timeline was cached; step 2 marks them,
+    step 3 refetches them and clears the mark once the new timeline is stored
+  - load_pruned_ids() / mark_pruned() / clear_pruned() — completed 0–0
+    matches step 3 skipped under --prune-goalless; they still count as
+    reviewed in the report until their timeline is fetched
+  - load_unreadable_ids() / mark_unreadable() / clear_unreadable() — stored
+    timelines that could not be decoded; they stay in the store, readers skip
+    them and step 3 refetches them (unconditionally) on its next run
+  - clear_fetched() — drop all three marks above for timelines just fetched
+  - ValidatorStore — ETag / Last-Modified / content hash per API resource, so
+    schedule and timeline fetches can be conditional (304 = nothing to do)
+  - FetchJournal / replay_journal() — append-only log of timelines stored
+    during a step 3 run; if the run dies before its end-of-run bookkeeping,
+    the next run replays the journal and resumes exactly where it stopped
+  - load_watermarks() / save_watermarks() — per-match marks of the timeline
+    and schedule data step 4 last extracted own goals from, so it only
+    reprocesses matches that changed
+  - load_timeline_stats() / save_timeline_stats() — per-match event and
+    detector counts from step 4's last run, read by the report
+"""
+
+from __future__ import annotations
+
+import glob
+import json
+import os
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from config import (
+    STALE_TIMELINES_JSON,
+    PRUNED_MATCHES_JSON,
+    UNREADABLE_TIMELINES_JSON,
+    HTTP_VALIDATORS_JSON,
+    FETCH_JOURNAL,
+    OWN_GOALS_WATERMARKS_JSON,
+    TIMELINE_STATS_JSON,
+    TIMELINES_DIR,
+)
+
+TMP_SUFFIX = ".tmp"
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "w", **open_kwargs):
+    """
+    Open a temp file next to `path` for writing; on success fsync it and rename
+    it over `path`, on error delete it. Readers only ever see the old or the new file.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=TMP_SUFFIX)
+    try:
+        # mkstemp creates 0600 files; keep the mode a plain open() would give
+        os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else 0o644)
+        with os.fdopen(fd, mode, **open_kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _load_id_set(path: str) -> set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return set(json.load(f))
+
+
+def _save_id_set(ids: set[str], path: str) -> None:
+    with atomic_write(path, encoding="utf-8") as f:
+        json.dump(sorted(ids), f, indent=0)
+
+
+def _add_ids(ids, path: str) -> set[str]:
+    current = _load_id_set(path)
+    updated = current | set(ids)
+    if updated != current:
+        _save_id_set(updated, path)
+    return updated
+
+
+def _remove_ids(ids, path: str) -> set[str]:
+    current = _load_id_set(path)
+    remaining = current - set(ids)
+    if remaining != current:
+        _save_id_set(remaining, path)
+    return remaining
+
+
+def load_stale_ids(path: str = STALE_TIMELINES_JSON) -> set[str]:
+    return _load_id_set(path)
+
+
+def mark_stale(ids, path: str = STALE_TIMELINES_JSON) -> set[str]:
+    """Add ids to the stale set; return the full set."""
+    return _add_ids(ids, path)
+
+
+def clear_stale(ids, path: str = STALE_TIMELINES_JSON) -> set[str]:
+    """Remove ids (typically just refetched) from the stale set; return what is left."""
+    return _remove_ids(ids, path)
+
+
+def load_pruned_ids(path: str = PRUNED_MATCHES_JSON) -> set[str]:
+    return _load_id_set(path)
+
+
+def mark_pruned(ids, path: str = PRUNED_MATCHES_JSON) -> set[str]:
+    """Record completed matches reviewed from the schedule alone (no timeline fetched)."""
+    return _add_ids(ids, path)
+
+
+def clear_pruned(ids, path: str = PRUNED_MATCHES_JSON) -> set[str]:
+    """Forget pruned matches whose timeline has now been fetched."""
+    return _remove_ids(ids, path)
+
+
+def load_unreadable_ids(path: str = UNREADABLE_TIMELINES_JSON) -> set[str]:
+    return _load_id_set(path)
+
+
+def mark_unreadable(ids, path: str = UNREADABLE_TIMELINES_JSON) -> set[str]:
+    """Record stored timelines that failed to decode, for step 3 to refetch."""
+    return _add_ids(ids, path)
+
+
+def clear_unreadable(ids, path: str = UNREADABLE_TIMELINES_JSON) -> set[str]:
+    """Forget unreadable timelines that have now been refetched."""
+    return _remove_ids(ids, path)
+
+
+def clear_fetched(ids) -> None:
+    """Drop the stale, pruned and unreadable marks of timelines just fetched (or confirmed unchanged)."""
+    ids = set(ids)
+    clear_stale(ids)
+    clear_pruned(ids)
+    clear_unreadable(ids)
+
+
+def load_watermarks(path: str = OWN_GOALS_WATERMARKS_JSON) -> dict[str, str]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_watermarks(marks: dict[str, str], path: str = OWN_GOALS_WATERMARKS_JSON) -> None:
+    with atomic_write(path, encoding="utf-8") as f:
+        json.dump(marks, f, indent=1, sort_keys=True)
+
+
+def load_timeline_stats(path: str = TIMELINE_STATS_JSON) -> dict | None:
+    """The stats artifact from the last step 4 run, or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_timeline_stats(per_match: dict[str, dict], detector_names: list[str],
+                        path: str = TIMELINE_STATS_JSON) -> None:
+    stats = {
+        "matches_reviewed": len(per_match),
+        "timeline_events": sum(m["events"] for m in per_match.values()),
+        **{f"total_{name}": sum(m.get(name, 0) for m in per_match.values()) for name in detector_names},
+        "matches": dict(sorted(per_match.items())),
+    }
+    with atomic_write(path, encoding="utf-8") as f:
+        json.dump(stats, f, indent=1)
+
+
+class ValidatorStore:
+    """Thread-safe map of API resource path -> {"etag", "last_modified", "sha256"}."""
+
+    def __init__(self, path: str = HTTP_VALIDATORS_JSON):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._data: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._data = json.load(f)
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key: str, validators: dict) -> None:
+        with self._lock:
+            if self._data.get(key) != validators:
+                self._data[key] = validators
+                self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            with atomic_write(self.path, encoding="utf-8") as f:
+                json.dump(self._data, f, indent=1, sort_keys=True)
+            self._dirty = False
+
+
+class FetchJournal:
+    """Append-only, fsync'd log of timelines stored in the current step 3 run."""
+
+    def __init__(self, path: str = FETCH_JOURNAL):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def record(self, sport_event_id: str, key: str, validators: dict) -> None:
+        line = json.dumps({"sport_event_id": sport_event_id, "key": key, "validators": validators})
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def discard(self) -> None:
+        """Close and delete the journal once its entries are reflected in the stale set and validators."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def replay_journal(path: str = FETCH_JOURNAL) -> int:
+    """
+    Apply a journal left behind by an interrupted run: clear the stale, pruned
+    and unreadable marks and restore validators for every timeline it recorded
+    (as the end of a completed run would), remove orphaned temp
+    files from the cache directory, then delete the journal. Returns the
+    number of entries replayed.
+    """
+    if not os.path.exists(path):
+        return 0
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break  # torn final line from the crash
+    validators = ValidatorStore()
+    for entry in entries:
+        validators.set(entry["key"], entry["validators"])
+    validators.save()
+    clear_fetched(e["sport_event_id"] for e in entries)
+    for tmp in glob.glob(os.path.join(TIMELINES_DIR, f".*{TMP_SUFFIX}")):
+        os.remove(tmp)
+    os.remove(path)
+    return len(entries)
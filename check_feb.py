@@ -1,5 +1,6 @@
-import csv, os
-from config import SCHEDULE_CSV, TIMELINES_DIR, COMPLETED_STATUSES
+import csv
+import timeline_store
+from config import SCHEDULE_CSV, COMPLETED_STATUSES
 
 with open(SCHEDULE_CSV, newline="", encoding="utf-8") as f:
     rows = list(csv.DictReader(f))
@@ -8,11 +9,9 @@ feb = [r for r in rows if "2026-02-01" <= r["start_time"][:10] <= "2026-02-25"]
 completed = [r for r in feb if r["status"] in COMPLETED_STATUSES]
 print(f"Feb 1-25 in schedule: {len(feb)} total, {len(completed)} completed")
 
-def cache_path(eid):
-    return os.path.join(TIMELINES_DIR, eid.replace(":", "_") + ".json")
-
-cached  = [r for r in completed if os.path.exists(cache_path(r["sport_event_id"]))]
-missing = [r for r in completed if not os.path.exists(cache_path(r["sport_event_id"]))]
+cached_ids = timeline_store.open_store().ids()
+cached  = [r for r in completed if r["sport_event_id"] in cached_ids]
+missing = [r for r in completed if r["sport_event_id"] not in cached_ids]
 print(f"Already cached: {len(cached)}   Missing / new: {len(missing)}")
 if missing:
     print("\nNot yet cached:")
@@ -5,10 +5,9 @@ The API inflates this by keeping both the original postponed slot AND
 the rescheduled replacement as separate entries.
 """
 import csv
-import json
-import urllib.request
 
-from config import API_KEY, BASE_URL, SEASON_ID
+import sportradar
+from config import SEASON_ID
 
 with open('data/schedule.csv', encoding='utf-8') as f:
     rows = list(csv.DictReader(f))
@@ -21,14 +20,10 @@ print()
 
 # Fetch raw schedule to check for replaced_by fields on postponed events
 print("Fetching raw schedule to check 'replaced_by' on postponed fixtures...")
-url = f"{BASE_URL}/seasons/{SEASON_ID}/schedules.json?api_key={API_KEY}"
-req = urllib.request.Request(url, headers={"Accept": "application/json"})
-with urllib.request.urlopen(req, timeout=30) as resp:
-    import json
-    data = json.loads(resp.read().decode())
+schedules = sportradar.get_client().get_schedule(SEASON_ID)
 
 postponed = [
-    s for s in data['schedules']
+    s for s in schedules
     if s.get('sport_event_status', {}).get('status') == 'postponed'
 ]
 
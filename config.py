@@ -10,7 +10,8 @@ try:
     API_KEY = _LOCAL_KEY
 except ImportError:
     API_KEY = os.environ.get("SPORTRADAR_API_KEY", "")
-BASE_URL = "https://api.sportradar.com/soccer/trial/v4/en"
+# Override to point at a stand-in server, e.g. mock_sportradar.py for offline runs
+BASE_URL = os.environ.get("SPORTRADAR_BASE_URL", "https://api.sportradar.com/soccer/trial/v4/en")
 
 COMPETITION_ID = "sr:competition:17"   # English Premier League
 SEASON_ID = "sr:season:130281"         # 2025/26 season (confirmed)
@@ -19,11 +20,51 @@ SEASON_NAME = "Premier League 25/26"
 # Output files
 SCHEDULE_CSV = "data/schedule.csv"
 OWN_GOALS_CSV = "data/own_goals.csv"
-TIMELINES_DIR = "data/timelines"       # cached raw JSON responses
+PENALTIES_CSV = "data/penalties.csv"
+RED_CARDS_CSV = "data/red_cards.csv"
+TIMELINES_DIR = "data/timelines"       # cached raw JSON responses (TIMELINE_STORE = "dir")
+TIMELINES_DB = "data/timelines.sqlite" # same, packed into one file (TIMELINE_STORE = "sqlite")
+TIMELINE_STORE = os.environ.get("TIMELINE_STORE", "sqlite")
+TIMELINE_COMPRESSION = os.environ.get("TIMELINE_COMPRESSION", "none")  # none / gzip / zstd (SQLite store)
+EVENTS_DIR = "data/events"             # columnar event store built by event_store.py
+STALE_TIMELINES_JSON = "data/stale_timelines.json"   # timelines to refetch (schedule changed)
+HTTP_VALIDATORS_JSON = "data/http_validators.json"   # ETag / Last-Modified / hash per API resource
+FETCH_JOURNAL = "data/fetch_journal.jsonl"           # append-only log of the current step 3 run
+PRUNED_MATCHES_JSON = "data/pruned_matches.json"     # 0–0 matches reviewed from the schedule only
+UNREADABLE_TIMELINES_JSON = "data/unreadable_timelines.json"  # stored timelines that failed to decode
+OWN_GOALS_WATERMARKS_JSON = "data/own_goals_watermarks.json"  # what step 4 last extracted, per match
+TIMELINE_STATS_JSON = "data/timeline_stats.json"  # per-match event / detector counts from step 4
 REPORT_HTML = "report.html"
 
-# Rate limiting: Sportradar trial keys are limited to 1 request/second
-REQUEST_DELAY_SECONDS = 1.1
+# Rate limiting: Sportradar trial keys are limited to 1 request/second (0 = no pacing, for the mock)
+REQUEST_DELAY_SECONDS = float(os.environ.get("SPORTRADAR_REQUEST_DELAY", "1.1"))
+
+# Concurrent timeline fetches in step 3. Request starts are still paced by
+# REQUEST_DELAY_SECONDS; extra workers only overlap response/write time.
+FETCH_WORKERS = 4
+
+# Optional caps for one step 3 run (None = unlimited); --deadline / --max-requests
+FETCH_DEADLINE_SECONDS = None
+FETCH_MAX_REQUESTS = None
+
+# step4 --workers: below this many timelines to (re)process, extraction stays
+# serial. Extraction costs ~0.75 ms/match; the pool adds ~25 ms to start plus
+# ~0.11 ms/match to ship results back, so a weekly run (tens of matches) or a
+# single season (380) gains little or nothing. See bench_extract.py.
+EXTRACT_PARALLEL_MIN_MATCHES = 1000
+
+# Skip timelines for 0–0 matches (no own goal possible); off by default
+PRUNE_GOALLESS = False
+
+# Retries for 429/5xx/network errors: exponential backoff with jitter, capped.
+# Requests that still fail are re-queued once more at the end of the run.
+RETRY_ATTEMPTS = 4
+RETRY_BASE_DELAY_SECONDS = 2.0
+RETRY_MAX_DELAY_SECONDS = 60.0
+
+# step2 --window: page size for the per-date schedule endpoint, which lists
+# every competition's fixtures for that day
+DAILY_SCHEDULE_PAGE_SIZE = 200
 
 # Only fetch timelines for matches with these statuses
 COMPLETED_STATUSES = {"closed", "ended"}
@@ -36,3 +77,10 @@ try:
 except (ImportError, AttributeError):
     SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "") or os.environ.get("SUPABASE_ANON_KEY", "")
 USE_SUPABASE = bool(SUPABASE_URL and SUPABASE_KEY)
+
+# Rows per page for db.py reads (keyset pagination, so the server's max-rows cap can't truncate them)
+SUPABASE_PAGE_SIZE = 1000
+# Rows per PostgREST request for bulk upserts (one request for a whole season's schedule)
+SUPABASE_UPSERT_CHUNK_SIZE = 500
+# Matches per page when step 4 downloads timelines from Supabase (each is a large jsonb blob)
+SUPABASE_TIMELINE_PAGE_SIZE = 50
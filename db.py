@@ -4,10 +4,18 @@ Supabase helpers for EPL Own Goals pipeline.
 Use when USE_SUPABASE is True in config. Provides:
   - get_client() — PostgREST client (avoids full supabase pkg + C++ deps)
   - get_or_create_season() — ensure season row exists
-  - upsert_schedule() — upsert schedule rows
+  - upsert_schedule() — bulk upsert schedule rows in chunks (optionally only changed ones)
   - get_completed_matches_without_timeline() — for step 3
   - upsert_timeline() / get_timeline_json() — store or read timeline
+  - get_completed_matches_with_timelines() — paged generator of completed rows + timeline JSON (step 4)
+  - get_completed_matches_timeline_marks() — completed rows + timeline fetched_at, no JSON (step 4)
+  - sync_own_goals() — atomic bulk upsert + delete of own goals (RPC)
   - upsert_own_goals() — write extracted own goals
+  - replace_own_goals_for_matches() — rewrite own goals for just some matches
+
+Multi-row reads page through _paged() (keyset pagination on a unique column), so
+PostgREST's max-rows cap never truncates them; timeline lookups join schedule to
+match_timelines in the query instead of sending schedule UUIDs in an in_ filter.
 
 Install: pip install postgrest httpx
 Env: SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY (or SUPABASE_ANON_KEY)
@@ -15,9 +23,22 @@ Env: SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY (or SUPABASE_ANON_KEY)
 
 from __future__ import annotations
 
-from config import USE_SUPABASE, SUPABASE_URL, SUPABASE_KEY, SEASON_ID, COMPETITION_ID, SEASON_NAME
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterator
+
+import own_goal
+from config import (
+    USE_SUPABASE, SUPABASE_URL, SUPABASE_KEY, SEASON_ID, COMPETITION_ID, SEASON_NAME,
+    COMPLETED_STATUSES, SUPABASE_PAGE_SIZE, SUPABASE_UPSERT_CHUNK_SIZE, SUPABASE_TIMELINE_PAGE_SIZE,
+)
+from own_goal import OwnGoal
 
 _client = None
+# Cleared when match_timelines has no event_count column (report_stats migration not applied)
+_has_event_count = True
+_schema_lock = threading.Lock()
 
 
 def get_client():
@@ -42,6 +63,33 @@ def get_client():
     return _client
 
 
+def _paged(query, key: str = "id", page_size: int = SUPABASE_PAGE_SIZE) -> Iterator[dict]:
+    """
+    Every row of a select, page_size at a time, by keyset pagination on `key` (unique,
+    sortable). `query` builds a fresh filtered select that includes `key`. Paging stops
+    on an empty page rather than a short one, so a server max-rows cap below page_size
+    cannot cut results short.
+    """
+    last = None
+    while True:
+        q = query()
+        if last is not None:
+            q = q.gt(key, last)
+        rows = q.order(key).limit(page_size).execute().data or []
+        if not rows:
+            return
+        yield from rows
+        last = rows[-1][key]
+
+
+def _embedded(row: dict, table: str) -> dict:
+    """Pop a one-to-one embedded resource: an object on current PostgREST, a list on older ones."""
+    embedded = row.pop(table, None)
+    if isinstance(embedded, list):
+        embedded = embedded[0] if embedded else None
+    return embedded or {}
+
+
 def get_or_create_season():
     """Ensure the current season exists in public.seasons; return its id (uuid)."""
     supabase = get_client()
@@ -56,50 +104,96 @@ def get_or_create_season():
     return ins.data[0]["id"]
 
 
-def upsert_schedule(season_id: str, rows: list[dict]) -> None:
-    """Upsert schedule rows for the given season_id. Each row must include sport_event_id and schedule fields."""
+# Every schedule column step 2 writes (bar season_id, which the diff filters on);
+# diff mode resends a row if any of these differ
+SCHEDULE_DIFF_FIELDS = (
+    "sport_event_id", "start_time", "round", "home_team", "home_team_id",
+    "away_team", "away_team_id", "status", "match_status", "home_score", "away_score",
+)
+
+
+def _schedule_payload(season_id: str, row: dict) -> dict:
+    return {
+        "season_id": season_id,
+        "sport_event_id": row["sport_event_id"],
+        "start_time": row.get("start_time") or None,
+        "round": row.get("round") or None,
+        "home_team": row.get("home_team") or None,
+        "home_team_id": row.get("home_team_id") or None,
+        "away_team": row.get("away_team") or None,
+        "away_team_id": row.get("away_team_id") or None,
+        "status": row.get("status") or None,
+        "match_status": row.get("match_status") or None,
+        "home_score": _int_or_none(row.get("home_score")),
+        "away_score": _int_or_none(row.get("away_score")),
+    }
+
+
+def _schedule_diff_key(row: dict) -> tuple:
+    """A schedule row's SCHEDULE_DIFF_FIELDS, normalised so a CSV payload and the stored row compare equal."""
+    key = []
+    for field in SCHEDULE_DIFF_FIELDS:
+        value = row.get(field)
+        if field == "start_time" and value:
+            # timestamptz comes back as e.g. "2025-08-15T19:00:00+00:00"; the feed may write "...Z"
+            try:
+                value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            except ValueError:
+                pass
+        elif field in ("home_score", "away_score"):
+            value = _int_or_none(value)
+        elif value == "":
+            value = None
+        elif field == "round" and value is not None:
+            value = str(value)  # an int from the feed, text in the schedule table
+        key.append(value)
+    return tuple(key)
+
+
+def upsert_schedule(season_id: str, rows: list[dict], diff: bool = False,
+                    chunk_size: int = SUPABASE_UPSERT_CHUNK_SIZE) -> int:
+    """
+    Upsert schedule rows for the given season_id, chunk_size rows per request.
+    Each row must include sport_event_id and schedule fields. With diff=True the
+    season's current schedule is read once and only new rows, or rows where any
+    SCHEDULE_DIFF_FIELDS column differs, are sent. Returns the number of rows upserted.
+    """
     if not rows:
-        return
+        return 0
     supabase = get_client()
-    for row in rows:
-        payload = {
-            "season_id": season_id,
-            "sport_event_id": row["sport_event_id"],
-            "start_time": row.get("start_time") or None,
-            "round": row.get("round") or None,
-            "home_team": row.get("home_team") or None,
-            "home_team_id": row.get("home_team_id") or None,
-            "away_team": row.get("away_team") or None,
-            "away_team_id": row.get("away_team_id") or None,
-            "status": row.get("status") or None,
-            "match_status": row.get("match_status") or None,
-            "home_score": _int_or_none(row.get("home_score")),
-            "away_score": _int_or_none(row.get("away_score")),
+    payloads = [_schedule_payload(season_id, row) for row in rows]
+    if diff:
+        current = {
+            x["sport_event_id"]: _schedule_diff_key(x)
+            for x in _paged(lambda: supabase.table("schedule").select(
+                "id," + ",".join(SCHEDULE_DIFF_FIELDS)
+            ).eq("season_id", season_id))
         }
+        payloads = [p for p in payloads if current.get(p["sport_event_id"]) != _schedule_diff_key(p)]
+    for i in range(0, len(payloads), chunk_size):
         supabase.table("schedule").upsert(
-            payload,
+            payloads[i:i + chunk_size],
             on_conflict="season_id,sport_event_id",
             ignore_duplicates=False,
         ).execute()
+    return len(payloads)
 
 
 def get_completed_schedule_for_season(season_id: str) -> list[dict]:
     """Return schedule rows that are completed (status in closed/ended)."""
     supabase = get_client()
-    r = supabase.table("schedule").select("*").eq("season_id", season_id).in_("status", ["closed", "ended"]).execute()
-    return r.data or []
+    return list(_paged(
+        lambda: supabase.table("schedule").select("*").eq("season_id", season_id).in_("status", ["closed", "ended"])
+    ))
 
 
 def get_schedule_ids_with_timeline(season_id: str) -> set[str]:
     """Return set of schedule.id (uuid) that already have a match_timelines row."""
     supabase = get_client()
-    # Get schedule ids that have timelines
-    sched = supabase.table("schedule").select("id").eq("season_id", season_id).execute()
-    sched_ids = [x["id"] for x in (sched.data or [])]
-    if not sched_ids:
-        return set()
-    tl = supabase.table("match_timelines").select("schedule_id").in_("schedule_id", sched_ids).execute()
-    return {x["schedule_id"] for x in (tl.data or [])}
+    # Inner join on match_timelines: only schedule rows that have one
+    return {x["id"] for x in _paged(
+        lambda: supabase.table("schedule").select("id, match_timelines!inner(schedule_id)").eq("season_id", season_id)
+    )}
 
 
 def get_completed_matches_without_timeline(season_id: str) -> list[dict]:
@@ -109,13 +203,42 @@ def get_completed_matches_without_timeline(season_id: str) -> list[dict]:
     return [r for r in completed if r["id"] not in with_timeline]
 
 
+def _missing_from_schema(e: Exception, name: str) -> bool:
+    """Whether a PostgREST error says column or function `name` does not exist (a migration not yet applied)."""
+    code = getattr(e, "code", None)
+    text = f"{getattr(e, 'message', '') or ''} {e}"
+    return code in ("PGRST202", "PGRST204", "42703", "42883") and name in text
+
+
+def _warn_missing_migration(what: str, fallback: str, migration: str = "20261016000100_report_stats.sql") -> None:
+    print(f"  Warning: {what} does not exist — {fallback}. Apply supabase/migrations/{migration}.")
+
+
 def upsert_timeline(schedule_id: str, timeline_json: dict | None = None) -> None:
     """Record that we have fetched the timeline for this schedule row. Optionally store timeline_json."""
+    global _has_event_count
+    from postgrest.exceptions import APIError
     supabase = get_client()
-    supabase.table("match_timelines").upsert({
+    row = {
         "schedule_id": schedule_id,
         "timeline_json": timeline_json,
-    }, on_conflict="schedule_id", ignore_duplicates=False).execute()
+        # Refetches update the row in place; step 4 uses fetched_at to spot them
+        "fetched_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if _has_event_count:
+        # Lets get_report_stats() count events without downloading timelines
+        row["event_count"] = len(timeline_json.get("timeline", [])) if timeline_json else None
+    try:
+        supabase.table("match_timelines").upsert(row, on_conflict="schedule_id", ignore_duplicates=False).execute()
+    except APIError as e:
+        if "event_count" not in row or not _missing_from_schema(e, "event_count"):
+            raise
+        with _schema_lock:
+            if _has_event_count:
+                _warn_missing_migration("match_timelines.event_count", "storing timelines without it")
+            _has_event_count = False
+        del row["event_count"]
+        supabase.table("match_timelines").upsert(row, on_conflict="schedule_id", ignore_duplicates=False).execute()
 
 
 def get_timeline_json(schedule_id: str) -> dict | None:
@@ -127,60 +250,101 @@ def get_timeline_json(schedule_id: str) -> dict | None:
     return None
 
 
-def get_completed_matches_with_timelines(season_id: str) -> list[dict]:
-    """Return completed schedule rows that have timelines, with timeline_json attached. For step4."""
-    completed = get_completed_schedule_for_season(season_id)
-    with_tl_ids = get_schedule_ids_with_timeline(season_id)
-    result = []
-    for row in completed:
-        if row["id"] not in with_tl_ids:
-            continue
-        tl = get_timeline_json(row["id"])
-        if tl:
-            row_copy = dict(row)
-            row_copy["timeline_json"] = tl
-            result.append(row_copy)
-    return result
-
-
-def get_all_own_goals() -> list[dict]:
-    """Return all own_goals rows for the report. Keys match CSV/legacy format."""
+def get_completed_matches_with_timelines(
+    season_id: str, sport_event_ids=None, page_size: int = SUPABASE_TIMELINE_PAGE_SIZE,
+) -> Iterator[dict]:
+    """
+    Yield completed schedule rows that have timelines, with fetched_at and timeline_json
+    attached. For step4. One embedded schedule + match_timelines query per page_size rows
+    (optionally only sport_event_ids); the next page downloads while the caller works
+    through the current one.
+    """
+    supabase = get_client()
+    ids = sorted(set(sport_event_ids)) if sport_event_ids is not None else None
+
+    def fetch_page(page: int, after: str | None) -> list[dict]:
+        query = supabase.table("schedule").select(
+            "*, match_timelines!inner(fetched_at, timeline_json)"
+        ).eq("season_id", season_id).in_("status", sorted(COMPLETED_STATUSES))
+        if ids is not None:
+            query = query.in_("sport_event_id", ids[page * page_size:(page + 1) * page_size])
+        elif after is not None:
+            query = query.gt("sport_event_id", after)  # keyset, as in _paged()
+        return query.order("sport_event_id").limit(page_size).execute().data or []
+
+    pages = None if ids is None else -(-len(ids) // page_size)
+    if pages == 0:
+        return
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        page = 0
+        pending = prefetch.submit(fetch_page, page, None)
+        while pending is not None:
+            rows = pending.result()
+            page += 1
+            more = page < pages if pages is not None else bool(rows)
+            pending = prefetch.submit(fetch_page, page, rows[-1]["sport_event_id"] if rows else None) if more else None
+            for row in rows:
+                tl = _embedded(row, "match_timelines")
+                yield {**row, "fetched_at": tl.get("fetched_at"), "timeline_json": tl.get("timeline_json")}
+
+
+def get_completed_matches_timeline_marks(season_id: str) -> list[dict]:
+    """Return completed schedule rows that have timelines, with the timeline's fetched_at (not its JSON). For step4."""
     supabase = get_client()
-    r = supabase.table("own_goals").select("*").order("match_date").order("minute").execute()
-    rows = r.data or []
-    # Normalize for report: ensure string values where needed
+    rows = _paged(
+        lambda: supabase.table("schedule").select("*, match_timelines!inner(fetched_at)")
+        .eq("season_id", season_id).in_("status", sorted(COMPLETED_STATUSES))
+    )
     out = []
     for row in rows:
-        out.append({
-            "sport_event_id": row.get("sport_event_id", ""),
-            "match_date": str(row.get("match_date") or "")[:10],
-            "round": str(row.get("round") or ""),
-            "home_team": str(row.get("home_team") or ""),
-            "away_team": str(row.get("away_team") or ""),
-            "og_player": str(row.get("og_player") or ""),
-            "og_player_id": str(row.get("og_player_id") or ""),
-            "og_player_team": str(row.get("og_player_team") or ""),
-            "benefiting_team": str(row.get("benefiting_team") or ""),
-            "minute": str(row.get("minute") or ""),
-            "stoppage_time": str(row.get("stoppage_time") or ""),
-            "home_score_after": row.get("home_score_after") if row.get("home_score_after") is not None else "",
-            "away_score_after": row.get("away_score_after") if row.get("away_score_after") is not None else "",
-            "final_home_score": row.get("final_home_score") if row.get("final_home_score") is not None else "",
-            "final_away_score": row.get("final_away_score") if row.get("final_away_score") is not None else "",
-            "commentary": str(row.get("commentary") or ""),
-        })
+        fetched_at = _embedded(row, "match_timelines").get("fetched_at")
+        out.append({**row, "fetched_at": fetched_at})
     return out
 
 
-def get_report_stats() -> tuple[int, int]:
-    """Return (completed_matches, timeline_events) for the report."""
+def get_all_own_goals() -> list[OwnGoal]:
+    """Return all own_goals rows for the report, as OwnGoal records (unordered; sort by .sort_key)."""
     supabase = get_client()
-    tl = supabase.table("match_timelines").select("timeline_json").execute()
-    rows = tl.data or []
-    completed_matches = len(rows)
-    timeline_events = 0
-    for row in rows:
-        data = row.get("timeline_json") or {}
+    return [
+        OwnGoal.from_row({**row, "match_date": str(row.get("match_date") or "")[:10]})
+        for row in _paged(lambda: supabase.table("own_goals").select("*"))
+    ]
+
+
+def get_report_stats(season_id: str | None = None, fallback=None) -> tuple[int, int]:
+    """
+    Return (completed_matches, timeline_events) for the report, counted server-side
+    (report_stats RPC). Without that migration, returns fallback() when given,
+    else downloads the timelines and counts here.
+    """
+    from postgrest.exceptions import APIError
+    supabase = get_client()
+    try:
+        r = supabase.rpc("report_stats", {"p_season_id": season_id}).execute()
+    except APIError as e:
+        if not _missing_from_schema(e, "report_stats"):
+            raise
+        if fallback is not None:
+            _warn_missing_migration("report_stats()", "using step 4's timeline stats instead")
+            return fallback()
+        _warn_missing_migration("report_stats()", "counting events from every timeline instead")
+        return _count_report_stats(season_id)
+    row = (r.data or [{}])[0]
+    return int(row.get("completed_matches") or 0), int(row.get("timeline_events") or 0)
+
+
+def _count_report_stats(season_id: str | None) -> tuple[int, int]:
+    """get_report_stats() the slow way: page through the season's timeline JSON."""
+    supabase = get_client()
+
+    def query():
+        q = supabase.table("schedule").select("id, match_timelines!inner(timeline_json)")
+        return q.eq("season_id", season_id) if season_id else q
+
+    completed_matches = timeline_events = 0
+    for row in _paged(query, page_size=SUPABASE_TIMELINE_PAGE_SIZE):
+        data = _embedded(row, "match_timelines").get("timeline_json") or {}
+        completed_matches += 1
         timeline_events += len(data.get("timeline", []))
     return completed_matches, timeline_events
 
@@ -194,42 +358,78 @@ def get_schedule_by_sport_event_id(season_id: str, sport_event_id: str) -> dict
     return None
 
 
-def clear_own_goals() -> None:
-    """Delete all own_goals. Call before re-inserting to avoid duplicates on pipeline re-run."""
+def sync_own_goals(rows: list[OwnGoal], sport_event_ids=None, allow_empty: bool = False) -> None:
+    """
+    Make the own_goals table match `rows` in one transaction (sync_own_goals RPC):
+    bulk upsert by natural key, then delete rows that were not sent. With
+    sport_event_ids, only those matches' rows are candidates for deletion;
+    without, `rows` is the whole table — and an empty `rows` would wipe it, so
+    that raises unless allow_empty=True. On a database without the
+    20261016000000_own_goals_sync.sql migration it warns and falls back to a
+    (non-atomic) delete and insert.
+    """
+    # The key must be unique within one upsert statement
+    unique = {og.identity: og for og in rows}
+    if sport_event_ids is None and not unique and not allow_empty:
+        raise ValueError("Refusing to sync an empty own_goals table; pass allow_empty=True to clear it")
+    from postgrest.exceptions import APIError
+    params = {"p_rows": [_own_goal_payload(og) for og in unique.values()]}
+    if sport_event_ids is not None:
+        params["p_sport_event_ids"] = sorted(set(sport_event_ids))
+        if not params["p_sport_event_ids"] and not unique:
+            return
+    try:
+        get_client().rpc("sync_own_goals", params).execute()
+    except APIError as e:
+        if not _missing_from_schema(e, "sync_own_goals"):
+            raise
+        _warn_missing_migration("sync_own_goals()", "replacing own goals with a delete and insert instead",
+                                "20261016000000_own_goals_sync.sql")
+        _replace_own_goals(params["p_rows"], params.get("p_sport_event_ids"))
+
+
+def _replace_own_goals(payloads: list[dict], sport_event_ids: list[str] | None,
+                       chunk_size: int = SUPABASE_UPSERT_CHUNK_SIZE) -> None:
+    """
+    sync_own_goals() for a database without its migration: delete the rows of
+    sport_event_ids (None = every row), then insert payloads in chunks. Not
+    atomic — readers can see the rows missing in between.
+    """
     supabase = get_client()
-    r = supabase.table("own_goals").select("id").execute()
-    ids = [x["id"] for x in (r.data or [])]
-    if ids:
-        supabase.table("own_goals").delete().in_("id", ids).execute()
+    if sport_event_ids is None:
+        supabase.table("own_goals").delete().not_.is_("id", "null").execute()
+    else:
+        # Rows sent for a match outside sport_event_ids would otherwise be inserted twice
+        ids = sorted(set(sport_event_ids) | {p["sport_event_id"] for p in payloads})
+        for i in range(0, len(ids), chunk_size):
+            supabase.table("own_goals").delete().in_("sport_event_id", ids[i:i + chunk_size]).execute()
+    for i in range(0, len(payloads), chunk_size):
+        supabase.table("own_goals").insert(payloads[i:i + chunk_size]).execute()
 
 
-def upsert_own_goals(rows: list[dict], replace: bool = True) -> None:
-    """Insert own_goals rows. If replace=True, clears existing rows first to avoid duplicates on re-run."""
-    supabase = get_client()
-    if replace:
-        clear_own_goals()
-    if not rows:
-        return
-    for row in rows:
-        payload = {
-            "sport_event_id": row.get("sport_event_id", ""),
-            "match_date": row.get("match_date"),
-            "round": row.get("round"),
-            "home_team": row.get("home_team"),
-            "away_team": row.get("away_team"),
-            "og_player": row.get("og_player"),
-            "og_player_id": row.get("og_player_id"),
-            "og_player_team": row.get("og_player_team"),
-            "benefiting_team": row.get("benefiting_team"),
-            "minute": row.get("minute"),
-            "stoppage_time": row.get("stoppage_time"),
-            "home_score_after": _int_or_none(row.get("home_score_after")),
-            "away_score_after": _int_or_none(row.get("away_score_after")),
-            "final_home_score": _int_or_none(row.get("final_home_score")),
-            "final_away_score": _int_or_none(row.get("final_away_score")),
-            "commentary": row.get("commentary"),
-        }
-        supabase.table("own_goals").insert(payload).execute()
+def clear_own_goals() -> None:
+    """Delete all own_goals."""
+    sync_own_goals([], allow_empty=True)
+
+
+def upsert_own_goals(rows: list[OwnGoal], replace: bool = True) -> None:
+    """
+    Write own_goals rows in one request. If replace=True, rows not in `rows`
+    are deleted in the same transaction (so an empty list clears the table).
+    """
+    sync_own_goals(rows, None if replace else [], allow_empty=replace)
+
+
+def replace_own_goals_for_matches(sport_event_ids, rows: list[OwnGoal]) -> None:
+    """Make the given matches' own_goals exactly `rows` (their re-extracted own goals); other matches are untouched."""
+    sync_own_goals(rows, sport_event_ids)
+
+
+def _own_goal_payload(og: OwnGoal) -> dict:
+    # Int fields are already parsed (None when absent); "" would be rejected by integer columns
+    payload = {field: getattr(og, field) for field in own_goal.FIELDS}
+    payload["match_date"] = og.match_date or None
+    return payload
 
 
 def _int_or_none(v):
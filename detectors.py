@@ -0,0 +1,237 @@
+"""
+Timeline event detectors and the single-pass engine that runs them.
+
+A detector declares the timeline event types it needs and turns matching
+events into rows for its own output table. run() walks a match's timeline
+once and hands each event only to the detectors registered for its type, so
+a new question (late winners, VAR decisions, ...) is a new detector rather
+than another pass over every timeline.
+
+Registered detectors (REGISTRY, in registration order):
+  - own_goals — score_change with method own_goal      → data/own_goals.csv
+  - penalties — penalty goals and missed penalties      → data/penalties.csv
+  - red_cards — straight red and second-yellow cards    → data/red_cards.csv
+
+To add one: subclass Detector, set name / event_types / fields / output,
+implement detect(), and register() an instance. Step 4 picks it up, including
+the streaming scan (which keeps only events of the wanted types) and the
+incremental merge — bump step4's EXTRACT_VERSION so existing matches are
+rescanned for it.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Callable
+
+import own_goal
+from config import OWN_GOALS_CSV, PENALTIES_CSV, RED_CARDS_CSV
+from own_goal import OwnGoal, is_own_goal
+
+MATCH_FIELDS = ["sport_event_id", "match_date", "round", "home_team", "away_team"]
+
+
+class MatchContext:
+    """Per-match facts shared by every detector: schedule fields and final score."""
+
+    def __init__(self, data: dict, schedule_row: dict):
+        final_status = data.get("sport_event_status", {})
+        self.final_home = final_status.get("home_score", "")
+        self.final_away = final_status.get("away_score", "")
+        self.sport_event_id = schedule_row.get("sport_event_id", "")
+        self.home_team = schedule_row.get("home_team", "")
+        self.away_team = schedule_row.get("away_team", "")
+        self.round = schedule_row.get("round", "")
+        self.match_date = str(schedule_row.get("start_time", ""))[:10]
+
+    def team(self, competitor: str) -> str:
+        """Team name for a "home"/"away" competitor qualifier."""
+        return self.home_team if competitor == "home" else self.away_team
+
+    def opponent(self, competitor: str) -> str:
+        return self.away_team if competitor == "home" else self.home_team
+
+    def fields(self) -> dict:
+        return {
+            "sport_event_id": self.sport_event_id,
+            "match_date": self.match_date,
+            "round": self.round,
+            "home_team": self.home_team,
+            "away_team": self.away_team,
+        }
+
+
+def _player(ev: dict, player_type: str | None = None) -> dict:
+    """The event's player of the given type (scorer, ...), or its first player when no type is given."""
+    players = ev.get("players", [])
+    if player_type:
+        return next((p for p in players if p.get("type") == player_type), {})
+    return players[0] if players else {}
+
+
+def _commentary(ev: dict) -> str:
+    commentaries = ev.get("commentaries", [])
+    return commentaries[0].get("text", "") if commentaries else ""
+
+
+class Detector(ABC):
+    """One question asked of every timeline event of the types it lists."""
+
+    name = ""
+    event_types: frozenset[str] = frozenset()
+    fields: list[str] = []
+    output = ""
+
+    @abstractmethod
+    def detect(self, ev: dict, match: MatchContext) -> dict | None:
+        """Return an output row for this event, or None to skip it."""
+
+    def load(self, row: dict):
+        """In-memory row for a row read back from this detector's CSV."""
+        return row
+
+    def dump(self, row) -> dict:
+        """CSV dict for an in-memory row (from detect() or load())."""
+        return row
+
+    def sort_key(self, row) -> tuple:
+        """Date, then minute — works for freshly extracted rows and rows read back from the CSV."""
+        minute = str(row["minute"])
+        return row["match_date"], int(minute) if minute.isdigit() else 0
+
+
+class OwnGoals(Detector):
+    """
+    Own goals: score_change events with method == "own_goal".
+
+    The event's competitor is the team that BENEFITS; the scorer plays for the other one.
+    Rows are OwnGoal records (own_goal.py) rather than dicts.
+    """
+
+    name = "own_goals"
+    event_types = frozenset({"score_change"})
+    output = OWN_GOALS_CSV
+    fields = own_goal.FIELDS
+
+    def detect(self, ev: dict, match: MatchContext) -> OwnGoal | None:
+        if not is_own_goal(ev):
+            return None
+        scorer = _player(ev, "scorer")
+        benefiting = ev.get("competitor", "")
+        return OwnGoal.from_row({
+            **match.fields(),
+            "og_player": scorer.get("name", "Unknown"),
+            "og_player_id": scorer.get("id", ""),
+            "og_player_team": match.opponent(benefiting),
+            "benefiting_team": match.team(benefiting),
+            "minute": ev.get("match_time", ""),
+            "stoppage_time": ev.get("stoppage_time", ""),
+            "home_score_after": ev.get("home_score", ""),
+            "away_score_after": ev.get("away_score", ""),
+            "final_home_score": match.final_home,
+            "final_away_score": match.final_away,
+            "commentary": _commentary(ev),
+        })
+
+    def load(self, row: dict) -> OwnGoal:
+        return OwnGoal.from_row(row)
+
+    def dump(self, row: OwnGoal) -> dict:
+        return row.as_row()
+
+    def sort_key(self, row: OwnGoal) -> tuple:
+        return row.sort_key
+
+
+class Penalties(Detector):
+    """Penalties scored (score_change with method "penalty") and missed (penalty_missed)."""
+
+    name = "penalties"
+    event_types = frozenset({"score_change", "penalty_missed"})
+    output = PENALTIES_CSV
+    fields = MATCH_FIELDS + ["outcome", "player", "player_id", "team", "minute", "stoppage_time", "commentary"]
+
+    def detect(self, ev: dict, match: MatchContext) -> dict | None:
+        if ev.get("type") == "score_change":
+            if ev.get("method") != "penalty":
+                return None
+            outcome, player = "scored", _player(ev, "scorer")
+        else:
+            outcome, player = "missed", _player(ev)
+        return {
+            **match.fields(),
+            "outcome": outcome,
+            "player": player.get("name", ""),
+            "player_id": player.get("id", ""),
+            "team": match.team(ev.get("competitor", "")),
+            "minute": ev.get("match_time", ""),
+            "stoppage_time": ev.get("stoppage_time", ""),
+            "commentary": _commentary(ev),
+        }
+
+
+class RedCards(Detector):
+    """Sendings-off: straight red cards and second yellows."""
+
+    name = "red_cards"
+    event_types = frozenset({"red_card", "yellow_red_card"})
+    output = RED_CARDS_CSV
+    fields = MATCH_FIELDS + ["card", "player", "player_id", "team", "minute", "stoppage_time", "commentary"]
+
+    def detect(self, ev: dict, match: MatchContext) -> dict | None:
+        player = _player(ev)
+        return {
+            **match.fields(),
+            "card": "red" if ev.get("type") == "red_card" else "second_yellow",
+            "player": player.get("name", ""),
+            "player_id": player.get("id", ""),
+            "team": match.team(ev.get("competitor", "")),
+            "minute": ev.get("match_time", ""),
+            "stoppage_time": ev.get("stoppage_time", ""),
+            "commentary": _commentary(ev),
+        }
+
+
+REGISTRY: list[Detector] = []
+
+
+def register(detector: Detector) -> Detector:
+    if any(d.name == detector.name for d in REGISTRY):
+        raise ValueError(f"Detector {detector.name!r} is already registered")
+    REGISTRY.append(detector)
+    return detector
+
+
+OWN_GOALS = register(OwnGoals())
+PENALTIES = register(Penalties())
+RED_CARDS = register(RedCards())
+
+
+@lru_cache(maxsize=None)
+def _dispatch(detectors: tuple[Detector, ...]) -> dict[str, tuple[Detector, ...]]:
+    by_type: dict[str, list[Detector]] = {}
+    for detector in detectors:
+        for event_type in detector.event_types:
+            by_type.setdefault(event_type, []).append(detector)
+    return {event_type: tuple(ds) for event_type, ds in by_type.items()}
+
+
+def wants(detectors=None) -> Callable[[dict], bool]:
+    """Predicate for timeline_scan.scan(): keep events that any of the detectors looks at."""
+    event_types = frozenset(_dispatch(tuple(detectors or REGISTRY)))
+    return lambda ev: ev.get("type") in event_types
+
+
+def run(data: dict, schedule_row: dict, detectors=None) -> dict[str, list]:
+    """Dispatch every timeline event once to the detectors interested in it; return rows per detector name."""
+    detectors = tuple(detectors or REGISTRY)
+    dispatch = _dispatch(detectors)
+    match = MatchContext(data, schedule_row)
+    out: dict[str, list] = {d.name: [] for d in detectors}
+    for ev in data.get("timeline", []):
+        for detector in dispatch.get(ev.get("type"), ()):
+            row = detector.detect(ev, match)
+            if row is not None:
+                out[detector.name].append(row)
+    return out
@@ -0,0 +1,244 @@
+"""
+Columnar, memory-mapped store of every cached timeline event.
+
+Flattens all timelines in the timeline store into one NumPy array per column
+under data/events/, so questions like "how many own goals", "goals in
+stoppage time" or "events per match" become vectorised masks over a few
+hundred thousand rows instead of a Python loop over every timeline dict.
+
+Columns (one row per timeline event, in timeline order within each match):
+  match          index into meta["matches"] (sport_event_id)
+  seq            position of the event in its match's timeline
+  event_id       Sportradar event id
+  type, method, competitor, player
+                 codes into meta["vocab"][column]; code 0 is "" (absent)
+  period, match_time, stoppage_time, home_score, away_score
+                 integers, -1 when absent
+
+String columns are dictionary-encoded, so a mask is an integer comparison:
+    table = load()
+    og = table.own_goal_mask()
+    table.rows(og)  # decoded dicts for the matching events
+
+Rebuilding is skipped when the timeline manifest (see timeline_store.py) has
+not changed since the last build. A build writes a new generation of column
+files and switches meta.json to it last, so a crash mid-build leaves the
+previous store intact.
+
+Requires NumPy (pip install numpy); nothing else in the pipeline does.
+
+Usage:
+  python event_store.py            # build if the cache changed, then print summary stats
+  python event_store.py --rebuild  # force a full rebuild
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import cache_state
+import timeline_store
+from config import EVENTS_DIR
+
+META_NAME = "meta.json"
+
+STRING_COLUMNS = ("type", "method", "competitor", "player")
+INT_COLUMNS = {
+    "match": "int32",
+    "seq": "int32",
+    "event_id": "int64",
+    "period": "int16",
+    "match_time": "int16",
+    "stoppage_time": "int16",
+    "home_score": "int16",
+    "away_score": "int16",
+}
+CODE_DTYPE = "int32"
+
+
+def _np():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("event_store needs NumPy: pip install numpy") from None
+    return numpy
+
+
+def _int(value) -> int:
+    if value in (None, ""):
+        return -1
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+
+def _player_id(ev: dict) -> str:
+    """The scorer when there is one, otherwise the first listed player."""
+    players = ev.get("players") or []
+    scorer = next((p for p in players if p.get("type") == "scorer"), None)
+    player = scorer or (players[0] if players else {})
+    return player.get("id", "")
+
+
+def _column_path(directory: str, name: str, generation: int) -> str:
+    return os.path.join(directory, f"{name}.{generation}.npy")
+
+
+def _load_meta(directory: str) -> dict | None:
+    try:
+        with open(os.path.join(directory, META_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _fingerprint(manifest: dict[str, dict]) -> dict[str, str]:
+    return {sport_event_id: entry["sha256"] for sport_event_id, entry in manifest.items()}
+
+
+def build(store=None, directory: str = EVENTS_DIR, force: bool = False) -> bool:
+    """Flatten every cached timeline into column files; return False when already up to date."""
+    np = _np()
+    store = store or timeline_store.open_store()
+    fingerprint = _fingerprint(store.manifest())
+    meta = _load_meta(directory)
+    if meta and not force and meta.get("fingerprint") == fingerprint:
+        return False
+
+    vocab: dict[str, dict[str, int]] = {name: {"": 0} for name in STRING_COLUMNS}
+    values: dict[str, list[int]] = {name: [] for name in (*INT_COLUMNS, *STRING_COLUMNS)}
+    matches = []
+
+    for match_index, (sport_event_id, data) in enumerate(store.items()):
+        matches.append(sport_event_id)
+        for seq, ev in enumerate(data.get("timeline", [])):
+            values["match"].append(match_index)
+            values["seq"].append(seq)
+            values["event_id"].append(_int(ev.get("id")))
+            for name in ("period", "match_time", "stoppage_time", "home_score", "away_score"):
+                values[name].append(_int(ev.get(name)))
+            raw = {
+                "type": ev.get("type", ""),
+                "method": ev.get("method", ""),
+                "competitor": ev.get("competitor", ""),
+                "player": _player_id(ev),
+            }
+            for name, value in raw.items():
+                codes = vocab[name]
+                values[name].append(codes.setdefault(value, len(codes)))
+
+    os.makedirs(directory, exist_ok=True)
+    generation = (meta or {}).get("generation", 0) + 1
+    for name, column in values.items():
+        dtype = INT_COLUMNS.get(name, CODE_DTYPE)
+        with cache_state.atomic_write(_column_path(directory, name, generation), "wb") as f:
+            np.save(f, np.asarray(column, dtype=dtype))
+
+    new_meta = {
+        "generation": generation,
+        "rows": len(values["match"]),
+        "matches": matches,
+        "vocab": {name: list(codes) for name, codes in vocab.items()},
+        "fingerprint": fingerprint,
+    }
+    with cache_state.atomic_write(os.path.join(directory, META_NAME), encoding="utf-8") as f:
+        json.dump(new_meta, f)
+
+    # Previous generations are unreachable once meta.json points at the new one
+    for path in glob.glob(os.path.join(directory, "*.npy")):
+        if not path.endswith(f".{generation}.npy"):
+            os.remove(path)
+    return True
+
+
+class EventTable:
+    """Memory-mapped event columns plus the vocabularies needed to decode them."""
+
+    def __init__(self, directory: str = EVENTS_DIR):
+        np = _np()
+        meta = _load_meta(directory)
+        if meta is None:
+            raise FileNotFoundError(f"No event store in {directory}/ — run event_store.py first")
+        self.matches: list[str] = meta["matches"]
+        self.vocab: dict[str, list[str]] = meta["vocab"]
+        self._codes = {name: {v: i for i, v in enumerate(words)} for name, words in self.vocab.items()}
+        self.columns = {
+            name: np.load(_column_path(directory, name, meta["generation"]), mmap_mode="r")
+            for name in (*INT_COLUMNS, *STRING_COLUMNS)
+        }
+
+    def __len__(self) -> int:
+        return len(self.columns["match"])
+
+    def __getitem__(self, name: str):
+        return self.columns[name]
+
+    def code(self, column: str, value: str) -> int:
+        """Integer code for a string value; -1 (matches nothing) when it never occurs."""
+        return self._codes[column].get(value, -1)
+
+    def eq(self, column: str, value: str):
+        """Boolean mask of events whose string column equals value."""
+        return self.columns[column] == self.code(column, value)
+
+    def own_goal_mask(self):
+        """Vectorised counterpart of own_goal.is_own_goal()."""
+        return self.eq("type", "score_change") & self.eq("method", "own_goal")
+
+    def events_per_match(self):
+        """Event count for each entry of self.matches."""
+        return _np().bincount(self.columns["match"], minlength=len(self.matches))
+
+    def rows(self, mask) -> list[dict]:
+        """Decode the events selected by mask back into plain dicts."""
+        np = _np()
+        out = []
+        for i in np.flatnonzero(mask):
+            row = {"sport_event_id": self.matches[self.columns["match"][i]]}
+            for name in INT_COLUMNS:
+                if name != "match":
+                    row[name] = int(self.columns[name][i])
+            for name in STRING_COLUMNS:
+                row[name] = self.vocab[name][self.columns[name][i]]
+            out.append(row)
+        return out
+
+
+def load(directory: str = EVENTS_DIR) -> EventTable:
+    return EventTable(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rebuild", action="store_true", help="rebuild even if the cache is unchanged")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    built = build(force=args.rebuild)
+    print(f"Event store {'built' if built else 'up to date'} in {time.perf_counter() - t0:.2f}s ({EVENTS_DIR}/)")
+
+    t0 = time.perf_counter()
+    table = load()
+    goals = table.eq("type", "score_change")
+    own_goals = table.own_goal_mask()
+    stoppage_goals = goals & (table["stoppage_time"] >= 0)
+    per_match = table.events_per_match()
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+
+    print(f"  Matches              : {len(table.matches)}")
+    print(f"  Events               : {len(table):,}")
+    print(f"  Goals                : {int(goals.sum())}")
+    print(f"  Own goals            : {int(own_goals.sum())}")
+    print(f"  Stoppage-time goals  : {int(stoppage_goals.sum())}")
+    if len(per_match):
+        print(f"  Events per match     : {per_match.mean():.1f} (max {per_match.max()})")
+    print(f"  Queries took {elapsed_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
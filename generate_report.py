@@ -2,49 +2,49 @@
 STEP 5 — Generate the EPL Own Goals HTML report.
 
 Reads data/own_goals.csv and produces a self-contained report.html.
+Match and event counts come from data/timeline_stats.json, written by step 4
+in the same pass that extracted the own goals; without it they fall back to
+the timeline manifest. With Supabase they come from the report_stats RPC,
+which counts every stored timeline server-side, and fall back to
+timeline_stats.json only if that migration is missing.
 Can be re-run at any time to refresh the report from the latest CSV.
 """
 
-import csv
-import json
 import os
 from datetime import datetime, timezone
+from operator import attrgetter
 
-from config import OWN_GOALS_CSV, REPORT_HTML, SEASON_NAME, TIMELINES_DIR, USE_SUPABASE
+import cache_state
+import own_goal
+import timeline_store
+from own_goal import OwnGoal
+from config import OWN_GOALS_CSV, REPORT_HTML, SEASON_NAME, USE_SUPABASE
 
 ASSETS_DIR = os.path.join(os.path.dirname(__file__), "assets")
 
 
-def count_completed_matches() -> int:
-    """Number of cached timeline files = completed matches reviewed."""
-    if not os.path.isdir(TIMELINES_DIR):
-        return 0
-    return sum(1 for f in os.listdir(TIMELINES_DIR) if f.endswith(".json"))
+def count_completed_matches(per_match: dict[str, dict]) -> int:
+    """Matches with timelines plus 0–0 matches pruned by step 3 = completed matches reviewed."""
+    return len(per_match.keys() | cache_state.load_pruned_ids())
 
 
-def count_timeline_events() -> int:
-    """Total number of individual timeline events across all cached matches."""
-    if not os.path.isdir(TIMELINES_DIR):
-        return 0
-    total = 0
-    for filename in os.listdir(TIMELINES_DIR):
-        if not filename.endswith(".json"):
-            continue
-        filepath = os.path.join(TIMELINES_DIR, filename)
-        try:
-            with open(filepath, encoding="utf-8") as f:
-                data = json.load(f)
-            total += len(data.get("timeline", []))
-        except Exception:
-            pass
-    return total
+def count_timeline_events(per_match: dict[str, dict]) -> int:
+    """Total number of individual timeline events across all matches."""
+    return sum(entry["events"] for entry in per_match.values())
 
 
-def load_own_goals(csv_path: str) -> list[dict]:
-    if not os.path.exists(csv_path):
-        return []
-    with open(csv_path, newline="", encoding="utf-8") as f:
-        return list(csv.DictReader(f))
+def supabase_report_counts(db, stats: dict | None) -> tuple[int, int]:
+    """(completed matches reviewed, timeline events) from the report_stats RPC, with timeline_stats.json as fallback."""
+    fallback = None
+    if stats:
+        fallback = lambda: (len(stats["matches"]), count_timeline_events(stats["matches"]))
+    completed_matches, timeline_events = db.get_report_stats(db.get_or_create_season(), fallback)
+    # Pruned 0–0 matches were reviewed from the schedule alone
+    return completed_matches + len(cache_state.load_pruned_ids()), timeline_events
+
+
+def load_own_goals(csv_path: str) -> list[OwnGoal]:
+    return own_goal.load_csv(csv_path)
 
 
 def load_svg(filename: str) -> str:
@@ -55,66 +55,52 @@ def load_svg(filename: str) -> str:
         return f.read()
 
 
-def format_minute(minute: str, stoppage: str) -> str:
-    if not minute:
+def format_score(home: int | None, away: int | None) -> str:
+    if home is None or away is None:
         return "—"
-    if stoppage:
-        return f"{minute}+{stoppage}'"
-    return f"{minute}'"
+    return f"{home}–{away}"
 
 
-def format_score(home: str, away: str) -> str:
-    if home == "" or away == "":
-        return "—"
-    return f"{home}–{away}"
+def _val(value: int | None) -> str:
+    return "" if value is None else str(value)
 
 
-def build_table_rows(rows: list[dict]) -> str:
+def build_table_rows(rows: list[OwnGoal]) -> str:
     if not rows:
         return '<tr><td colspan="10" style="text-align:center;padding:2rem;color:#666;">No own goals found yet.</td></tr>'
 
     html_rows = []
     for i, r in enumerate(rows, 1):
-        minute_display = format_minute(r["minute"], r["stoppage_time"])
-        score_at_og = format_score(r["home_score_after"], r["away_score_after"])
-        final_score = format_score(r["final_home_score"], r["final_away_score"])
-        match_label = f"{r['home_team']} vs {r['away_team']}"
-        round_label = f"GW{r['round']}" if r.get("round") else "—"
-        commentary = r.get("commentary", "")
-
-        # Flip "Last, First" → "First Last"
-        raw_name = r["og_player"]
-        if ", " in raw_name:
-            last, first = raw_name.split(", ", 1)
-            display_name = f"{first} {last}"
-        else:
-            display_name = raw_name
+        score_at_og = format_score(r.home_score_after, r.away_score_after)
+        final_score = format_score(r.final_home_score, r.final_away_score)
+        match_label = f"{r.home_team} vs {r.away_team}"
+        round_label = f"GW{r.round}" if r.round else "—"
+        commentary = r.commentary
 
         # Data attributes drive the JS sort (sortable by raw value, not display HTML)
-        minute_val = r["minute"] if r["minute"] else "0"
+        minute_val = r.minute or 0
 
-        og_mentioned = "own goal" in commentary.lower()
-        og_class = "og-yes" if og_mentioned else "og-no"
-        og_label = "Yes" if og_mentioned else "No"
-        og_sort = "1" if og_mentioned else "0"
+        og_class = "og-yes" if r.mentions_own_goal else "og-no"
+        og_label = "Yes" if r.mentions_own_goal else "No"
+        og_sort = "1" if r.mentions_own_goal else "0"
 
         html_rows.append(f"""
         <tr>
           <td class="num" data-val="{i}" data-label="#">{i}</td>
-          <td data-val="{r['match_date']}" data-label="Match">
+          <td data-val="{r.match_date}" data-label="Match">
             <div class="match-name">{match_label}</div>
-            <div class="meta">{r['match_date']} &bull; {round_label}</div>
+            <div class="meta">{r.match_date} &bull; {round_label}</div>
           </td>
-          <td class="id-cell match-id-cell" data-val="{r['sport_event_id']}" data-label="Match ID"><code title="{r['sport_event_id']}">{r['sport_event_id']}</code></td>
-          <td data-val="{r['og_player']}" data-label="Scorer">
-            <div class="player-name">{display_name}</div>
-            <div class="meta">{r['og_player_team']}</div>
+          <td class="id-cell match-id-cell" data-val="{r.sport_event_id}" data-label="Match ID"><code title="{r.sport_event_id}">{r.sport_event_id}</code></td>
+          <td data-val="{r.og_player}" data-label="Scorer">
+            <div class="player-name">{r.display_name}</div>
+            <div class="meta">{r.og_player_team}</div>
           </td>
-          <td class="id-cell" data-val="{r['og_player_id']}" data-label="Player ID"><code title="{r['og_player_id']}">{r['og_player_id']}</code></td>
-          <td class="minute" data-val="{minute_val}" data-label="Min">{minute_display}</td>
-          <td data-val="{r['benefiting_team']}" data-label="Benefiting"><div class="team-badge">{r['benefiting_team']}</div></td>
-          <td class="score" data-val="{r.get('home_score_after','0')}" data-label="At OG">{score_at_og}</td>
-          <td class="score final" data-val="{r['final_home_score']}" data-label="Final">{final_score}</td>
+          <td class="id-cell" data-val="{r.og_player_id}" data-label="Player ID"><code title="{r.og_player_id}">{r.og_player_id}</code></td>
+          <td class="minute" data-val="{minute_val}" data-label="Min">{r.minute_display}</td>
+          <td data-val="{r.benefiting_team}" data-label="Benefiting"><div class="team-badge">{r.benefiting_team}</div></td>
+          <td class="score" data-val="{_val(r.home_score_after)}" data-label="At OG">{score_at_og}</td>
+          <td class="score final" data-val="{_val(r.final_home_score)}" data-label="Final">{final_score}</td>
           <td class="{og_class}" data-val="{og_sort}" data-label="Mentions OG?">{og_label}</td>
           <td class="commentary-cell" data-val="{commentary}" data-label="Commentary"><span class="commentary">{commentary}</span></td>
         </tr>""")
@@ -122,7 +108,7 @@ def build_table_rows(rows: list[dict]) -> str:
     return "\n".join(html_rows)
 
 
-def generate_html(rows: list[dict], completed_matches: int, timeline_events: int) -> str:
+def generate_html(rows: list[OwnGoal], completed_matches: int, timeline_events: int) -> str:
     generated = datetime.now(timezone.utc).strftime("%d %B %Y, %H:%M UTC")
     total = len(rows)
     logo_svg = load_svg("lanes_sportsdata.svg")
@@ -130,21 +116,17 @@ def generate_html(rows: list[dict], completed_matches: int, timeline_events: int
     if rows:
         player_counts: dict[str, int] = {}
         team_counts: dict[str, int] = {}
+        display_names: dict[str, str] = {}
         for r in rows:
-            player_counts[r["og_player"]] = player_counts.get(r["og_player"], 0) + 1
-            team_counts[r["og_player_team"]] = team_counts.get(r["og_player_team"], 0) + 1
+            player_counts[r.og_player] = player_counts.get(r.og_player, 0) + 1
+            team_counts[r.og_player_team] = team_counts.get(r.og_player_team, 0) + 1
+            display_names[r.og_player] = r.display_name
 
         unlucky_player_count = max(player_counts.values())
         unlucky_team_count = max(team_counts.values())
 
-        def flip_name(raw: str) -> str:
-            if ", " in raw:
-                last, first = raw.split(", ", 1)
-                return f"{first} {last}"
-            return raw
-
         top_players = sorted(
-            [flip_name(p) for p, c in player_counts.items() if c == unlucky_player_count]
+            [display_names[p] for p, c in player_counts.items() if c == unlucky_player_count]
         )
         top_teams = sorted(
             [t for t, c in team_counts.items() if c == unlucky_team_count]
@@ -155,9 +137,9 @@ def generate_html(rows: list[dict], completed_matches: int, timeline_events: int
 
         events_display = f"{timeline_events:,}"
 
-        commentary_correct = sum(1 for r in rows if "own goal" in r.get("commentary", "").lower())
+        commentary_correct = sum(1 for r in rows if r.mentions_own_goal)
         commentary_incorrect = total - commentary_correct
-        games_with_og = len(set(r["sport_event_id"] for r in rows))
+        games_with_og = len({r.sport_event_id for r in rows})
 
         stats_html = f"""
         <div class="stats-grid">
@@ -690,17 +672,19 @@ def generate_html(rows: list[dict], completed_matches: int, timeline_events: int
 
 
 def main():
+    stats = cache_state.load_timeline_stats()
     if USE_SUPABASE:
         import db
         rows = db.get_all_own_goals()
-        completed_matches, timeline_events = db.get_report_stats()
-        rows.sort(key=lambda r: (r["match_date"], int(r["minute"]) if str(r["minute"]).isdigit() else 0))
+        completed_matches, timeline_events = supabase_report_counts(db, stats)
+        rows.sort(key=attrgetter("sort_key"))
         print(f"Loaded {len(rows)} own goal records from Supabase")
     else:
         rows = load_own_goals(OWN_GOALS_CSV)
-        rows.sort(key=lambda r: (r["match_date"], int(r["minute"]) if str(r["minute"]).isdigit() else 0))
-        completed_matches = count_completed_matches()
-        timeline_events = count_timeline_events()
+        rows.sort(key=attrgetter("sort_key"))
+        per_match = stats["matches"] if stats else timeline_store.open_store().manifest()
+        completed_matches = count_completed_matches(per_match)
+        timeline_events = count_timeline_events(per_match)
         print(f"Loaded {len(rows)} own goal records from {OWN_GOALS_CSV}")
     print(f"Completed matches reviewed : {completed_matches}")
     print(f"Total timeline events      : {timeline_events:,}")
@@ -3,17 +3,18 @@ One-off migration: import existing CSV and timeline files into Supabase.
 
 Run once after setting up Supabase to avoid losing existing data.
   - schedule.csv → schedule table
-  - data/timelines/*.json → match_timelines table (requires schedule rows first)
+  - cached timelines (timeline store) → match_timelines table (requires schedule rows first)
   - own_goals.csv → own_goals table
 
 Requires USE_SUPABASE=True (config_local has SUPABASE_KEY).
 """
 
 import csv
-import json
 import os
 
-from config import USE_SUPABASE, SCHEDULE_CSV, OWN_GOALS_CSV, TIMELINES_DIR, SEASON_ID
+import own_goal
+import timeline_store
+from config import USE_SUPABASE, SCHEDULE_CSV, OWN_GOALS_CSV, SEASON_ID
 
 
 def migrate_schedule():
@@ -35,25 +36,21 @@ def migrate_schedule():
 
 
 def migrate_timelines():
-    """Import timeline JSON files into match_timelines table."""
+    """Import cached timelines (local timeline store) into match_timelines table."""
     import db
     season_id = db.get_or_create_season()
-    if not os.path.isdir(TIMELINES_DIR):
-        print(f"  Skipping timelines — {TIMELINES_DIR} not found")
+    store = timeline_store.open_store()
+    if not len(store):
+        print("  Skipping timelines — no cached timelines found")
         return 0
-    files = [f for f in os.listdir(TIMELINES_DIR) if f.endswith(".json")]
     count = 0
-    for filename in files:
-        sport_event_id = filename.replace("sr_sport_event_", "sr:sport_event:").replace(".json", "")
+    for sport_event_id, data in store.items():
         row = db.get_schedule_by_sport_event_id(season_id, sport_event_id)
         if not row:
             continue
-        filepath = os.path.join(TIMELINES_DIR, filename)
-        with open(filepath, encoding="utf-8") as f:
-            data = json.load(f)
         db.upsert_timeline(row["id"], data)
         count += 1
-    print(f"  Migrated {count} timeline files")
+    print(f"  Migrated {count} timelines")
     return count
 
 
@@ -62,14 +59,11 @@ def migrate_own_goals():
     if not os.path.exists(OWN_GOALS_CSV):
         print(f"  Skipping own_goals — {OWN_GOALS_CSV} not found")
         return 0
-    rows = []
-    with open(OWN_GOALS_CSV, newline="", encoding="utf-8") as f:
-        for row in csv.DictReader(f):
-            rows.append(row)
+    rows = own_goal.load_csv(OWN_GOALS_CSV)
     if not rows:
         return 0
     import db
-    db.upsert_own_goals(rows, replace=True)  # Replace with CSV content
+    db.sync_own_goals(rows)  # Replace with CSV content
     print(f"  Migrated {len(rows)} own_goal rows")
     return len(rows)
 
@@ -0,0 +1,354 @@
+"""
+Local stand-in for the Sportradar Soccer v4 API, for offline testing and benchmarks.
+
+Serves the three endpoints the pipeline uses:
+  /seasons/{season_id}/schedules.json
+  /schedules/{date}/schedules.json          (start / limit paging)
+  /sport_events/{sport_event_id}/timeline.json
+
+Data comes from recorded fixtures when available — a --fixtures directory
+holding schedule.json (a raw season schedule response) and timelines/*.json in
+the data/timelines naming scheme, falling back to data/schedule.csv and the
+local timeline store (opened read-only, and only if it already exists) — and
+is synthesised deterministically otherwise.
+
+Responses honour Accept-Encoding: gzip and If-None-Match (ETag), keep
+connections alive, and carry X-Plan-Quota-* headers. Latency, 429/5xx
+injection, a per-second rate limit and a plan quota are configurable.
+
+Usage:
+  python mock_sportradar.py --port 8080 --latency 150 --rps 1 --error-rate 0.02
+  SPORTRADAR_BASE_URL=http://127.0.0.1:8080/soccer/trial/v4/en python run_all.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import calendar
+import csv
+import gzip
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import timeline_store
+from config import SCHEDULE_CSV, SEASON_ID, COMPETITION_ID, TIMELINES_DB, TIMELINES_DIR, TIMELINE_STORE
+from rate_limit import TokenBucket
+
+PREFIX = "/soccer/trial/v4/en"
+
+FILLER_TYPES = [
+    "possession", "free_kick", "throw_in", "goal_kick", "corner_kick", "offside",
+    "shot_off_target", "shot_on_target", "shot_saved", "injury", "substitution", "yellow_card",
+]
+
+
+@dataclass
+class ServerOptions:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0       # fraction of requests answered with a random 5xx
+    throttle_rate: float = 0.0    # fraction of requests answered with 429 + Retry-After
+    rps: float = 0.0              # enforce this many requests/second (0 = unlimited)
+    quota: int = 0                # total requests allowed before 403 quota errors (0 = unlimited)
+    fixtures: str | None = None
+    synthetic_matches: int = 380  # used only when there is no schedule to replay
+    max_matches: int = 0          # serve only the first N schedule entries (0 = all)
+    seed: int = 0
+
+
+def _schedule_entry(row: dict) -> dict:
+    """Turn a schedule.csv row back into a raw API schedule entry."""
+    status = {"status": row["status"], "match_status": row["match_status"]}
+    for k in ("home_score", "away_score"):
+        if row.get(k) not in ("", None):
+            status[k] = int(row[k])
+    return {
+        "sport_event": {
+            "id": row["sport_event_id"],
+            "start_time": row["start_time"],
+            "sport_event_context": {
+                "competition": {"id": COMPETITION_ID},
+                "season": {"id": SEASON_ID},
+                "round": {"number": int(row["round"])} if row.get("round") else {},
+            },
+            "competitors": [
+                {"id": row["home_team_id"], "name": row["home_team"], "qualifier": "home"},
+                {"id": row["away_team_id"], "name": row["away_team"], "qualifier": "away"},
+            ],
+        },
+        "sport_event_status": status,
+    }
+
+
+def synthetic_schedule(n: int, rng: random.Random) -> list[dict]:
+    """A made-up closed season of n matches between 20 teams, one round every 7 days."""
+    teams = [(f"sr:competitor:{9000 + i}", f"Team {chr(65 + i)} FC") for i in range(20)]
+    entries = []
+    for i in range(n):
+        home, away = rng.sample(teams, 2)
+        day = time.gmtime(calendar.timegm((2025, 8, 15, 12, 0, 0)) + (i // 10) * 7 * 86400)
+        entries.append(_schedule_entry({
+            "sport_event_id": f"sr:sport_event:{70000000 + i}",
+            "start_time": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", day),
+            "round": str(i // 10 + 1),
+            "home_team": home[1], "home_team_id": home[0],
+            "away_team": away[1], "away_team_id": away[0],
+            "status": "closed", "match_status": "ended",
+            "home_score": str(min(rng.randint(0, 6), rng.randint(0, 6))),
+            "away_score": str(min(rng.randint(0, 5), rng.randint(0, 5))),
+        }))
+    return entries
+
+
+def synthetic_timeline(entry: dict, seed: int) -> dict:
+    """A plausible timeline whose score_change events add up to the entry's final score."""
+    se = entry["sport_event"]
+    ses = entry.get("sport_event_status", {})
+    rng = random.Random(f"{seed}:{se['id']}")
+    players = {
+        q: [{"id": f"sr:player:{rng.randint(100000, 999999)}", "name": f"Player{j}, {q.title()}"} for j in range(11)]
+        for q in ("home", "away")
+    }
+    events = []
+    for _ in range(rng.randint(140, 260)):
+        side = rng.choice(("home", "away"))
+        minute = rng.randint(1, 90)
+        ev = {
+            "type": rng.choice(FILLER_TYPES),
+            "match_time": minute,
+            "competitor": side,
+            "x": rng.randint(0, 100),
+            "y": rng.randint(0, 100),
+        }
+        if rng.random() < 0.5:
+            ev["players"] = [dict(rng.choice(players[side]), type="player")]
+        if rng.random() < 0.6:
+            ev["commentaries"] = [{"text": f"{ev['type'].replace('_', ' ').capitalize()} for the {side} side."}]
+        events.append(ev)
+    goals = ["home"] * int(ses.get("home_score", 0) or 0) + ["away"] * int(ses.get("away_score", 0) or 0)
+    for side in goals:
+        ev = {"type": "score_change", "match_time": rng.randint(1, 90), "competitor": side}
+        roll = rng.random()
+        if roll < 0.05:
+            ev["method"] = "own_goal"
+            scorer = rng.choice(players["away" if side == "home" else "home"])
+        else:
+            if roll < 0.15:
+                ev["method"] = "penalty"
+            scorer = rng.choice(players[side])
+        ev["players"] = [dict(scorer, type="scorer")]
+        ev["commentaries"] = [{"text": f"Goal! {scorer['name']} scores for the {side} team."}]
+        events.append(ev)
+    events.sort(key=lambda e: e["match_time"])
+    home = away = 0
+    for i, ev in enumerate(events):
+        ev["id"] = 1_000_000_000 + i
+        ev["period"] = 1 if ev["match_time"] <= 45 else 2
+        if ev["match_time"] in (45, 90) and rng.random() < 0.5:
+            ev["stoppage_time"] = rng.randint(1, 6)
+        if ev["type"] == "score_change":
+            home += ev["competitor"] == "home"
+            away += ev["competitor"] == "away"
+            ev["home_score"], ev["away_score"] = home, away
+    return {"sport_event": se, "sport_event_status": ses, "timeline": events}
+
+
+def recorded_timelines(fixtures: str | None):
+    """
+    The timelines to replay, or None if there are none. The local cache is only
+    read, never created or imported into: a test double must not touch it.
+    """
+    if fixtures:
+        return timeline_store.DirStore(os.path.join(fixtures, "timelines"))
+    if TIMELINE_STORE == "sqlite" and os.path.exists(TIMELINES_DB):
+        return timeline_store.SqliteStore(TIMELINES_DB, read_only=True)
+    if os.path.isdir(TIMELINES_DIR):
+        return timeline_store.DirStore(TIMELINES_DIR)
+    return None
+
+
+class MockData:
+    """Schedule entries plus timeline lookup (recorded file first, synthetic otherwise)."""
+
+    def __init__(self, options: ServerOptions):
+        self.options = options
+        self.store = recorded_timelines(options.fixtures)
+        schedule_json = os.path.join(options.fixtures, "schedule.json") if options.fixtures else ""
+        if schedule_json and os.path.exists(schedule_json):
+            with open(schedule_json, encoding="utf-8") as f:
+                self.schedules = json.load(f)["schedules"]
+        elif os.path.exists(SCHEDULE_CSV):
+            with open(SCHEDULE_CSV, newline="", encoding="utf-8") as f:
+                self.schedules = [_schedule_entry(r) for r in csv.DictReader(f)]
+        else:
+            self.schedules = synthetic_schedule(options.synthetic_matches, random.Random(options.seed))
+        if options.max_matches:
+            self.schedules = self.schedules[:options.max_matches]
+        self.by_id = {s["sport_event"]["id"]: s for s in self.schedules}
+
+    def timeline(self, sport_event_id: str) -> dict | None:
+        recorded = self.store.get(sport_event_id) if self.store is not None else None
+        if recorded is not None:
+            return recorded
+        entry = self.by_id.get(sport_event_id)
+        return synthetic_timeline(entry, self.options.seed) if entry else None
+
+    def daily(self, date: str) -> list[dict]:
+        return [s for s in self.schedules if s["sport_event"].get("start_time", "")[:10] == date]
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options: ServerOptions):
+        super().__init__(address, MockHandler)
+        self.options = options
+        self.data = MockData(options)
+        self.limiter = TokenBucket(1 / options.rps) if options.rps > 0 else None
+        self.rng = random.Random(options.seed)
+        self.lock = threading.Lock()
+        self.counts: dict[int, int] = {}
+        self.requests = 0
+        self._bodies: dict[str, tuple[bytes, bytes, str]] = {}
+
+    def body_for(self, path: str, payload_fn) -> tuple[bytes, bytes, str] | None:
+        """Return (raw, gzipped, etag) for a path, memoised; None if payload_fn finds nothing."""
+        with self.lock:
+            cached = self._bodies.get(path)
+        if cached:
+            return cached
+        payload = payload_fn()
+        if payload is None:
+            return None
+        raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        result = (raw, gzip.compress(raw, 6), f'"{hashlib.sha1(raw).hexdigest()}"')
+        with self.lock:
+            self._bodies[path] = result
+        return result
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    server: MockServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code: int, body: bytes = b"", headers: dict | None = None) -> None:
+        with self.server.lock:
+            self.server.counts[code] = self.server.counts.get(code, 0) + 1
+            used = self.server.requests
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if self.server.options.quota:
+            self.send_header("X-Plan-Quota-Allotted", str(self.server.options.quota))
+            self.send_header("X-Plan-Quota-Current", str(used))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _error(self, code: int, message: str, headers: dict | None = None) -> None:
+        self._send(code, json.dumps({"message": message}).encode(), headers)
+
+    def do_GET(self):
+        opts = self.server.options
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        with self.server.lock:
+            self.server.requests += 1
+            over_quota = opts.quota and self.server.requests > opts.quota
+            roll = self.server.rng.random()
+        if opts.latency_ms or opts.jitter_ms:
+            time.sleep(max(0.0, opts.latency_ms + random.uniform(-opts.jitter_ms, opts.jitter_ms)) / 1000)
+
+        if "api_key" not in query:
+            return self._error(401, "Missing api_key")
+        if over_quota:
+            return self._error(403, "Developer Over Rate")
+        if self.server.limiter and not self.server.limiter.try_acquire():
+            retry_after = math.ceil(self.server.limiter.interval)
+            return self._error(429, "Developer Over Qps", {"Retry-After": str(retry_after)})
+        if roll < opts.throttle_rate:
+            return self._error(429, "Too Many Requests", {"Retry-After": "1"})
+        if roll < opts.throttle_rate + opts.error_rate:
+            return self._error(self.server.rng.choice((500, 502, 503, 504)), "Injected server error")
+
+        path = parts.path[len(PREFIX):] if parts.path.startswith(PREFIX) else None
+        found = None
+        if path is not None:
+            if m := re.fullmatch(r"/seasons/([^/]+)/schedules\.json", path):
+                season = m.group(1)
+                found = self.server.body_for(path, lambda: {"schedules": self.server.data.schedules}
+                                             if season == SEASON_ID else None)
+            elif m := re.fullmatch(r"/sport_events/([^/]+)/timeline\.json", path):
+                found = self.server.body_for(path, lambda: self.server.data.timeline(m.group(1)))
+            elif m := re.fullmatch(r"/schedules/(\d{4}-\d{2}-\d{2})/schedules\.json", path):
+                start = int(query.get("start", ["0"])[0])
+                limit = int(query.get("limit", ["200"])[0])
+                day = self.server.data.daily(m.group(1))
+                found = self.server.body_for(f"{path}?{start}:{limit}",
+                                             lambda: {"schedules": day[start:start + limit]})
+        if found is None:
+            return self._error(404, "Not found")
+
+        raw, gzipped, etag = found
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, headers={"ETag": etag})
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            return self._send(200, gzipped, {"ETag": etag, "Content-Encoding": "gzip"})
+        return self._send(200, raw, {"ETag": etag})
+
+
+def start_server(options: ServerOptions, host: str = "127.0.0.1", port: int = 0) -> tuple[MockServer, str]:
+    """Start the server on a background thread; return (server, base_url). port=0 picks a free port."""
+    server = MockServer((host, port), options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}{PREFIX}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Sportradar Soccer v4 stand-in server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="added latency per request (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="± random latency (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 5xx")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--rps", type=float, default=0.0, help="enforced requests/second (0 = unlimited)")
+    parser.add_argument("--quota", type=int, default=0, help="requests allowed before 403 quota errors")
+    parser.add_argument("--fixtures", help="dir with schedule.json and timelines/*.json to replay")
+    parser.add_argument("--matches", type=int, default=380, help="synthetic season size if no schedule exists")
+    parser.add_argument("--limit", type=int, default=0, help="serve only the first N schedule entries")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    options = ServerOptions(
+        latency_ms=args.latency, jitter_ms=args.jitter, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, rps=args.rps, quota=args.quota,
+        fixtures=args.fixtures, synthetic_matches=args.matches, max_matches=args.limit, seed=args.seed,
+    )
+    server = MockServer((args.host, args.port), options)
+    print(f"Serving {len(server.data.schedules)} sport events")
+    print(f"  SPORTRADAR_BASE_URL=http://{args.host}:{args.port}{PREFIX}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"\nRequests: {server.requests}  by status: {dict(sorted(server.counts.items()))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+OwnGoal — the one record type own goals travel in, from step 4 to the report.
+
+Minute, stoppage time and scores are parsed to ints once, when the record is
+built (from a timeline event or a CSV / Supabase row), and the sort key,
+minute label and "First Last" display name are computed at the same time.
+Consumers (step 4, db.get_all_own_goals, generate_report, build_email_summary)
+read attributes instead of re-parsing strings. __slots__ keeps each record
+small when seasons add up to thousands of rows.
+
+  - OwnGoal.from_row(row) — from a dict with the CSV columns (strings or ints)
+  - og.as_row() — back to a CSV dict; from_row(...).as_row() round-trips the CSV
+  - load_csv() — data/own_goals.csv as OwnGoal records
+  - is_own_goal(ev) — whether a raw timeline event is an own goal
+"""
+
+from __future__ import annotations
+
+import csv
+import os
+
+FIELDS = [
+    "sport_event_id",
+    "match_date",
+    "round",
+    "home_team",
+    "away_team",
+    "og_player",
+    "og_player_id",
+    "og_player_team",
+    "benefiting_team",
+    "minute",
+    "stoppage_time",
+    "home_score_after",
+    "away_score_after",
+    "final_home_score",
+    "final_away_score",
+    "commentary",
+]
+INT_FIELDS = ("minute", "stoppage_time", "home_score_after", "away_score_after", "final_home_score", "final_away_score")
+
+
+def is_own_goal(ev: dict) -> bool:
+    return ev.get("type") == "score_change" and ev.get("method") == "own_goal"
+
+
+def _int(value) -> int | None:
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def display_name(raw: str) -> str:
+    """Sportradar's "Last, First" → "First Last"."""
+    if ", " in raw:
+        last, first = raw.split(", ", 1)
+        return f"{first} {last}"
+    return raw
+
+
+def format_minute(minute: int | None, stoppage: int | None) -> str:
+    if minute is None:
+        return "—"
+    if stoppage is not None:
+        return f"{minute}+{stoppage}'"
+    return f"{minute}'"
+
+
+class OwnGoal:
+    """One own goal. Int fields are None when the feed left them out."""
+
+    __slots__ = (*FIELDS, "sort_key", "display_name", "minute_display", "mentions_own_goal")
+
+    def __init__(self, sport_event_id: str, match_date: str, round: str, home_team: str, away_team: str,
+                 og_player: str, og_player_id: str, og_player_team: str, benefiting_team: str,
+                 minute: int | None, stoppage_time: int | None,
+                 home_score_after: int | None, away_score_after: int | None,
+                 final_home_score: int | None, final_away_score: int | None, commentary: str):
+        self.sport_event_id = sport_event_id
+        self.match_date = match_date
+        self.round = round
+        self.home_team = home_team
+        self.away_team = away_team
+        self.og_player = og_player
+        self.og_player_id = og_player_id
+        self.og_player_team = og_player_team
+        self.benefiting_team = benefiting_team
+        self.minute = minute
+        self.stoppage_time = stoppage_time
+        self.home_score_after = home_score_after
+        self.away_score_after = away_score_after
+        self.final_home_score = final_home_score
+        self.final_away_score = final_away_score
+        self.commentary = commentary
+        self.sort_key = (match_date, minute or 0)
+        self.display_name = display_name(og_player)
+        self.minute_display = format_minute(minute, stoppage_time)
+        self.mentions_own_goal = "own goal" in commentary.lower()
+
+    @classmethod
+    def from_row(cls, row: dict) -> OwnGoal:
+        values = {}
+        for field in FIELDS:
+            value = row.get(field)
+            values[field] = _int(value) if field in INT_FIELDS else ("" if value is None else str(value))
+        return cls(**values)
+
+    def as_row(self) -> dict:
+        return {field: "" if getattr(self, field) is None else getattr(self, field) for field in FIELDS}
+
+    @property
+    def identity(self) -> tuple:
+        """What makes two records the same own goal across report snapshots."""
+        return (
+            self.sport_event_id,
+            self.og_player_id,
+            self.minute,
+            self.stoppage_time,
+            self.home_score_after,
+            self.away_score_after,
+        )
+
+    def __repr__(self) -> str:
+        return f"OwnGoal({self.match_date} {self.minute_display} {self.og_player!r}, {self.sport_event_id})"
+
+
+def load_csv(path: str) -> list[OwnGoal]:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return [OwnGoal.from_row(row) for row in csv.DictReader(f)]
+
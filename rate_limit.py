@@ -0,0 +1,119 @@
+"""
+Thread-safe token bucket used to pace Sportradar API requests.
+
+The bucket controls when requests *start*, not when they finish, so the
+response download and the disk/Supabase write of one match can overlap with
+the next request without ever exceeding the trial key's 1 req/sec limit.
+
+The interval adapts: `slow_down()` doubles it (and can pause every caller for
+a server-supplied Retry-After), `speed_up()` eases it back towards the
+configured base rate after each successful request.
+
+RequestBudget caps a run by wall-clock deadline and/or number of requests so a
+scheduled run stops cleanly instead of running until it is killed.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Hand out one token every `interval` seconds (no limit if <= 0), allowing at most `capacity` in a burst."""
+
+    def __init__(self, interval: float, capacity: int = 1, max_interval: float | None = None):
+        self.base_interval = interval
+        self.max_interval = max_interval if max_interval is not None else interval * 8
+        self.interval = interval
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        # While the current back-off window lasts, further slow_down() calls don't compound
+        self._backoff_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        # _last is in the future while a slow_down() pause lasts: nothing accrues until then
+        elapsed = now - self._last
+        if elapsed > 0:
+            # interval <= 0 (e.g. SPORTRADAR_REQUEST_DELAY=0 against the mock) means unlimited
+            refill = elapsed / self.interval if self.interval > 0 else self.capacity
+            self._tokens = min(self.capacity, self._tokens + refill)
+            self._last = now
+
+    def acquire(self) -> None:
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max((1 - self._tokens) * self.interval, self._last - now)
+            time.sleep(wait)
+
+    def try_acquire(self) -> bool:
+        """Consume a token if one is available right now; never blocks."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def slow_down(self, pause: float = 0.0) -> None:
+        """
+        Back off after the API pushed back: double the interval and hold all tokens for
+        `pause` seconds. Workers hit by the same burst of 429s all call this; within one
+        back-off window the interval doubles once and overlapping pauses don't add up.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self._backoff_until:
+                self.interval = min(self.max_interval, self.interval * 2)
+            if pause > 0:
+                self._tokens = min(self._tokens, 0.0)
+                self._last = max(self._last, now + pause)
+            self._backoff_until = max(self._backoff_until, now + max(pause, self.interval))
+
+    def speed_up(self) -> None:
+        """Ease the interval back towards the base rate after a successful request."""
+        with self._lock:
+            if self.interval > self.base_interval:
+                self._refill(time.monotonic())
+                self.interval = max(self.base_interval, self.interval / 1.25)
+
+
+class BudgetExhausted(RuntimeError):
+    """The run's time or request budget is used up."""
+
+
+class RequestBudget:
+    """Thread-safe time + request allowance for one run; None means unlimited."""
+
+    def __init__(self, deadline_seconds: float | None = None, max_requests: int | None = None):
+        self._deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+        self.max_requests = max_requests
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def take(self) -> None:
+        """Claim one request; raise BudgetExhausted if the deadline passed or no requests remain."""
+        with self._lock:
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                raise BudgetExhausted("time budget used up")
+            if self.max_requests is not None and self.used >= self.max_requests:
+                raise BudgetExhausted(f"request budget of {self.max_requests} used up")
+            self.used += 1
+
+
+def parse_duration(value: str) -> float:
+    """Parse '90', '90s', '10m' or '1.5h' into seconds."""
+    value = value.strip().lower()
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
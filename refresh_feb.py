@@ -1,84 +1,55 @@
-"""Deletes cached timeline files for all completed matches from 2026-02-01 onwards,
-then re-fetches them fresh from the Sportradar API."""
+"""Refresh timelines whose schedule entry changed, then re-extract own goals and rebuild the report.
 
-import csv
-import os
-import json
-import time
-import urllib.request
-import urllib.error
-
-from config import API_KEY, BASE_URL, SCHEDULE_CSV, TIMELINES_DIR, REQUEST_DELAY_SECONDS
+Step 2 compares the new schedule with the one it replaces and marks changed
+matches stale; step 3 refetches exactly those (the old cached file is only
+replaced once the new timeline has been downloaded).
 
-REFRESH_FROM = "2026-02-01"
+Usage:
+  python refresh_feb.py                    # refetch whatever the schedule diff marked stale
+  python refresh_feb.py --from 2026-02-01  # also force-refresh completed matches from this date
+"""
 
+import argparse
+import csv
 
-def cache_path(sport_event_id: str) -> str:
-    safe_id = sport_event_id.replace(":", "_")
-    return os.path.join(TIMELINES_DIR, f"{safe_id}.json")
+import cache_state
+from config import SCHEDULE_CSV, COMPLETED_STATUSES
 
 
-def main():
+def mark_from_date(refresh_from: str) -> int:
+    """Mark every completed match on or after refresh_from (YYYY-MM-DD) stale; return how many."""
     with open(SCHEDULE_CSV, newline="", encoding="utf-8") as f:
         rows = list(csv.DictReader(f))
-
     targets = [
-        r for r in rows
-        if r["start_time"] >= REFRESH_FROM and r["status"] in ("closed", "ended")
+        r["sport_event_id"] for r in rows
+        if r["start_time"] >= refresh_from and r["status"] in COMPLETED_STATUSES
     ]
-    print(f"Completed matches from {REFRESH_FROM} onwards: {len(targets)}")
-
-    # Delete stale cache files
-    deleted = 0
-    for r in targets:
-        path = cache_path(r["sport_event_id"])
-        if os.path.exists(path):
-            os.remove(path)
-            deleted += 1
-    print(f"Deleted {deleted} stale cache files\n")
+    cache_state.mark_stale(targets)
+    return len(targets)
 
-    # Re-fetch
-    fetched = 0
-    errors = 0
-    for i, r in enumerate(targets, 1):
-        event_id = r["sport_event_id"]
-        date = r["start_time"][:10]
-        home = r["home_team"]
-        away = r["away_team"]
-        print(f"[{i}/{len(targets)}] {date}  {home} vs {away}")
-        url = f"{BASE_URL}/sport_events/{event_id}/timeline.json?api_key={API_KEY}"
-        try:
-            req = urllib.request.Request(url, headers={"Accept": "application/json"})
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                data = json.loads(resp.read().decode())
-            with open(cache_path(event_id), "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False)
-            fetched += 1
-        except urllib.error.HTTPError as e:
-            print(f"  HTTP {e.code} - skipping")
-            errors += 1
-        except Exception as e:
-            print(f"  Error: {e} - skipping")
-            errors += 1
-        time.sleep(REQUEST_DELAY_SECONDS)
-
-    print(f"\nDone.  Fetched: {fetched}  Errors: {errors}")
-    print("\nNow re-extracting own goals and regenerating report...")
 
+def main(refresh_from: str | None = None):
+    import step2_get_schedule
+    import step3_fetch_timelines
     import step4_extract_own_goals
     import generate_report
 
-    step4_extract_own_goals.main()
+    step2_get_schedule.main()
+    if refresh_from:
+        n = mark_from_date(refresh_from)
+        print(f"Completed matches from {refresh_from} onwards marked for refresh: {n}")
+
+    print()
+    step3_fetch_timelines.main()
 
-    rows_og = generate_report.load_own_goals(generate_report.OWN_GOALS_CSV)
-    rows_og.sort(key=lambda r: (r["match_date"], int(r["minute"]) if str(r["minute"]).isdigit() else 0))
-    completed = generate_report.count_completed_matches()
-    events = generate_report.count_timeline_events()
-    html = generate_report.generate_html(rows_og, completed, events)
-    with open(generate_report.REPORT_HTML, "w", encoding="utf-8") as f:
-        f.write(html)
-    print(f"Report updated: {generate_report.REPORT_HTML}")
+    print("\nNow re-extracting own goals and regenerating report...")
+    step4_extract_own_goals.main()
+    generate_report.main()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from", dest="refresh_from", metavar="YYYY-MM-DD",
+                        help="force-refresh completed matches on or after this date")
+    args = parser.parse_args()
+    main(args.refresh_from)
@@ -0,0 +1,169 @@
+"""
+Retry layer for Sportradar API calls.
+
+  - call_with_retry() — run a request, retrying 429/5xx/network errors with
+    exponential backoff + jitter, honouring Retry-After and slowing the shared
+    TokenBucket down when the API pushes back
+  - RetryStats — per-run tally of retried requests and how each one ended:
+    recovered, abandoned (failed for good) or deferred (left for the next run
+    because the run stopped first)
+  - QuotaExhausted — raised when the plan quota headers say we are out of calls;
+    retrying would only burn time, so callers should stop the run
+  - log() — print() for progress lines from worker threads; plain print()
+    calls from several threads can interleave within a line
+
+Callers that process many requests (step 3, refresh_feb) re-queue anything
+that still fails into a deferred pass at the end of the run.
+"""
+
+from __future__ import annotations
+
+import http.client
+import random
+import threading
+import time
+import urllib.error
+from email.utils import parsedate_to_datetime
+
+from config import RETRY_ATTEMPTS, RETRY_BASE_DELAY_SECONDS, RETRY_MAX_DELAY_SECONDS
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+_print_lock = threading.Lock()
+
+
+def log(line: str) -> None:
+    """Print one whole line, even when other threads are printing too."""
+    with _print_lock:
+        print(line)
+
+
+class QuotaExhausted(RuntimeError):
+    """The API key's plan quota is used up; no point retrying this run."""
+
+
+class RetryStats:
+    """
+    Thread-safe record of which requests were retried and how each retried one
+    ended, so that retried = recovered + abandoned + deferred. Outcomes of
+    requests that were never retried are not recorded.
+    """
+
+    def __init__(self):
+        self.retried: set[str] = set()
+        self.recovered: set[str] = set()
+        self.abandoned: set[str] = set()
+        self.deferred: set[str] = set()
+        self._lock = threading.Lock()
+
+    def mark_retried(self, key: str) -> None:
+        with self._lock:
+            self.retried.add(key)
+
+    def _settle(self, key: str, outcome: set[str]) -> None:
+        with self._lock:
+            if key in self.retried:
+                for s in (self.recovered, self.abandoned, self.deferred):
+                    s.discard(key)
+                outcome.add(key)
+
+    def mark_recovered(self, key: str) -> None:
+        self._settle(key, self.recovered)
+
+    def mark_abandoned(self, key: str) -> None:
+        """The request failed for good this run (retries used up, non-retryable error, quota gone)."""
+        self._settle(key, self.abandoned)
+
+    def mark_deferred(self, key: str) -> None:
+        """The run stopped (time / request budget, or quota) before the request could finish; left for the next run."""
+        self._settle(key, self.deferred)
+
+    def print_summary(self) -> None:
+        print(f"  Retried       : {len(self.retried)}")
+        print(f"  Recovered     : {len(self.recovered)}")
+        print(f"  Abandoned     : {len(self.abandoned)}")
+        print(f"  Deferred      : {len(self.deferred)}")
+
+
+def retry_after_seconds(headers) -> float | None:
+    """Parse a Retry-After header (delta-seconds or HTTP-date); None if absent or unparseable."""
+    if headers is None:
+        return None
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def quota_exhausted(headers) -> bool:
+    """True if Sportradar's X-Plan-Quota-* headers show the plan allowance is used up."""
+    if headers is None:
+        return False
+    allotted = headers.get("X-Plan-Quota-Allotted")
+    current = headers.get("X-Plan-Quota-Current")
+    try:
+        return allotted is not None and current is not None and int(current) >= int(allotted)
+    except ValueError:
+        return False
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with equal jitter for the given (1-based) failed attempt."""
+    delay = min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, urllib.error.HTTPError):
+        return exc.code in RETRYABLE_STATUSES
+    return isinstance(exc, (urllib.error.URLError, http.client.HTTPException, TimeoutError, ConnectionError))
+
+
+def call_with_retry(fn, key: str, limiter=None, stats: RetryStats | None = None,
+                    attempts: int = RETRY_ATTEMPTS, label: str = "", budget=None):
+    """
+    Call fn() until it succeeds or `attempts` run out, then re-raise the last error.
+
+    When a limiter is given, a token is acquired before every attempt so retries
+    respect the same rate limit as first tries; a RequestBudget is charged for
+    every attempt too (raising BudgetExhausted when spent). `label` is printed
+    once, when the first attempt starts.
+    """
+    for attempt in range(1, attempts + 1):
+        if limiter is not None:
+            limiter.acquire()
+        if budget is not None:
+            budget.take()
+        if label and attempt == 1:
+            log(label)
+        try:
+            result = fn()
+        except Exception as e:
+            headers = getattr(e, "headers", None)
+            if isinstance(e, urllib.error.HTTPError) and e.code in (403, 429) and quota_exhausted(headers):
+                raise QuotaExhausted(f"Sportradar plan quota exhausted (HTTP {e.code})") from e
+            if not is_retryable(e) or attempt == attempts:
+                raise
+            server_wait = retry_after_seconds(headers)
+            delay = server_wait if server_wait is not None else backoff_delay(attempt)
+            if stats is not None:
+                stats.mark_retried(key)
+            if limiter is not None:
+                limiter.slow_down(pause=delay)
+            reason = f"HTTP {e.code}" if isinstance(e, urllib.error.HTTPError) else str(e)
+            log(f"  {reason} for {key} — retry {attempt}/{attempts - 1} in {delay:.1f}s")
+            if limiter is None:
+                time.sleep(delay)
+            continue
+        if limiter is not None:
+            limiter.speed_up()
+        if stats is not None and key in stats.retried:
+            stats.mark_recovered(key)
+        return result
@@ -6,12 +6,17 @@ Master runner — executes all steps in order:
   Step 5: Generate report → report.html
 
 Safe to re-run: timelines are cached, so only new/missing ones are fetched.
+--deadline / --max-requests cap step 3; it fetches the newest matches first,
+so a capped run still picks up the latest gameweek.
 """
 
+import argparse
+
 import step2_get_schedule
 import step3_fetch_timelines
 import step4_extract_own_goals
 import generate_report
+from rate_limit import parse_duration
 
 DIVIDER = "-" * 60
 
@@ -21,11 +26,18 @@ def section(title: str):
     print(DIVIDER)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the full EPL own goals pipeline.")
+    parser.add_argument("--deadline", type=parse_duration,
+                        help="time budget for step 3, e.g. 10m")
+    parser.add_argument("--max-requests", type=int,
+                        help="API request budget for step 3")
+    args = parser.parse_args()
+
     section("STEP 2 — Fetching schedule")
     step2_get_schedule.main()
 
     section("STEP 3 — Fetching timelines (cached)")
-    step3_fetch_timelines.main()
+    step3_fetch_timelines.main(deadline_seconds=args.deadline, max_requests=args.max_requests)
 
     section("STEP 4 — Extracting own goals")
     step4_extract_own_goals.main()
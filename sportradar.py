@@ -0,0 +1,184 @@
+"""
+Shared Sportradar Soccer v4 API client.
+
+Keeps a small pool of keep-alive HTTP(S) connections so consecutive requests
+skip the TCP+TLS handshake, and asks for gzip-compressed responses (timeline
+JSON compresses very well). Provides:
+  - get_client() — process-wide SportradarClient
+  - SportradarClient.get_schedule() — season schedule entries
+  - SportradarClient.get_timeline() — one sport_event timeline
+  - SportradarClient.get_daily_schedule() — one page of a day's schedule (all competitions)
+  - *_if_changed() variants — conditional GETs driven by stored validators
+    (ETag / Last-Modified / body hash); they return None when unchanged
+
+Responses other than 200/304 raise urllib.error.HTTPError (with the response headers),
+so retry.call_with_retry() handles them the same way as plain urllib calls.
+Retrying and rate limiting stay with the caller.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import http.client
+import json
+import queue
+import urllib.error
+from urllib.parse import urlencode, urlsplit
+
+from config import API_KEY, BASE_URL, SEASON_ID, FETCH_WORKERS
+
+# Errors that mean a pooled keep-alive connection was closed by the server
+# between requests; the request is replayed once on a fresh connection.
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+_client = None
+
+
+def schedule_path(season_id: str) -> str:
+    return f"/seasons/{season_id}/schedules.json"
+
+
+def daily_schedule_path(date: str) -> str:
+    return f"/schedules/{date}/schedules.json"
+
+
+def timeline_path(sport_event_id: str) -> str:
+    return f"/sport_events/{sport_event_id}/timeline.json"
+
+
+class SportradarClient:
+    """Pooled keep-alive client for the Sportradar Soccer API."""
+
+    def __init__(self, base_url: str = BASE_URL, api_key: str = API_KEY,
+                 pool_size: int = FETCH_WORKERS, timeout: float = 30):
+        parts = urlsplit(base_url)
+        self._https = parts.scheme == "https"
+        self._host = parts.hostname
+        self._port = parts.port
+        self._prefix = parts.path.rstrip("/")
+        self._api_key = api_key
+        self._timeout = timeout
+        self._pool: queue.LifoQueue = queue.LifoQueue(maxsize=max(1, pool_size))
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+        return cls(self._host, self._port, timeout=self._timeout)
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _request(self, conn: http.client.HTTPConnection, target: str, extra_headers: dict):
+        conn.request("GET", target, headers={
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip",
+            "Connection": "keep-alive",
+            **extra_headers,
+        })
+        resp = conn.getresponse()
+        return resp, resp.read()
+
+    def _get(self, path: str, params: dict | None, extra_headers: dict):
+        """Send one GET and return (response, decompressed body); raises HTTPError on non-200/304."""
+        query = urlencode({**(params or {}), "api_key": self._api_key})
+        target = f"{self._prefix}{path}?{query}"
+        try:
+            conn, reused = self._pool.get_nowait(), True
+        except queue.Empty:
+            conn, reused = self._new_connection(), False
+        try:
+            try:
+                resp, body = self._request(conn, target, extra_headers)
+            except _STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                conn.close()
+                conn = self._new_connection()
+                resp, body = self._request(conn, target, extra_headers)
+        except Exception:
+            conn.close()
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+        if resp.status not in (200, 304):
+            raise urllib.error.HTTPError(f"{self._prefix}{path}", resp.status, resp.reason, resp.headers, None)
+        if resp.getheader("Content-Encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return resp, body
+
+    def get_json(self, path: str, params: dict | None = None) -> dict:
+        """GET {BASE_URL}{path} and return the decoded JSON body."""
+        _, body = self._get(path, params, {})
+        return json.loads(body.decode("utf-8"))
+
+    def get_json_if_changed(self, path: str, validators: dict | None) -> tuple[dict | None, dict]:
+        """
+        Conditional GET of {BASE_URL}{path}; return (data, new validators).
+
+        data is None when the server answers 304, or when it returns a body whose
+        sha256 matches the stored one — either way there is nothing to parse.
+        """
+        validators = validators or {}
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        resp, body = self._get(path, None, headers)
+        if resp.status == 304:
+            return None, validators
+        new_validators = {
+            "etag": resp.getheader("ETag", ""),
+            "last_modified": resp.getheader("Last-Modified", ""),
+            "sha256": hashlib.sha256(body).hexdigest(),
+        }
+        if new_validators["sha256"] == validators.get("sha256"):
+            return None, new_validators
+        return json.loads(body.decode("utf-8")), new_validators
+
+    def get_schedule(self, season_id: str = SEASON_ID) -> list[dict]:
+        """Return the season's schedule entries (sport_event + sport_event_status)."""
+        data = self.get_json(schedule_path(season_id))
+        return data.get("schedules", [])
+
+    def get_timeline(self, sport_event_id: str) -> dict:
+        """Return the full timeline response for one sport event."""
+        return self.get_json(timeline_path(sport_event_id))
+
+    def get_daily_schedule(self, date: str, start: int = 0, limit: int = 200) -> list[dict]:
+        """Return one page of schedule entries for a date (YYYY-MM-DD), across all competitions."""
+        data = self.get_json(daily_schedule_path(date), {"start": start, "limit": limit})
+        return data.get("schedules", [])
+
+    def get_schedule_if_changed(self, season_id: str = SEASON_ID,
+                                validators: dict | None = None) -> tuple[list[dict] | None, dict]:
+        """Like get_schedule(), but returns (None, validators) when the schedule is unchanged."""
+        data, validators = self.get_json_if_changed(schedule_path(season_id), validators)
+        return (None if data is None else data.get("schedules", [])), validators
+
+    def get_timeline_if_changed(self, sport_event_id: str,
+                                validators: dict | None = None) -> tuple[dict | None, dict]:
+        """Like get_timeline(), but returns (None, validators) when the timeline is unchanged."""
+        return self.get_json_if_changed(timeline_path(sport_event_id), validators)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def get_client() -> SportradarClient:
+    """Return the shared client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = SportradarClient()
+    return _client
@@ -5,17 +5,39 @@ Columns saved:
   sport_event_id, start_time, round, home_team, home_team_id,
   away_team, away_team_id, status, match_status, home_score, away_score
 
+Completed matches whose status, match_status or score differ from the
+schedule.csv being replaced are marked stale so step 3 refetches exactly
+those timelines. A match that has only just completed is not stale: it has
+no timeline yet, and step 3 fetches it as new.
+
+The fetch is a conditional GET (ETag / Last-Modified / body hash kept in
+data/http_validators.json): an unchanged schedule costs one 304 and no parsing.
+
+--window N fetches only the per-date schedules from N days ago to --ahead days
+from now, merges them into the existing schedule.csv and upserts only the rows
+that changed. In-season weekly runs only need the last week of fixtures.
+
 Run independently to refresh the schedule without touching timeline data.
 """
 
+import argparse
 import csv
-import json
 import os
-import time
-import urllib.request
-import urllib.error
-
-from config import API_KEY, BASE_URL, SEASON_ID, SCHEDULE_CSV, REQUEST_DELAY_SECONDS, USE_SUPABASE
+from datetime import date, timedelta
+
+import cache_state
+import sportradar
+from config import (
+    BASE_URL,
+    SEASON_ID,
+    SCHEDULE_CSV,
+    COMPLETED_STATUSES,
+    REQUEST_DELAY_SECONDS,
+    DAILY_SCHEDULE_PAGE_SIZE,
+    USE_SUPABASE,
+)
+from rate_limit import TokenBucket
+from retry import RetryStats, call_with_retry
 
 CSV_FIELDS = [
     "sport_event_id",
@@ -31,19 +53,87 @@ CSV_FIELDS = [
     "away_score",
 ]
 
-
-def fetch_schedule() -> list[dict]:
-    """Fetch the full season schedule from Sportradar."""
-    url = f"{BASE_URL}/seasons/{SEASON_ID}/schedules.json?api_key={API_KEY}"
-    print(f"Fetching schedule from: {url.split('?')[0]}")
-    req = urllib.request.Request(url, headers={"Accept": "application/json"})
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        data = json.loads(resp.read().decode())
-    schedules = data.get("schedules", [])
+# A change in any of these means a cached timeline may be out of date
+DIFF_FIELDS = ["status", "match_status", "home_score", "away_score"]
+
+
+def fetch_schedule(validators: cache_state.ValidatorStore | None = None) -> list[dict] | None:
+    """
+    Fetch the full season schedule from Sportradar.
+
+    With a validator store the request is conditional; None is returned when
+    the schedule has not changed since the last stored fetch.
+    """
+    print(f"Fetching schedule from: {BASE_URL}{sportradar.schedule_path(SEASON_ID)}")
+    client = sportradar.get_client()
+    stats = RetryStats()
+    if validators is None:
+        schedules = call_with_retry(lambda: client.get_schedule(SEASON_ID), SEASON_ID, stats=stats)
+    else:
+        key = sportradar.schedule_path(SEASON_ID)
+        schedules, new_validators = call_with_retry(
+            lambda: client.get_schedule_if_changed(SEASON_ID, validators.get(key)), SEASON_ID, stats=stats
+        )
+        validators.set(key, new_validators)  # saved by main() once the CSV is written
+    if stats.retried:
+        print("  -> Schedule recovered after retrying")
+    if schedules is None:
+        print("  -> Not modified since last fetch")
+        return None
     print(f"  -> {len(schedules)} sport events returned")
     return schedules
 
 
+def fetch_window(days_back: int, days_ahead: int = 1) -> list[dict]:
+    """Fetch this season's schedule entries for each date from today-days_back to today+days_ahead."""
+    client = sportradar.get_client()
+    limiter = TokenBucket(REQUEST_DELAY_SECONDS)
+    stats = RetryStats()
+    today = date.today()
+    schedules = []
+    for offset in range(-days_back, days_ahead + 1):
+        day = (today + timedelta(days=offset)).isoformat()
+        start = 0
+        while True:
+            page = call_with_retry(
+                lambda: client.get_daily_schedule(day, start, DAILY_SCHEDULE_PAGE_SIZE),
+                f"{day}@{start}", limiter=limiter, stats=stats,
+            )
+            schedules.extend(
+                item for item in page
+                if item.get("sport_event", {}).get("sport_event_context", {}).get("season", {}).get("id") == SEASON_ID
+            )
+            if len(page) < DAILY_SCHEDULE_PAGE_SIZE:
+                break
+            start += DAILY_SCHEDULE_PAGE_SIZE
+    print(f"  -> {len(schedules)} season events between {today + timedelta(days=-days_back)} "
+          f"and {today + timedelta(days=days_ahead)}")
+    return schedules
+
+
+def merge_rows(existing: list[dict], updates: list[dict]) -> tuple[list[dict], list[dict]]:
+    """
+    Merge updated rows into the existing schedule by sport_event_id.
+
+    Returns (merged rows, affected rows) where affected rows are new or differ
+    from the existing row in any CSV field. Existing order is kept; new matches
+    are appended.
+    """
+    index = {r["sport_event_id"]: i for i, r in enumerate(existing)}
+    merged = list(existing)
+    affected = []
+    for row in updates:
+        i = index.get(row["sport_event_id"])
+        if i is None:
+            index[row["sport_event_id"]] = len(merged)
+            merged.append(row)
+            affected.append(row)
+        elif any(str(merged[i].get(k, "")) != str(row.get(k, "")) for k in CSV_FIELDS):
+            merged[i] = row
+            affected.append(row)
+    return merged, affected
+
+
 def parse_schedule(schedules: list[dict]) -> list[dict]:
     """Flatten each schedule entry into a flat row dict."""
     rows = []
@@ -76,34 +166,87 @@ def parse_schedule(schedules: list[dict]) -> list[dict]:
     return rows
 
 
+def load_csv(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def changed_completed_matches(previous: list[dict], current: list[dict]) -> list[str]:
+    """
+    Return sport_event_ids of completed matches whose DIFF_FIELDS differ from
+    the previous schedule. Only matches that were already completed there are
+    included: a new or newly completed match has no cached timeline to
+    invalidate, and step 3 fetches it anyway.
+    """
+    before = {r["sport_event_id"]: r for r in previous}
+    changed = []
+    for row in current:
+        old = before.get(row["sport_event_id"])
+        if old is None or old["status"] not in COMPLETED_STATUSES or row["status"] not in COMPLETED_STATUSES:
+            continue
+        if any(str(old.get(k, "")) != str(row.get(k, "")) for k in DIFF_FIELDS):
+            changed.append(row["sport_event_id"])
+    return changed
+
+
 def save_csv(rows: list[dict], path: str) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", newline="", encoding="utf-8") as f:
+    with cache_state.atomic_write(path, newline="", encoding="utf-8") as f:
         writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
         writer.writeheader()
         writer.writerows(rows)
     print(f"  -> Saved {len(rows)} rows to {path}")
 
 
-def main():
-    schedules = fetch_schedule()
-    rows = parse_schedule(schedules)
-
-    if USE_SUPABASE:
+def main(window_days: int | None = None, days_ahead: int = 1):
+    previous = load_csv(SCHEDULE_CSV)
+    validators = None
+
+    if window_days is not None and previous:
+        print(f"Fetching schedule window: last {window_days} day(s) + next {days_ahead}")
+        rows, affected = merge_rows(previous, parse_schedule(fetch_window(window_days, days_ahead)))
+        print(f"  -> {len(affected)} new or changed rows")
+    else:
+        if window_days is not None:
+            print(f"{SCHEDULE_CSV} not found — fetching the full schedule instead of a window")
+        # Only revalidate when there is a local schedule to fall back on
+        validators = cache_state.ValidatorStore() if previous else None
+        schedules = fetch_schedule(validators)
+        if schedules is None:
+            print(f"\nSchedule unchanged — {SCHEDULE_CSV} and Supabase left as they are.")
+            return
+        rows = parse_schedule(schedules)
+        affected = rows
+
+    if USE_SUPABASE and affected:
         import db
         season_id = db.get_or_create_season()
-        db.upsert_schedule(season_id, rows)
-        print(f"  -> Upserted {len(rows)} rows to Supabase schedule table")
+        # A full fetch lists every match; send Supabase only the new or changed ones
+        upserted = db.upsert_schedule(season_id, affected, diff=affected is rows)
+        print(f"  -> Upserted {upserted} rows to Supabase schedule table")
 
     save_csv(rows, SCHEDULE_CSV)
+    if validators is not None:
+        validators.save()
+
+    changed = changed_completed_matches(previous, rows)
+    stale = cache_state.mark_stale(changed) if changed else cache_state.load_stale_ids()
 
-    closed = sum(1 for r in rows if r["status"] in {"closed", "ended"})
-    upcoming = sum(1 for r in rows if r["status"] not in {"closed", "ended"})
+    closed = sum(1 for r in rows if r["status"] in COMPLETED_STATUSES)
+    upcoming = sum(1 for r in rows if r["status"] not in COMPLETED_STATUSES)
     print(f"\nSummary:")
     print(f"  Total matches : {len(rows)}")
     print(f"  Completed     : {closed}")
     print(f"  Not yet played: {upcoming}")
+    print(f"  Changed since last run: {len(changed)}  (timelines to refetch: {len(stale)})")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Fetch the EPL schedule into schedule.csv (and Supabase).")
+    parser.add_argument("--window", type=int, metavar="DAYS",
+                        help="only refresh fixtures from DAYS days ago (merged into the existing schedule)")
+    parser.add_argument("--ahead", type=int, default=1, metavar="DAYS",
+                        help="with --window, also refresh this many days ahead (default 1)")
+    args = parser.parse_args()
+    main(args.window, args.ahead)
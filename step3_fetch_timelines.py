@@ -3,29 +3,49 @@ STEP 3 — Fetch sport_event_timeline for every completed match.
 
 • Reads match IDs from data/schedule.csv
 • Only fetches matches with status in COMPLETED_STATUSES
-• Caches raw JSON responses in data/timelines/<sport_event_id>.json
-  so re-runs skip already-fetched matches (safe to interrupt and resume)
-• Respects the 1 req/sec trial-key rate limit
+• Caches raw JSON responses in the timeline store (data/timelines.sqlite, or
+  data/timelines/<sport_event_id>.json with TIMELINE_STORE = "dir") so
+  re-runs skip already-fetched matches (safe to interrupt and resume: writes
+  are atomic and each stored timeline is journaled in data/fetch_journal.jsonl
+  until the run's bookkeeping is saved)
+• Refetches stored timelines that a later step could not decode
+  (data/unreadable_timelines.json)
+• Refetches matches step 2 marked stale (already completed, but status/score
+  changed since its previous run), and only those, with a conditional GET so an
+  unchanged timeline costs a 304 and no parsing or writing
+• Optionally (--prune-goalless) skips 0–0 matches, which cannot contain an
+  own goal; they are recorded so "Matches Reviewed" stays accurate and can
+  be fetched later with --fill-pruned when there is budget to spare
+• Respects the 1 req/sec trial-key rate limit with a token bucket that paces
+  request starts, while a small thread pool overlaps responses and writes
 
 Run independently to pull new timelines without touching earlier data.
 """
 
+import argparse
 import csv
-import json
 import os
-import time
-import urllib.request
 import urllib.error
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 
+import cache_state
+import sportradar
+import timeline_store
 from config import (
-    API_KEY,
-    BASE_URL,
     SCHEDULE_CSV,
     TIMELINES_DIR,
+    TIMELINES_DB,
+    TIMELINE_STORE,
     COMPLETED_STATUSES,
     REQUEST_DELAY_SECONDS,
+    FETCH_WORKERS,
+    FETCH_DEADLINE_SECONDS,
+    FETCH_MAX_REQUESTS,
+    PRUNE_GOALLESS,
     USE_SUPABASE,
 )
+from rate_limit import BudgetExhausted, RequestBudget, TokenBucket, parse_duration
+from retry import QuotaExhausted, RetryStats, call_with_retry, is_retryable, log
 
 
 def load_completed_matches(csv_path: str) -> list[dict]:
@@ -44,79 +64,284 @@ def load_completed_matches(csv_path: str) -> list[dict]:
 
 def fetch_timeline(sport_event_id: str) -> dict:
     """Fetch the timeline JSON for a single sport event."""
-    url = f"{BASE_URL}/sport_events/{sport_event_id}/timeline.json?api_key={API_KEY}"
-    req = urllib.request.Request(url, headers={"Accept": "application/json"})
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        return json.loads(resp.read().decode())
+    return sportradar.get_client().get_timeline(sport_event_id)
 
 
-def cache_path(sport_event_id: str) -> str:
-    safe_id = sport_event_id.replace(":", "_")
-    return os.path.join(TIMELINES_DIR, f"{safe_id}.json")
+def fetch_and_store(match: dict, label: str, limiter: TokenBucket, stats: RetryStats,
+                    validators: cache_state.ValidatorStore, journal: cache_state.FetchJournal,
+                    store=None, revalidate: bool = False, budget: RequestBudget | None = None) -> bool:
+    """
+    Fetch one timeline (rate-limited, with retries) and write it to Supabase or
+    the local timeline store.
 
+    With revalidate=True the request is conditional on the stored validators and
+    nothing is written when the timeline is unchanged. Every stored timeline is
+    journaled. Returns True if written.
+    """
+    event_id = match["sport_event_id"]
+    schedule_id = match.get("id")  # Present when from Supabase
+    key = sportradar.timeline_path(event_id)
+    client = sportradar.get_client()
+    data, new_validators = call_with_retry(
+        lambda: client.get_timeline_if_changed(event_id, validators.get(key) if revalidate else None),
+        event_id, limiter=limiter, stats=stats, label=label, budget=budget,
+    )
+    if data is None:
+        log(f"  Not modified — keeping cached timeline for {event_id}")
+    else:
+        if USE_SUPABASE and schedule_id:
+            import db
+            db.upsert_timeline(schedule_id, data)
+        if not USE_SUPABASE:
+            store.put(event_id, data)
+    validators.set(key, new_validators)
+    journal.record(event_id, key, new_validators)
+    return data is not None
 
-def main():
-    os.makedirs(TIMELINES_DIR, exist_ok=True)
 
-    if USE_SUPABASE:
-        import db
-        season_id = db.get_or_create_season()
-        matches = db.get_completed_matches_without_timeline(season_id)
-        print(f"Completed matches without timeline (from Supabase): {len(matches)}")
-    else:
-        matches = load_completed_matches(SCHEDULE_CSV)
-        print(f"Completed matches to process: {len(matches)}")
+def fetch_all(todo: list[tuple[dict, str]], workers: int = FETCH_WORKERS,
+              revalidate: set[str] | None = None, budget: RequestBudget | None = None,
+              store=None) -> tuple[list[str], int, RetryStats]:
+    """
+    Fetch every (match, label) in todo, in order; return (fetched ids, errors, retry stats).
 
-    fetched = 0
-    skipped = 0
+    Ids in `revalidate` already have a stored timeline and are fetched with a
+    conditional GET. When the quota or the run's budget runs out, the rest of
+    the queue is cancelled and left for the next run. Requests that still fail
+    with a retryable error after RETRY_ATTEMPTS are deferred and tried once
+    more, serially, after everything else has run. "Fetched" includes
+    timelines confirmed unchanged; their stale and pruned marks are cleared
+    at the end.
+    """
+    fetched = []
     errors = 0
+    stats = RetryStats()
+    deferred = []
+    stopped = False
+    revalidate = revalidate or set()
+    validators = cache_state.ValidatorStore()
+    journal = cache_state.FetchJournal()
+    if store is None and not USE_SUPABASE:
+        store = timeline_store.open_store()
+
+    # The token bucket decides when each request starts; worker threads let the
+    # response and the write of one match overlap with the next request.
+    limiter = TokenBucket(REQUEST_DELAY_SECONDS)
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    futures = {
+        pool.submit(
+            fetch_and_store, match, label, limiter, stats, validators, journal, store,
+            match["sport_event_id"] in revalidate, budget,
+        ): (match, label)
+        for match, label in todo
+    }
+    try:
+        # Collect in submission (priority) order; a cancelled future returns at once
+        for future, (match, label) in futures.items():
+            if future.cancelled():
+                continue  # dropped from the queue after the run was stopped
+            event_id = match["sport_event_id"]
+            try:
+                future.result()
+                fetched.append(event_id)
+            except CancelledError:
+                continue
+            except (BudgetExhausted, QuotaExhausted) as e:
+                # Out of budget leaves this match for the next run; out of quota is an error
+                if isinstance(e, QuotaExhausted):
+                    stats.mark_abandoned(event_id)
+                    errors += 1
+                else:
+                    stats.mark_deferred(event_id)
+                if not stopped:
+                    log(f"  {e} — stopping; remaining matches will be fetched next run")
+                    stopped = True
+                    pool.shutdown(wait=False, cancel_futures=True)
+            except urllib.error.HTTPError as e:
+                if is_retryable(e):
+                    log(f"  HTTP {e.code} — deferring {event_id}")
+                    deferred.append((match, label))
+                else:
+                    log(f"  HTTP {e.code} — skipping {event_id}")
+                    stats.mark_abandoned(event_id)
+                    errors += 1
+            except Exception as e:
+                if is_retryable(e):
+                    log(f"  Error: {e} — deferring {event_id}")
+                    deferred.append((match, label))
+                else:
+                    log(f"  Error: {e} — skipping {event_id}")
+                    stats.mark_abandoned(event_id)
+                    errors += 1
+    finally:
+        pool.shutdown(wait=True)
+
+    if deferred and not stopped:
+        log(f"\nRetrying {len(deferred)} deferred request(s)...")
+        while deferred:
+            match, label = deferred.pop(0)
+            event_id = match["sport_event_id"]
+            try:
+                fetch_and_store(match, label, limiter, stats, validators, journal, store,
+                                event_id in revalidate, budget)
+                stats.mark_recovered(event_id)
+                fetched.append(event_id)
+            except BudgetExhausted as e:
+                log(f"  {e} — leaving {event_id} for the next run")
+                stats.mark_deferred(event_id)
+                break
+            except QuotaExhausted as e:
+                log(f"  {e} — stopping")
+                stats.mark_abandoned(event_id)
+                errors += 1
+                break
+            except Exception as e:
+                log(f"  Giving up on {event_id}: {e}")
+                stats.mark_abandoned(event_id)
+                errors += 1
+    # Whatever is still queued was cut off by the run stopping: left for the next run
+    for match, _ in deferred:
+        stats.mark_deferred(match["sport_event_id"])
+
+    # Persist end-of-run state; only then is the journal no longer needed
+    validators.save()
+    cache_state.clear_fetched(fetched)
+    journal.discard()
+    return fetched, errors, stats
+
+
+def prioritize(matches: list[dict], revalidate: set[str]) -> list[dict]:
+    """
+    Order work by value: timelines we have never fetched come first, newest
+    match first, so the latest gameweek is always picked up; revalidations of
+    stale timelines we already hold (`revalidate`) come last.
+    """
+    newest_first = sorted(matches, key=lambda m: str(m.get("start_time") or ""), reverse=True)
+    return sorted(newest_first, key=lambda m: m["sport_event_id"] in revalidate)
+
+
+def is_goalless(match: dict) -> bool:
+    """True for a completed 0–0: its timeline cannot contain an own goal."""
+    return str(match.get("home_score", "")) == "0" and str(match.get("away_score", "")) == "0"
 
-    for i, match in enumerate(matches, 1):
-        event_id = match["sport_event_id"]
-        schedule_id = match.get("id")  # Present when from Supabase
-        out_path = cache_path(event_id)
 
-        if USE_SUPABASE:
-            skip = False  # We only got matches without timeline
-        else:
-            skip = os.path.exists(out_path)
+def split_goalless(queue: list[dict], revalidate: set[str]) -> tuple[list[dict], list[dict]]:
+    """
+    Split (to fetch, pruned) for --prune-goalless. Every 0–0 is pruned except
+    those in `revalidate`: a stored timeline whose score changed is refetched
+    so the old one is not left behind.
+    """
+    keep, pruned = [], []
+    for match in queue:
+        (pruned if is_goalless(match) and match["sport_event_id"] not in revalidate else keep).append(match)
+    return keep, pruned
 
-        if skip:
+
+def build_todo(matches: list[dict], cached: set[str] | None, stale: set[str], revalidate: set[str],
+               prune_goalless: bool = False,
+               fill_pruned: bool = False) -> tuple[list[tuple[dict, str]], int, list[dict]]:
+    """
+    The run's work list: (match, progress label) in fetch order, the number of
+    matches skipped as already cached, and the 0–0 matches pruned. cached=None
+    (Supabase mode) means `matches` already holds only what needs fetching.
+    """
+    skipped = 0
+    queue = []
+    for match in matches:
+        event_id = match["sport_event_id"]
+        if cached is not None and event_id in cached and event_id not in stale:
             skipped += 1
             continue
+        queue.append(match)
 
+    # 0–0 matches cannot change the own-goal result: record them instead of
+    # spending a request
+    pruned = []
+    if prune_goalless:
+        queue, pruned = split_goalless(queue, revalidate)
+
+    queue = prioritize(queue, revalidate)
+    if fill_pruned:
+        # Lowest priority: only fetched if the run's budget has room left
+        queue += prioritize(pruned, revalidate)
+    todo = []
+    for i, match in enumerate(queue, 1):
+        event_id = match["sport_event_id"]
         home = match.get("home_team", "")
         away = match.get("away_team", "")
         start_time = match.get("start_time", "")
         date = str(start_time)[:10] if start_time else "?"
-        print(f"[{i}/{len(matches)}] Fetching {date}  {home} vs {away}  ({event_id})")
-
-        try:
-            data = fetch_timeline(event_id)
-            if USE_SUPABASE and schedule_id:
-                db.upsert_timeline(schedule_id, data)
-            if not USE_SUPABASE:
-                with open(out_path, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False)
-            fetched += 1
-        except urllib.error.HTTPError as e:
-            print(f"  HTTP {e.code} — skipping")
-            errors += 1
-        except Exception as e:
-            print(f"  Error: {e} — skipping")
-            errors += 1
-
-        time.sleep(REQUEST_DELAY_SECONDS)
+        action = "Refetching" if event_id in revalidate else "Fetching"
+        todo.append((match, f"[{i}/{len(queue)}] {action} {date}  {home} vs {away}  ({event_id})"))
+    return todo, skipped, pruned
+
+
+def main(workers: int = FETCH_WORKERS, deadline_seconds: float | None = FETCH_DEADLINE_SECONDS,
+         max_requests: int | None = FETCH_MAX_REQUESTS, prune_goalless: bool = PRUNE_GOALLESS,
+         fill_pruned: bool = False):
+    replayed = cache_state.replay_journal()
+    if replayed:
+        print(f"Resuming interrupted run: {replayed} timeline(s) already stored")
+    stale = cache_state.load_stale_ids()
+
+    if USE_SUPABASE:
+        import db
+        season_id = db.get_or_create_season()
+        matches = db.get_completed_matches_without_timeline(season_id)
+        print(f"Completed matches without timeline (from Supabase): {len(matches)}")
+        missing = {m["sport_event_id"] for m in matches}
+        for event_id in sorted(stale - missing):
+            row = db.get_schedule_by_sport_event_id(season_id, event_id)
+            if row:
+                matches.append(row)
+        store = None
+        cached = None  # We only got matches without timeline, plus stale ones
+        revalidate = stale - missing  # these already have a stored timeline
+    else:
+        store = timeline_store.open_store()
+        # A stored timeline that failed to decode counts as not cached: fetched
+        # again without a conditional GET, which could 304 and keep the bad copy
+        unreadable = cache_state.load_unreadable_ids()
+        cached = store.ids() - unreadable
+        matches = load_completed_matches(SCHEDULE_CSV)
+        print(f"Completed matches to process: {len(matches)}")
+        if unreadable:
+            print(f"Unreadable timelines to refetch: {len(unreadable)}")
+        revalidate = stale & cached
+    if stale:
+        print(f"Stale timelines to refetch (schedule changed): {len(stale)}")
+
+    todo, skipped, pruned = build_todo(matches, cached, stale, revalidate, prune_goalless, fill_pruned)
+    if prune_goalless:
+        cache_state.mark_pruned(m["sport_event_id"] for m in pruned)
+        print(f"Goalless matches pruned (recorded, not fetched): {len(pruned)}")
+
+    budget = RequestBudget(deadline_seconds, max_requests)
+    fetched, errors, stats = fetch_all(todo, workers, revalidate, budget, store)
 
     print(f"\nDone.")
-    print(f"  Newly fetched : {fetched}")
+    print(f"  Newly fetched : {len(fetched)}")
     print(f"  Already cached: {skipped}")
+    print(f"  Left for later: {len(todo) - len(fetched) - errors}")
     print(f"  Errors        : {errors}")
+    stats.print_summary()
     if USE_SUPABASE:
         print(f"  Timelines saved to Supabase match_timelines table")
     else:
-        print(f"\nTimelines saved in: {TIMELINES_DIR}/")
+        print(f"\nTimelines saved in: {TIMELINES_DB if TIMELINE_STORE == 'sqlite' else TIMELINES_DIR + '/'}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Fetch timelines for completed matches.")
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS,
+                        help=f"concurrent fetch threads (default {FETCH_WORKERS})")
+    parser.add_argument("--deadline", type=parse_duration, default=FETCH_DEADLINE_SECONDS,
+                        help="stop starting requests after this long, e.g. 600, 10m, 1h")
+    parser.add_argument("--max-requests", type=int, default=FETCH_MAX_REQUESTS,
+                        help="stop after this many API requests (retries included)")
+    parser.add_argument("--prune-goalless", action="store_true", default=PRUNE_GOALLESS,
+                        help="skip 0–0 matches (recorded in data/pruned_matches.json)")
+    parser.add_argument("--fill-pruned", action="store_true",
+                        help="with --prune-goalless, fetch pruned matches last if budget remains")
+    args = parser.parse_args()
+    main(args.workers, args.deadline, args.max_requests, args.prune_goalless, args.fill_pruned)
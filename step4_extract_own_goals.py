@@ -1,6 +1,10 @@
 """
 STEP 4 — Scan cached timelines and extract own goal events.
 
+Extraction runs every detector in detectors.REGISTRY in one pass over each
+timeline: own goals (below), plus penalties and red cards, each written to
+its own CSV.
+
 Own goals are identified by:
     timeline event: type == "score_change"  AND  method == "own_goal"
 
@@ -13,33 +17,49 @@ For each own goal, we extract:
     final_home_score, final_away_score,
     commentary, sport_event_id
 
-Output: data/own_goals.csv
+Runs are incremental: each match's watermark (the timeline's content hash,
+or its fetched_at in Supabase mode, plus the schedule fields used above) is
+kept in data/own_goals_watermarks.json. Only matches whose watermark changed
+are re-extracted; their rows replace that match's rows in each existing
+output, so a week that adds 10 matches costs 10 timeline reads.
+--full ignores the watermarks and rescans everything.
+
+--workers N spreads the timelines to (re)process over up to N processes in
+chunks (local timeline store only); results are merged by sport_event_id, so
+the CSV is byte-for-byte the same as a serial run. The pool only pays off on
+large backfills, so it is used only from EXTRACT_PARALLEL_MIN_MATCHES
+timelines (--parallel-min) and never with more processes than CPUs; smaller
+runs stay serial. See bench_extract.py.
+
+Locally, each timeline is parsed with json.loads. --low-memory scans it in
+streaming mode instead (timeline_scan.py), building only the events some
+detector looks at: lower peak memory, but slower. Both give the same CSVs.
+
+The same pass records each match's event count and detector hits in
+data/timeline_stats.json, which generate_report.py reads instead of going
+back to the timelines.
+
+Output: data/own_goals.csv (+ data/penalties.csv, data/red_cards.csv, data/timeline_stats.json)
 """
 
+import argparse
 import csv
+import hashlib
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cache_state
+import detectors
+import timeline_scan
+import timeline_store
+from config import SCHEDULE_CSV, OWN_GOALS_CSV, USE_SUPABASE, EXTRACT_PARALLEL_MIN_MATCHES
+from own_goal import OwnGoal
 
-from config import SCHEDULE_CSV, TIMELINES_DIR, OWN_GOALS_CSV, USE_SUPABASE
-
-OG_FIELDS = [
-    "sport_event_id",
-    "match_date",
-    "round",
-    "home_team",
-    "away_team",
-    "og_player",
-    "og_player_id",
-    "og_player_team",
-    "benefiting_team",
-    "minute",
-    "stoppage_time",
-    "home_score_after",
-    "away_score_after",
-    "final_home_score",
-    "final_away_score",
-    "commentary",
-]
+# Part of every watermark; bump it when extraction changes so the next run rescans everything
+EXTRACT_VERSION = 2
+
+OG_FIELDS = detectors.OWN_GOALS.fields
 
 
 def load_schedule_lookup(csv_path: str) -> dict[str, dict]:
@@ -53,13 +73,8 @@ def load_schedule_lookup(csv_path: str) -> dict[str, dict]:
     return lookup
 
 
-def cache_path(sport_event_id: str) -> str:
-    safe_id = sport_event_id.replace(":", "_")
-    return os.path.join(TIMELINES_DIR, f"{safe_id}.json")
-
-
 def _schedule_row_for_extract(row: dict) -> dict:
-    """Normalize schedule row (from DB or CSV) for extract_own_goals_from_timeline."""
+    """Normalize schedule row (from DB or CSV) for the detectors."""
     start_time = row.get("start_time", "")
     return {
         "sport_event_id": row.get("sport_event_id", ""),
@@ -72,148 +87,238 @@ def _schedule_row_for_extract(row: dict) -> dict:
     }
 
 
-def extract_own_goals_from_timeline(data: dict, schedule_row: dict) -> list[dict]:
-    """Return a list of own goal rows from a single timeline response."""
-    timeline = data.get("timeline", [])
-    og_events = [
-        ev for ev in timeline
-        if ev.get("type") == "score_change" and ev.get("method") == "own_goal"
-    ]
-    if not og_events:
-        return []
-
-    final_status = data.get("sport_event_status", {})
-    final_home = final_status.get("home_score", "")
-    final_away = final_status.get("away_score", "")
-
-    event_id = schedule_row.get("sport_event_id", "")
-    home_team = schedule_row.get("home_team", "")
-    home_team_id = schedule_row.get("home_team_id", "")
-    away_team = schedule_row.get("away_team", "")
-    away_team_id = schedule_row.get("away_team_id", "")
-    round_num = schedule_row.get("round", "")
-    match_date = str(schedule_row.get("start_time", ""))[:10]
+def watermark(content_mark: str, schedule_row: dict) -> str:
+    """What a match's rows were extracted from: timeline mark + schedule fields + EXTRACT_VERSION."""
+    fields = json.dumps(_schedule_row_for_extract(schedule_row), sort_keys=True)
+    digest = hashlib.sha256(fields.encode("utf-8")).hexdigest()[:16]
+    return f"v{EXTRACT_VERSION}:{content_mark}:{digest}"
+
+
+def load_rows_by_match(detector: detectors.Detector) -> dict[str, list]:
+    """A detector's existing output rows grouped by sport_event_id, in file order."""
+    by_match: dict[str, list] = {}
+    if not os.path.exists(detector.output):
+        return by_match
+    with open(detector.output, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            by_match.setdefault(row["sport_event_id"], []).append(detector.load(row))
+    return by_match
+
 
+def merge_rows(detector: detectors.Detector, match_ids, existing: dict[str, list], updates: dict[str, list]) -> list:
+    """
+    One output's rows for match_ids: re-extracted rows where a match was reprocessed,
+    its existing rows otherwise. Matches are taken in id order before the sort,
+    as a full scan would, so ties sort the same way either way.
+    """
     rows = []
-    for ev in og_events:
-        players = ev.get("players", [])
-        scorer = next((p for p in players if p.get("type") == "scorer"), {})
-
-        # The "competitor" field = the team that BENEFITS from the own goal
-        benefiting_competitor = ev.get("competitor", "")
-        if benefiting_competitor == "home":
-            benefiting_team = home_team
-            # The own-goaler plays for the AWAY team
-            og_player_team = away_team
-        else:
-            benefiting_team = away_team
-            og_player_team = home_team
-
-        commentaries = ev.get("commentaries", [])
-        commentary = commentaries[0].get("text", "") if commentaries else ""
-
-        minute = ev.get("match_time", "")
-        stoppage = ev.get("stoppage_time", "")
-
-        rows.append({
-            "sport_event_id": event_id,
-            "match_date": match_date,
-            "round": round_num,
-            "home_team": home_team,
-            "away_team": away_team,
-            "og_player": scorer.get("name", "Unknown"),
-            "og_player_id": scorer.get("id", ""),
-            "og_player_team": og_player_team,
-            "benefiting_team": benefiting_team,
-            "minute": minute,
-            "stoppage_time": stoppage,
-            "home_score_after": ev.get("home_score", ""),
-            "away_score_after": ev.get("away_score", ""),
-            "final_home_score": final_home,
-            "final_away_score": final_away,
-            "commentary": commentary,
-        })
+    for sport_event_id in sorted(match_ids):
+        rows.extend(updates[sport_event_id] if sport_event_id in updates else existing.get(sport_event_id, []))
+    rows.sort(key=detector.sort_key)
     return rows
 
 
-def main():
+def read_timeline(store, sport_event_id: str, low_memory: bool = False) -> tuple[dict, int] | None:
+    """
+    (cached timeline, its event count), or None if missing. With low_memory,
+    the timeline is trimmed to the events detectors want. Raises ValueError
+    if the stored body can't be decoded (truncated JSON, timeline_codec.CorruptBody).
+    """
+    body = store.body(sport_event_id)
+    if body is None:
+        return None
+    if low_memory:
+        return timeline_scan.scan(body, detectors.wants())
+    data = json.loads(body)
+    return data, len(data.get("timeline", []))
+
+
+def extract_match(data: dict, schedule_row: dict, event_count: int | None = None) -> dict:
+    """{"rows": rows per detector, "stats": per-match counts for timeline_stats.json}."""
+    rows = detectors.run(data, schedule_row)
+    if event_count is None:
+        event_count = len(data.get("timeline", []))
+    return {"rows": rows, "stats": {"events": event_count, **{name: len(r) for name, r in rows.items()}}}
+
+
+Results = list[tuple[str, dict | None]]
+
+
+def _extract_matches(store, todo: list[tuple[str, dict]], low_memory: bool) -> tuple[Results, dict[str, str]]:
+    """
+    (sport_event_id, extract_match() result or None if there is no readable
+    timeline) for each (id, schedule row) in todo, and {sport_event_id: error}
+    for the unreadable ones. Recording those is left to the caller, since pool
+    workers must not all rewrite the unreadable-ids file at once.
+    """
+    results, unreadable = [], {}
+    for sport_event_id, row in todo:
+        try:
+            timeline = read_timeline(store, sport_event_id, low_memory)
+        except ValueError as e:
+            unreadable[sport_event_id], timeline = str(e), None
+        results.append((sport_event_id, None if timeline is None else extract_match(timeline[0], row, timeline[1])))
+    return results, unreadable
+
+
+def _extract_chunk(todo: list[tuple[str, dict]], low_memory: bool) -> tuple[Results, dict[str, str]]:
+    """Process-pool entry point: each worker reads the timeline store through its own connection."""
+    store = timeline_store.open_store()
+    try:
+        return _extract_matches(store, todo, low_memory)
+    finally:
+        store.close()
+
+
+def extract_parallel(todo: list[tuple[str, dict]], workers: int, low_memory: bool = False):
+    """_extract_matches() over a process pool; results come back in todo order."""
+    chunk_size = max(1, -(-len(todo) // (workers * 4)))
+    chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results, unreadable = [], {}
+        for chunk_results, chunk_unreadable in pool.map(_extract_chunk, chunks, [low_memory] * len(chunks)):
+            results.extend(chunk_results)
+            unreadable.update(chunk_unreadable)
+    return results, unreadable
+
+
+def pool_size(matches: int, workers: int, min_matches: int = EXTRACT_PARALLEL_MIN_MATCHES) -> int:
+    """
+    Processes worth using for `matches` timelines: 1 (serial) below min_matches,
+    otherwise `workers` capped at the CPU count, since extra processes sharing a
+    core only add startup and result pickling.
+    """
+    if workers <= 1 or matches < max(2, min_matches):
+        return 1
+    return max(1, min(workers, os.cpu_count() or 1))
+
+
+def main(full: bool = False, low_memory: bool = False, workers: int = 1,
+         parallel_min: int = EXTRACT_PARALLEL_MIN_MATCHES):
     os.makedirs(os.path.dirname(OWN_GOALS_CSV), exist_ok=True)
 
-    all_own_goals = []
-    matches_with_og = 0
-
+    # sport_event_id -> (schedule row, timeline mark) for every match with a timeline
+    candidates: dict[str, tuple[dict, str]] = {}
     if USE_SUPABASE:
         import db
         season_id = db.get_or_create_season()
-        matches_with_tl = db.get_completed_matches_with_timelines(season_id)
-        print(f"Scanning {len(matches_with_tl)} timelines from Supabase...")
-
-        for row in matches_with_tl:
-            data = row.get("timeline_json") or {}
-            sched_row = _schedule_row_for_extract(row)
-            ogs = extract_own_goals_from_timeline(data, sched_row)
-            if ogs:
-                matches_with_og += 1
-                all_own_goals.extend(ogs)
-                home = sched_row["home_team"]
-                away = sched_row["away_team"]
-                date = sched_row["start_time"][:10]
-                print(f"  Found {len(ogs)} OG(s) in {date}  {home} vs {away}")
-
-        all_own_goals.sort(key=lambda r: (r["match_date"], r["minute"] if r["minute"] != "" else 0))
-
-        if all_own_goals:
-            db.upsert_own_goals(all_own_goals, replace=True)
-        with open(OWN_GOALS_CSV, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=OG_FIELDS)
-            writer.writeheader()
-            writer.writerows(all_own_goals)
-        print(f"\nDone.")
-        print(f"  Matches with own goals : {matches_with_og}")
-        print(f"  Total own goals found  : {len(all_own_goals)}")
-        print(f"  Saved to Supabase + {OWN_GOALS_CSV}")
-
+        for row in db.get_completed_matches_timeline_marks(season_id):
+            candidates[row["sport_event_id"]] = (row, str(row["fetched_at"]))
+        print(f"Checking {len(candidates)} timelines in Supabase...")
     else:
         schedule = load_schedule_lookup(SCHEDULE_CSV)
         if not schedule:
             raise FileNotFoundError(
                 f"{SCHEDULE_CSV} not found — run step2_get_schedule.py first"
             )
+        store = timeline_store.open_store()
+        for sport_event_id, entry in store.manifest().items():
+            if sport_event_id in schedule:
+                candidates[sport_event_id] = (schedule[sport_event_id], entry["sha256"])
+        print(f"Checking {len(candidates)} cached timelines...")
+
+    # Without the previous outputs there is nothing to merge into: rescan everything
+    previous_stats = cache_state.load_timeline_stats()
+    outputs_exist = previous_stats is not None and all(os.path.exists(d.output) for d in detectors.REGISTRY)
+    previous = cache_state.load_watermarks() if outputs_exist and not full else {}
+    existing = {d.name: load_rows_by_match(d) if previous else {} for d in detectors.REGISTRY}
+    per_match = previous_stats["matches"] if previous else {}
+    marks = {sport_event_id: watermark(mark, row) for sport_event_id, (row, mark) in candidates.items()}
+    changed = sorted(
+        sport_event_id for sport_event_id, mark in marks.items()
+        if previous.get(sport_event_id) != mark or sport_event_id not in per_match
+    )
+    removed = previous.keys() - marks.keys()
+    print(f"Reprocessing {len(changed)} new or changed timelines ({len(marks) - len(changed)} unchanged)")
+
+    todo = [(sport_event_id, _schedule_row_for_extract(candidates[sport_event_id][0])) for sport_event_id in changed]
+    if USE_SUPABASE:
+        # Timelines arrive a page at a time; extraction keeps up with the download
+        schedule_rows = dict(todo)
+        found = {}
+        for match in db.get_completed_matches_with_timelines(season_id, schedule_rows):
+            data = match["timeline_json"]
+            if data:
+                found[match["sport_event_id"]] = extract_match(data, schedule_rows[match["sport_event_id"]])
+        results, unreadable = [(sport_event_id, found.get(sport_event_id)) for sport_event_id, _ in todo], {}
+    elif pool_size(len(todo), workers, parallel_min) > 1:
+        store.close()
+        results, unreadable = extract_parallel(todo, pool_size(len(todo), workers, parallel_min), low_memory)
+    else:
+        if workers > 1:
+            print(f"  Extracting serially ({len(todo)} timelines, {os.cpu_count() or 1} CPU(s); "
+                  f"the process pool starts at {parallel_min})")
+        results, unreadable = _extract_matches(store, todo, low_memory)
+    timeline_store.record_unreadable(unreadable)
+
+    updates: dict[str, dict[str, list]] = {d.name: {} for d in detectors.REGISTRY}
+    for (sport_event_id, found), (_, row) in zip(results, todo):
+        if found is None:
+            # No timeline to extract from this run. Whatever rows and stats the match
+            # had stay in the outputs (it isn't in `affected`, so Supabase keeps them too)
+            if USE_SUPABASE:
+                # Stored without JSON: its fetched_at mark changes when step 3 refetches it
+                per_match.setdefault(sport_event_id, {"events": 0, **{d.name: 0 for d in detectors.REGISTRY}})
+            elif sport_event_id in per_match and sport_event_id in previous:
+                # Content-hash mark: keep the one the kept rows came from, so any refetch is rescanned
+                marks[sport_event_id] = previous[sport_event_id]
+            else:
+                del marks[sport_event_id]
+            continue
+        for name, rows in found["rows"].items():
+            updates[name][sport_event_id] = rows
+        per_match[sport_event_id] = found["stats"]
+        ogs = found["rows"]["own_goals"]
+        if ogs:
+            print(f"  Found {len(ogs)} OG(s) in {row['start_time'][:10]}  {row['home_team']} vs {row['away_team']}")
+
+    tables = {d.name: merge_rows(d, marks, existing[d.name], updates[d.name]) for d in detectors.REGISTRY}
+    all_own_goals: list[OwnGoal] = tables["own_goals"]
+    matches_with_og = len({og.sport_event_id for og in all_own_goals})
 
-        timeline_files = [f for f in os.listdir(TIMELINES_DIR) if f.endswith(".json")]
-        print(f"Scanning {len(timeline_files)} cached timelines...")
-
-        for filename in sorted(timeline_files):
-            sport_event_id = filename.replace("sr_sport_event_", "sr:sport_event:").replace(".json", "")
-
-            row = schedule.get(sport_event_id)
-            if not row:
-                continue
-
-            filepath = os.path.join(TIMELINES_DIR, filename)
-            with open(filepath, encoding="utf-8") as f:
-                data = json.load(f)
-
-            ogs = extract_own_goals_from_timeline(data, row)
-            if ogs:
-                matches_with_og += 1
-                all_own_goals.extend(ogs)
-                home = row["home_team"]
-                away = row["away_team"]
-                print(f"  Found {len(ogs)} OG(s) in {row['start_time'][:10]}  {home} vs {away}")
-
-        all_own_goals.sort(key=lambda r: (r["match_date"], r["minute"] if r["minute"] != "" else 0))
-
-        with open(OWN_GOALS_CSV, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=OG_FIELDS)
+    if USE_SUPABASE:
+        if previous:
+            affected = updates["own_goals"].keys() | removed
+            db.sync_own_goals([og for og in all_own_goals if og.sport_event_id in affected], affected)
+        elif all_own_goals:
+            db.sync_own_goals(all_own_goals)
+        else:
+            # No state to diff against and nothing found: leave the table alone rather than wipe it
+            print("  No own goals extracted — Supabase own_goals left as it is")
+    for detector in detectors.REGISTRY:
+        with cache_state.atomic_write(detector.output, newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=detector.fields)
             writer.writeheader()
-            writer.writerows(all_own_goals)
-
-        print(f"\nDone.")
-        print(f"  Matches with own goals : {matches_with_og}")
-        print(f"  Total own goals found  : {len(all_own_goals)}")
+            writer.writerows(detector.dump(row) for row in tables[detector.name])
+    cache_state.save_timeline_stats(
+        {sport_event_id: per_match[sport_event_id] for sport_event_id in marks},
+        [d.name for d in detectors.REGISTRY],
+    )
+    cache_state.save_watermarks(marks)
+
+    print(f"\nDone.")
+    print(f"  Matches with own goals : {matches_with_og}")
+    print(f"  Total own goals found  : {len(all_own_goals)}")
+    if USE_SUPABASE:
+        print(f"  Saved to Supabase + {OWN_GOALS_CSV}")
+    else:
         print(f"  Saved to               : {OWN_GOALS_CSV}")
+    for detector in detectors.REGISTRY:
+        if detector is not detectors.OWN_GOALS:
+            label = detector.name.replace("_", " ").capitalize()
+            print(f"  {label:<22} : {len(tables[detector.name])} → {detector.output}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--full", action="store_true",
+                        help="re-extract every match, ignoring the watermarks from the last run")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="stream-scan timelines instead of json-parsing them (slower, less memory)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes for extracting timelines (default 1 = serial)")
+    parser.add_argument("--parallel-min", type=int, default=EXTRACT_PARALLEL_MIN_MATCHES,
+                        help=f"timelines needed before --workers uses a process pool "
+                             f"(default {EXTRACT_PARALLEL_MIN_MATCHES})")
+    args = parser.parse_args()
+    main(full=args.full, low_memory=args.low_memory, workers=args.workers, parallel_min=args.parallel_min)
@@ -0,0 +1,70 @@
+-- EPL Own Goals 25/26 — own goals natural key + atomic sync
+-- Run after 20250306000000_epl_own_goals_schema.sql (Supabase MCP apply_migration or SQL Editor).
+
+-- One row per own goal: match, scorer, minute and the score it produced.
+-- Drop exact duplicates left by earlier clear-then-insert runs before adding the index.
+delete from public.own_goals a
+using public.own_goals b
+where a.ctid > b.ctid
+  and a.sport_event_id = b.sport_event_id
+  and a.og_player_id is not distinct from b.og_player_id
+  and a.minute is not distinct from b.minute
+  and a.stoppage_time is not distinct from b.stoppage_time
+  and a.home_score_after is not distinct from b.home_score_after
+  and a.away_score_after is not distinct from b.away_score_after;
+
+-- stoppage_time is usually null, so nulls must compare equal for the key to hold (Postgres 15+)
+create unique index if not exists uq_own_goals_natural_key on public.own_goals
+  (sport_event_id, og_player_id, minute, stoppage_time, home_score_after, away_score_after)
+  nulls not distinct;
+
+-- Make own_goals match p_rows in one transaction: upsert every row by its natural key,
+-- then delete rows that are no longer extracted. p_sport_event_ids limits the delete to
+-- those matches (the ones step 4 re-extracted); null means p_rows is the whole table.
+-- Readers never see the table empty or half-written.
+create or replace function public.sync_own_goals(p_rows jsonb, p_sport_event_ids text[] default null)
+returns void
+language plpgsql
+as $$
+begin
+  create temporary table _own_goals_incoming on commit drop as
+  select * from jsonb_populate_recordset(null::public.own_goals, coalesce(p_rows, '[]'::jsonb));
+
+  insert into public.own_goals (
+    sport_event_id, match_date, round, home_team, away_team,
+    og_player, og_player_id, og_player_team, benefiting_team,
+    minute, stoppage_time, home_score_after, away_score_after,
+    final_home_score, final_away_score, commentary
+  )
+  select
+    sport_event_id, match_date, round, home_team, away_team,
+    og_player, og_player_id, og_player_team, benefiting_team,
+    minute, stoppage_time, home_score_after, away_score_after,
+    final_home_score, final_away_score, commentary
+  from _own_goals_incoming
+  on conflict (sport_event_id, og_player_id, minute, stoppage_time, home_score_after, away_score_after)
+  do update set
+    match_date = excluded.match_date,
+    round = excluded.round,
+    home_team = excluded.home_team,
+    away_team = excluded.away_team,
+    og_player = excluded.og_player,
+    og_player_team = excluded.og_player_team,
+    benefiting_team = excluded.benefiting_team,
+    final_home_score = excluded.final_home_score,
+    final_away_score = excluded.final_away_score,
+    commentary = excluded.commentary;
+
+  delete from public.own_goals o
+  where (p_sport_event_ids is null or o.sport_event_id = any(p_sport_event_ids))
+    and not exists (
+      select 1 from _own_goals_incoming i
+      where i.sport_event_id = o.sport_event_id
+        and i.og_player_id is not distinct from o.og_player_id
+        and i.minute is not distinct from o.minute
+        and i.stoppage_time is not distinct from o.stoppage_time
+        and i.home_score_after is not distinct from o.home_score_after
+        and i.away_score_after is not distinct from o.away_score_after
+    );
+end;
+$$;
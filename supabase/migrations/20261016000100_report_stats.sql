@@ -0,0 +1,22 @@
+-- EPL Own Goals 25/26 — per-timeline event counts + report stats RPC
+-- Run after 20261016000000_own_goals_sync.sql (Supabase MCP apply_migration or SQL Editor).
+
+-- Number of events in timeline_json->'timeline', written by db.upsert_timeline()
+alter table public.match_timelines add column if not exists event_count int;
+
+update public.match_timelines
+set event_count = coalesce(jsonb_array_length(timeline_json->'timeline'), 0)
+where event_count is null and timeline_json is not null;
+
+-- Header numbers for the report without reading any timeline_json:
+-- matches with a timeline and their total events, for one season (or all when null)
+create or replace function public.report_stats(p_season_id uuid default null)
+returns table (completed_matches bigint, timeline_events bigint)
+language sql
+stable
+as $$
+  select count(*), coalesce(sum(t.event_count), 0)
+  from public.match_timelines t
+  join public.schedule s on s.id = t.schedule_id
+  where p_season_id is null or s.season_id = p_season_id;
+$$;
@@ -0,0 +1,284 @@
+"""
+db.py against a stand-in PostgREST client (needs postgrest from
+requirements.txt; no Supabase project is contacted):
+
+  - report header counts: the report_stats RPC is the source even when step
+    4's timeline_stats.json exists, and the JSON is only used when the
+    report_stats migration has not been applied
+  - sync_own_goals(): the rows and the matches whose rows may be deleted go
+    to the sync_own_goals RPC in one call, and an empty sync never wipes the
+    table by accident; without the own_goals_sync migration it falls back to
+    deleting the affected matches' rows and inserting the new ones
+  - upsert_schedule(diff=True): a stored row and the payload for the same
+    values compare equal (round as text, scores as ints, "Z" or "+00:00"),
+    so only new or changed rows are sent
+  - _paged(): the keyset cursor advances page by page, and a server row
+    cap below the page size does not end paging early
+  - step 2's merge_rows(), which picks the schedule rows upsert_schedule()
+    gets in --window mode: unchanged rows (CSV text vs parsed feed values)
+    are skipped, changed rows replace theirs in place, new ones are appended
+
+Run: python -m pytest test_db.py   (or python test_db.py)
+"""
+
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("postgrest")
+from postgrest.exceptions import APIError
+
+import db
+import generate_report
+from own_goal import OwnGoal
+from step2_get_schedule import merge_rows
+
+SEASON = "00000000-0000-0000-0000-000000000001"
+STATS = {"matches": {"sr:sport_event:1": {"events": 150}, "sr:sport_event:2": {"events": 200}}}
+
+
+def _response(data):
+    return type("Response", (), {"data": data})()
+
+
+class _Rpc:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return _response(self.result)
+
+
+class _Query:
+    """Records a table query's builder calls, e.g. ["own_goals", ("delete",), ("in_", "sport_event_id", [...])]."""
+
+    def __init__(self, client, table: str):
+        self.client = client
+        self.steps = [table]
+
+    def __getattr__(self, name):
+        if name == "not_":
+            self.steps.append(("not",))
+            return self
+
+        def step(*args, **kwargs):
+            self.steps.append((name, *args))
+            return self
+        return step
+
+    def execute(self):
+        self.client.queries.append(self.steps)
+        answer = self.client.tables.get(self.steps[0])
+        return _response(answer(self.steps) if answer else [])
+
+
+class _Client:
+    """
+    Stand-in PostgREST client: rpc() calls get `result` (raised if an exception),
+    table queries are recorded and answered by tables[name](steps), if given.
+    """
+
+    def __init__(self, result=None, tables=None):
+        self.result = result
+        self.tables = tables or {}
+        self.calls = []
+        self.queries = []
+
+    def rpc(self, name, params):
+        self.calls.append((name, params))
+        return _Rpc(self.result)
+
+    def table(self, name):
+        return _Query(self, name)
+
+
+@contextmanager
+def _supabase(result=None, tables=None):
+    saved = db.USE_SUPABASE, db._client, db.get_or_create_season
+    db.USE_SUPABASE, db._client = True, _Client(result, tables)
+    db.get_or_create_season = lambda: SEASON
+    try:
+        yield db._client
+    finally:
+        db.USE_SUPABASE, db._client, db.get_or_create_season = saved
+
+
+def _table(rows: list[dict]):
+    """A table answer for _Client: applies a select's eq / gt / order / limit steps to `rows`."""
+    def answer(steps):
+        found = list(rows)
+        for name, *args in steps[1:]:
+            if name == "eq":
+                found = [r for r in found if r[args[0]] == args[1]]
+            elif name == "gt":
+                found = [r for r in found if r[args[0]] > args[1]]
+            elif name == "order":
+                found.sort(key=lambda r: r[args[0]])
+            elif name == "limit":
+                found = found[:args[0]]
+            elif name != "select":
+                return []  # a write
+        return found
+    return answer
+
+
+def _missing_function(name: str = "report_stats") -> APIError:
+    return APIError({"code": "PGRST202", "message": f"Could not find the function public.{name}"})
+
+
+def test_rpc_is_used_even_with_timeline_stats():
+    with _supabase([{"completed_matches": 300, "timeline_events": 61234}]) as client:
+        assert generate_report.supabase_report_counts(db, STATS)[1] == 61234
+    assert client.calls == [("report_stats", {"p_season_id": SEASON})]
+
+
+def test_timeline_stats_fallback_without_migration():
+    with _supabase(_missing_function()):
+        assert generate_report.supabase_report_counts(db, STATS)[1] == 350
+        assert db.get_report_stats(SEASON, lambda: (2, 350)) == (2, 350)
+
+
+def test_other_rpc_errors_are_raised():
+    with _supabase(APIError({"code": "42501", "message": "permission denied for function report_stats"})):
+        with pytest.raises(APIError):
+            db.get_report_stats(SEASON, lambda: (0, 0))
+
+
+def _og(sport_event_id: str, minute: int, player: str = "sr:player:1") -> OwnGoal:
+    return OwnGoal.from_row({"sport_event_id": sport_event_id, "og_player_id": player, "minute": minute,
+                             "home_score_after": 1, "away_score_after": 0, "match_date": "2026-03-07"})
+
+
+def test_sync_sends_changed_matches_in_one_call():
+    rows = [_og("m2", 10), _og("m1", 30), _og("m1", 30)]  # a duplicate in the same upsert is dropped
+    with _supabase(None) as client:
+        db.sync_own_goals(rows, ["m2", "m1", "m3", "m1"])  # m3: its own goal was removed
+    [(name, params)] = client.calls
+    assert name == "sync_own_goals"
+    assert params["p_sport_event_ids"] == ["m1", "m2", "m3"]
+    assert sorted((p["sport_event_id"], p["minute"]) for p in params["p_rows"]) == [("m1", 30), ("m2", 10)]
+    assert params["p_rows"][0]["match_date"] == "2026-03-07"
+
+
+def test_sync_without_changes_makes_no_call():
+    with _supabase(None) as client:
+        db.sync_own_goals([], [])
+    assert client.calls == []
+
+
+def test_whole_table_sync_never_wipes_by_accident():
+    with _supabase(None) as client:
+        with pytest.raises(ValueError):
+            db.sync_own_goals([])
+        assert client.calls == []
+        db.sync_own_goals([_og("m1", 5)])
+        db.clear_own_goals()
+        db.upsert_own_goals([])  # replace=True has always meant "the table is exactly these rows"
+    assert [params.get("p_sport_event_ids") for _, params in client.calls] == [None, None, None]
+    assert [len(params["p_rows"]) for _, params in client.calls] == [1, 0, 0]
+
+
+def test_sync_without_migration_replaces_affected_matches():
+    rows = [_og("m1", 30), _og("m2", 10)]
+    with _supabase(_missing_function("sync_own_goals")) as client:
+        db.sync_own_goals(rows, ["m1", "m3"])
+    deletes = [q for q in client.queries if ("delete",) in q]
+    inserts = [q for q in client.queries if q[1][0] == "insert"]
+    assert deletes == [["own_goals", ("delete",), ("in_", "sport_event_id", ["m1", "m2", "m3"])]]
+    assert [len(q[1][1]) for q in inserts] == [2]
+    assert client.queries.index(deletes[0]) < client.queries.index(inserts[0])
+
+
+def test_whole_table_sync_without_migration():
+    with _supabase(_missing_function("sync_own_goals")) as client:
+        db.clear_own_goals()
+    assert client.queries == [["own_goals", ("delete",), ("not",), ("is_", "id", "null")]]
+
+
+def test_other_sync_errors_are_raised():
+    with _supabase(APIError({"code": "23505", "message": "duplicate key value"})) as client:
+        with pytest.raises(APIError):
+            db.sync_own_goals([_og("m1", 5)], ["m1"])
+    assert client.queries == []
+
+
+def _schedule_row(sport_event_id: str, **changes) -> dict:
+    row = {
+        "sport_event_id": sport_event_id, "start_time": "2026-03-07T15:00:00+00:00", "round": 28,
+        "home_team": "Arsenal", "home_team_id": "sr:competitor:42", "away_team": "Chelsea",
+        "away_team_id": "sr:competitor:38", "status": "closed", "match_status": "ended",
+        "home_score": 2, "away_score": 1,
+    }
+    return {**row, **changes}
+
+
+def test_merge_rows_skips_unchanged_and_updates_in_place():
+    # As read back from schedule.csv: every value is text, a missing score is ""
+    existing = [{k: "" if v is None else str(v) for k, v in _schedule_row(i, home_score=s, away_score=s).items()}
+                for i, s in (("m1", 2), ("m2", None), ("m3", 0))]
+    updates = [
+        _schedule_row("m3", home_score=0, away_score=0),  # same match, values as ints: unchanged
+        _schedule_row("m2", status="closed", home_score=1, away_score=0),  # result came in
+        _schedule_row("m4", round=29),  # new
+    ]
+    merged, affected = merge_rows(existing, updates)
+    assert [r["sport_event_id"] for r in affected] == ["m2", "m4"]
+    assert [r["sport_event_id"] for r in merged] == ["m1", "m2", "m3", "m4"]
+    assert merged[0] is existing[0] and merged[2] is existing[2]
+    assert merged[1]["home_score"] == 1
+
+
+def test_schedule_diff_key_normalises_types():
+    csv_row = {k: str(v) for k, v in _schedule_row("m1", start_time="2026-03-07T15:00:00Z").items()}
+    stored = {**_schedule_row("m1"), "round": "28", "id": "uuid-1"}  # schedule.round is text
+    assert db._schedule_diff_key(db._schedule_payload(SEASON, csv_row)) == db._schedule_diff_key(stored)
+    assert db._schedule_diff_key({**stored, "round": 28}) == db._schedule_diff_key(stored)
+    assert db._schedule_diff_key({**stored, "home_score": 3}) != db._schedule_diff_key(stored)
+    blank = db._schedule_diff_key({**stored, "match_status": ""})
+    assert blank == db._schedule_diff_key({**stored, "match_status": None})
+
+
+def test_schedule_diff_sends_only_new_and_changed_rows():
+    stored = [{**_schedule_row(i), "round": "28", "id": f"uuid-{i}", "season_id": SEASON} for i in ("m1", "m2")]
+    rows = [_schedule_row("m1"), _schedule_row("m2", home_score=3), _schedule_row("m3")]
+    with _supabase(tables={"schedule": _table(stored)}) as client:
+        assert db.upsert_schedule(SEASON, rows, diff=True) == 2
+    [upsert] = [q for q in client.queries if q[1][0] == "upsert"]
+    assert [p["sport_event_id"] for p in upsert[1][1]] == ["m2", "m3"]
+
+
+def test_paged_advances_the_keyset_cursor():
+    rows = [{"id": f"uuid-{i:02}", "season_id": SEASON} for i in range(7)]
+    rows.append({"id": "uuid-99", "season_id": "another season"})
+    with _supabase(tables={"schedule": _table(rows)}) as client:
+        paged = db._paged(lambda: client.table("schedule").select("id").eq("season_id", SEASON), page_size=3)
+        assert [r["id"] for r in paged] == [f"uuid-{i:02}" for i in range(7)]
+    cursors = [next((args[1] for name, *args in q[1:] if name == "gt"), None) for q in client.queries]
+    assert cursors == [None, "uuid-02", "uuid-05", "uuid-06"]  # the last page is empty
+
+
+def test_paged_survives_a_server_row_cap():
+    rows = [{"id": i} for i in range(10)]
+    capped = _table(rows)
+    with _supabase(tables={"t": lambda steps: capped(steps)[:4]}) as client:  # max-rows = 4 < page_size
+        assert [r["id"] for r in db._paged(lambda: client.table("t").select("id"), page_size=6)] == list(range(10))
+
+
+if __name__ == "__main__":
+    test_rpc_is_used_even_with_timeline_stats()
+    test_timeline_stats_fallback_without_migration()
+    test_other_rpc_errors_are_raised()
+    test_sync_sends_changed_matches_in_one_call()
+    test_sync_without_changes_makes_no_call()
+    test_whole_table_sync_never_wipes_by_accident()
+    test_sync_without_migration_replaces_affected_matches()
+    test_whole_table_sync_without_migration()
+    test_other_sync_errors_are_raised()
+    test_merge_rows_skips_unchanged_and_updates_in_place()
+    test_schedule_diff_key_normalises_types()
+    test_schedule_diff_sends_only_new_and_changed_rows()
+    test_paged_advances_the_keyset_cursor()
+    test_paged_survives_a_server_row_cap()
+    print("OK")
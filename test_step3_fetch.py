@@ -0,0 +1,160 @@
+"""
+fetch_all()'s retry summary adds up: every retried request ends up recovered,
+abandoned or deferred (left for the next run when the run stopped first).
+A run killed part-way is finished off by replay_journal() exactly as the end
+of a completed run would have done it. Progress lines printed by concurrent
+fetch workers come out whole.
+
+Run: python -m pytest test_step3_fetch.py   (or python test_step3_fetch.py)
+"""
+
+import io
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+from contextlib import contextmanager, redirect_stdout
+
+import cache_state
+import sportradar
+import step3_fetch_timelines as step3
+import timeline_store
+from config import RETRY_ATTEMPTS
+from rate_limit import RequestBudget
+from retry import log
+
+
+class _Crash(BaseException):
+    """Stands in for the process dying mid-run (not caught like an ordinary error)."""
+
+
+def _http(code: int, **headers) -> urllib.error.HTTPError:
+    return urllib.error.HTTPError("http://mock", code, "mock", {"Retry-After": "0", **headers}, None)
+
+
+class _ScriptedClient:
+    """Answers each timeline request with the next scripted error, then succeeds."""
+
+    def __init__(self, script: dict[str, list]):
+        self.script = script
+
+    def get_timeline_if_changed(self, sport_event_id, validators):
+        if self.script[sport_event_id]:
+            raise self.script[sport_event_id].pop(0)
+        return {"timeline": []}, {"etag": f'"{sport_event_id}"'}
+
+
+@contextmanager
+def _fetch_env(script: dict[str, list]):
+    """Scratch working directory, no request pacing, and the scripted client."""
+    cwd, client, delay = os.getcwd(), sportradar._client, step3.REQUEST_DELAY_SECONDS
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        sportradar._client = _ScriptedClient(script)
+        step3.REQUEST_DELAY_SECONDS = 0
+        try:
+            yield timeline_store.DirStore("data/timelines")
+        finally:
+            os.chdir(cwd)
+            sportradar._client, step3.REQUEST_DELAY_SECONDS = client, delay
+
+
+def _todo(ids) -> list[tuple[dict, str]]:
+    return [({"sport_event_id": i}, i) for i in ids]
+
+
+def _assert_adds_up(stats) -> None:
+    outcomes = [stats.recovered, stats.abandoned, stats.deferred]
+    assert set.union(*outcomes) == stats.retried
+    assert sum(map(len, outcomes)) == len(stats.retried)
+
+
+def test_retry_outcomes_add_up():
+    script = {
+        "recovers": [_http(503)],
+        "not-found": [_http(503), _http(404)],
+        "recovers-deferred": [_http(503)] * RETRY_ATTEMPTS,
+        "dead": [_http(503)] * (RETRY_ATTEMPTS * 2),
+        "never-retried": [_http(404)],
+    }
+    with _fetch_env(script) as store:
+        fetched, errors, stats = step3.fetch_all(_todo(script), workers=1, store=store)
+    _assert_adds_up(stats)
+    assert sorted(fetched) == ["recovers", "recovers-deferred"]
+    assert stats.recovered == {"recovers", "recovers-deferred"}
+    assert stats.abandoned == {"not-found", "dead"}
+    assert errors == 3
+
+
+def test_quota_stop_abandons_one_and_defers_the_rest():
+    quota = _http(403, **{"X-Plan-Quota-Allotted": "10", "X-Plan-Quota-Current": "10"})
+    script = {"pending": [_http(503)] * RETRY_ATTEMPTS, "quota": [_http(503), quota]}
+    with _fetch_env(script) as store:
+        fetched, errors, stats = step3.fetch_all(_todo(script), workers=1, store=store)
+    _assert_adds_up(stats)
+    assert fetched == [] and errors == 1
+    assert stats.abandoned == {"quota"} and stats.deferred == {"pending"}
+
+
+def test_budget_stop_defers_retried_requests():
+    script = {"a": [_http(503)] * 2, "b": [_http(503)] * (RETRY_ATTEMPTS * 2)}
+    with _fetch_env(script) as store:
+        # a: 2 failures + 1 success; b: its first pass, then the budget runs out in the deferred pass
+        budget = RequestBudget(None, 3 + RETRY_ATTEMPTS + 1)
+        fetched, errors, stats = step3.fetch_all(_todo(script), workers=1, budget=budget, store=store)
+    _assert_adds_up(stats)
+    assert fetched == ["a"] and errors == 0
+    assert stats.deferred == {"b"}
+
+
+def test_replayed_journal_clears_marks_like_a_completed_run():
+    script = {"stale": [], "pruned": [], "unreadable": [], "crash": [_Crash()]}
+    with _fetch_env(script) as store:
+        cache_state.mark_stale(["stale", "crash"])
+        cache_state.mark_pruned(["pruned"])
+        cache_state.mark_unreadable(["unreadable"])
+        try:
+            step3.fetch_all(_todo(script), workers=1, store=store)
+        except _Crash:
+            pass
+        else:
+            raise AssertionError("the run was not interrupted")
+        # Killed before its end-of-run bookkeeping: every mark is still there
+        assert cache_state.load_stale_ids() == {"stale", "crash"}
+        assert cache_state.load_pruned_ids() == {"pruned"} and cache_state.load_unreadable_ids() == {"unreadable"}
+
+        assert cache_state.replay_journal() == 3
+        assert cache_state.load_stale_ids() == {"crash"}  # never fetched: still to do
+        assert cache_state.load_pruned_ids() == set() and cache_state.load_unreadable_ids() == set()
+        assert cache_state.ValidatorStore().get(sportradar.timeline_path("pruned")) == {"etag": '"pruned"'}
+        assert not os.path.exists(cache_state.FETCH_JOURNAL)
+
+
+class _SlowStdout(io.StringIO):
+    """A stdout whose writes let other threads run, as a terminal or pipe write does."""
+
+    def write(self, text):
+        time.sleep(0)
+        return super().write(text)
+
+
+def test_concurrent_progress_lines_do_not_interleave():
+    lines = [f"[{i}/400] Fetching 2026-03-07  Arsenal vs Chelsea  (sr:sport_event:{i})" for i in range(400)]
+    out = _SlowStdout()
+    with redirect_stdout(out):
+        threads = [threading.Thread(target=lambda part=lines[i::8]: [log(line) for line in part]) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert sorted(out.getvalue().splitlines()) == sorted(lines)
+
+
+if __name__ == "__main__":
+    test_retry_outcomes_add_up()
+    test_quota_stop_abandons_one_and_defers_the_rest()
+    test_budget_stop_defers_retried_requests()
+    test_replayed_journal_clears_marks_like_a_completed_run()
+    test_concurrent_progress_lines_do_not_interleave()
+    print("OK")
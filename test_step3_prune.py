@@ -0,0 +1,70 @@
+"""
+Weekly-run check of step 3's work list (build_todo(), as main() builds it):
+with --prune-goalless a match that has just finished 0–0 is pruned, while a
+stored timeline whose score changed to 0–0 is still refetched.
+
+Run: python -m pytest test_step3_prune.py   (or python test_step3_prune.py)
+"""
+
+from step2_get_schedule import changed_completed_matches
+from step3_fetch_timelines import build_todo, split_goalless
+
+
+def _row(event_id: str, status: str, home: str = "", away: str = "", start: str = "2026-01-01") -> dict:
+    return {
+        "sport_event_id": event_id,
+        "start_time": f"{start}T15:00:00+00:00",
+        "status": status,
+        "match_status": "ended" if status == "closed" else status,
+        "home_score": home,
+        "away_score": away,
+    }
+
+
+def test_weekly_run_prunes_new_goalless_match():
+    previous = [
+        _row("new-0-0", "not_started", start="2026-03-07"),
+        _row("new-2-1", "not_started", start="2026-03-07"),
+        _row("corrected", "closed", "1", "0", start="2026-02-28"),
+        _row("backlog-0-0", "closed", "0", "0", start="2025-09-13"),
+    ]
+    current = [
+        _row("new-0-0", "closed", "0", "0", start="2026-03-07"),
+        _row("new-2-1", "closed", "2", "1", start="2026-03-07"),
+        _row("corrected", "closed", "0", "0", start="2026-02-28"),  # goal ruled out after the match
+        _row("backlog-0-0", "closed", "0", "0", start="2025-09-13"),
+    ]
+    stale = set(changed_completed_matches(previous, current))
+    assert stale == {"corrected"}  # just finishing is not a schedule correction
+
+    cached = {"corrected", "old-1-1"}
+    current.append(_row("old-1-1", "closed", "1", "1", start="2025-08-16"))
+    todo, skipped, pruned = build_todo(current, cached, stale, stale & cached, prune_goalless=True)
+
+    assert skipped == 1  # old-1-1: cached and unchanged
+    assert {m["sport_event_id"] for m in pruned} == {"new-0-0", "backlog-0-0"}
+    assert [label.split("] ")[1].split()[0] for _, label in todo] == ["Fetching", "Refetching"]
+    assert [m["sport_event_id"] for m, _ in todo] == ["new-2-1", "corrected"]
+
+    todo, _, pruned = build_todo(current, cached, stale, stale & cached, prune_goalless=True, fill_pruned=True)
+    assert [m["sport_event_id"] for m, _ in todo] == ["new-2-1", "corrected", "new-0-0", "backlog-0-0"]
+    assert todo[-1][1].startswith("[4/4] Fetching 2025-09-13")
+
+
+def test_supabase_queue_skips_nothing():
+    # Supabase mode lists only matches without a timeline (plus stale ones): nothing counts as cached
+    todo, skipped, _ = build_todo([_row("a", "closed", "1", "0")], None, {"a"}, set())
+    assert skipped == 0 and [m["sport_event_id"] for m, _ in todo] == ["a"]
+
+
+def test_stale_match_without_timeline_is_pruned():
+    # An id left stale from an older run but never fetched has nothing to revalidate
+    queue, pruned = split_goalless([_row("m", "closed", "0", "0")], revalidate=set())
+    assert queue == [] and [m["sport_event_id"] for m in pruned] == ["m"]
+
+
+if __name__ == "__main__":
+    test_weekly_run_prunes_new_goalless_match()
+    test_supabase_queue_skips_nothing()
+    test_stale_match_without_timeline_is_pruned()
+    print("OK")
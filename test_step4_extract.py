@@ -0,0 +1,110 @@
+"""
+Step 4 checks against a scratch timeline store: an unreadable timeline is
+skipped and left in the cache for step 3 to refetch, never deleted, and
+pool workers leave recording it to the parent process; the
+process pool gives the same results as a serial run and is only used for
+large backfills.
+
+Run: python -m pytest test_step4_extract.py   (or python test_step4_extract.py)
+"""
+
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+
+import cache_state
+import detectors
+import timeline_store
+from mock_sportradar import synthetic_schedule, synthetic_timeline
+from step2_get_schedule import parse_schedule
+from step4_extract_own_goals import (
+    _extract_matches, _schedule_row_for_extract, extract_parallel, pool_size, read_timeline,
+)
+
+
+@contextmanager
+def _scratch_dir():
+    """Run in an empty working directory, so data/ bookkeeping never touches the real cache."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(cwd)
+
+
+def _season_store(n: int) -> list[tuple[str, dict]]:
+    """Fill the default timeline store with a synthetic season; return step 4's todo list for it."""
+    entries = synthetic_schedule(n, random.Random(2))
+    store = timeline_store.open_store()
+    for entry in entries:
+        store.put(entry["sport_event"]["id"], synthetic_timeline(entry, 2))
+    store.close()
+    return [(row["sport_event_id"], _schedule_row_for_extract(row)) for row in parse_schedule(entries)]
+
+
+def _corrupt(sport_event_id: str) -> None:
+    store = timeline_store.open_store()
+    with store._lock:
+        store._conn.execute("UPDATE timelines SET body = ? WHERE sport_event_id = ?",
+                            (b'{"timeline": [', sport_event_id))
+        store._conn.commit()
+    store.close()
+
+
+def test_unreadable_timeline_is_kept_and_queued_for_refetch():
+    with _scratch_dir():
+        todo = _season_store(4)
+        bad = todo[1][0]
+        _corrupt(bad)
+        store = timeline_store.open_store()
+        for low_memory in (False, True):
+            try:
+                read_timeline(store, bad, low_memory)
+            except ValueError:
+                continue
+            raise AssertionError("a truncated body was read")
+        results, unreadable = _extract_matches(store, todo, low_memory=False)
+        assert bad in store
+        store.close()
+        assert dict(results)[bad] is None and list(unreadable) == [bad]
+        # Pool workers only report it; the parent records every worker's finds in one write
+        assert extract_parallel(todo, workers=2)[1] == unreadable
+        assert cache_state.load_unreadable_ids() == set()
+        timeline_store.record_unreadable(unreadable)
+        assert cache_state.load_unreadable_ids() == {bad}
+
+
+def _as_csv(results) -> list:
+    return [
+        (sport_event_id, {d.name: [d.dump(r) for r in found["rows"][d.name]] for d in detectors.REGISTRY},
+         found["stats"])
+        for sport_event_id, found in results
+    ]
+
+
+def test_parallel_extraction_matches_serial():
+    with _scratch_dir():
+        todo = _season_store(60)
+        store = timeline_store.open_store()
+        serial, _ = _extract_matches(store, todo, low_memory=False)
+        store.close()
+        assert _as_csv(extract_parallel(todo, workers=2)[0]) == _as_csv(serial)
+        assert sum(found["stats"]["own_goals"] for _, found in serial)
+
+
+def test_pool_only_for_large_backfills():
+    cpus = os.cpu_count() or 1
+    assert pool_size(40, workers=4, min_matches=1000) == 1  # weekly run: serial
+    assert pool_size(5000, workers=1, min_matches=1000) == 1
+    assert pool_size(5000, workers=4, min_matches=1000) == min(4, cpus)
+    assert pool_size(5000, workers=64, min_matches=1000) <= cpus
+
+
+if __name__ == "__main__":
+    test_unreadable_timeline_is_kept_and_queued_for_refetch()
+    test_parallel_extraction_matches_serial()
+    test_pool_only_for_large_backfills()
+    print("OK")
@@ -0,0 +1,69 @@
+"""
+timeline_codec round trips and failure modes: a damaged body raises
+CorruptBody (a ValueError, so readers skip it as unreadable), while a zstd
+body whose dictionary is not loaded raises MissingDictionary, which is not a
+ValueError and so is never mistaken for corruption.
+
+Run: python -m pytest test_timeline_codec.py   (or python test_timeline_codec.py)
+"""
+
+import json
+import tempfile
+
+import pytest
+
+import timeline_store
+from step4_extract_own_goals import read_timeline
+from timeline_codec import GZIP_MAGIC, Codec, CorruptBody, MissingDictionary
+
+BODY = json.dumps({"timeline": [{"id": i, "type": "possible_goal", "competitor": "home"} for i in range(50)]}).encode()
+
+
+def test_gzip_round_trip():
+    codec = Codec("gzip")
+    blob = codec.encode(BODY)
+    assert blob != BODY and len(blob) < len(BODY)
+    assert codec.decode(blob) == BODY
+    # decode() goes by the body's own format, whatever the codec writes
+    assert Codec("none").decode(blob) == BODY
+    assert codec.decode(BODY) == BODY
+
+
+def test_corrupt_gzip_body_raises_corrupt_body():
+    blob = Codec("gzip").encode(BODY)
+    for damaged in (blob[:len(blob) // 2], blob[:10] + bytes(len(blob) - 10)):
+        with pytest.raises(CorruptBody):
+            Codec("gzip").decode(damaged)
+
+
+def test_corrupt_stored_body_is_unreadable():
+    with tempfile.TemporaryDirectory() as directory:
+        store = timeline_store.SqliteStore(f"{directory}/timelines.sqlite", compression="gzip")
+        store.put("sr:sport_event:1", json.loads(BODY))
+        with store._lock:
+            blob = store._conn.execute("SELECT body FROM timelines").fetchone()[0]
+            assert blob.startswith(GZIP_MAGIC)
+            store._conn.execute("UPDATE timelines SET body = ?", (blob[:len(blob) // 2],))
+            store._conn.commit()
+        with pytest.raises(ValueError):  # step 4 skips it and queues it for step 3 to refetch
+            read_timeline(store, "sr:sport_event:1")
+        store.close()
+
+
+def test_missing_dictionary_is_not_corruption():
+    zstd = pytest.importorskip("zstandard")
+    samples = [json.dumps({"timeline": [{"id": i, "minute": m} for i in range(m)]}).encode() for m in range(1, 200)]
+    trained = zstd.train_dictionary(4096, samples).as_bytes()
+    blob = Codec("zstd", {0: trained}).encode(BODY)
+    assert Codec("zstd", {0: trained}).decode(blob) == BODY
+    with pytest.raises(MissingDictionary) as raised:
+        Codec("zstd").decode(blob)
+    assert not isinstance(raised.value, ValueError)
+
+
+if __name__ == "__main__":
+    test_gzip_round_trip()
+    test_corrupt_gzip_body_raises_corrupt_body()
+    test_corrupt_stored_body_is_unreadable()
+    test_missing_dictionary_is_not_corruption()
+    print("OK")
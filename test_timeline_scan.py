@@ -0,0 +1,73 @@
+"""
+The streaming scan (step 4 --low-memory) must give the same detector rows and
+event counts as json.loads, and reject a truncated body like json.loads does.
+
+Run: python -m pytest test_timeline_scan.py   (or python test_timeline_scan.py)
+"""
+
+import json
+import random
+import tempfile
+
+import detectors
+import timeline_scan
+import timeline_store
+from mock_sportradar import synthetic_schedule, synthetic_timeline
+from step2_get_schedule import parse_schedule
+from step4_extract_own_goals import _schedule_row_for_extract, extract_match, read_timeline
+
+
+def _csv(result: dict) -> dict:
+    """extract_match() output with rows as their CSV dicts, so results compare by value."""
+    rows = {d.name: [d.dump(r) for r in result["rows"][d.name]] for d in detectors.REGISTRY}
+    return {"rows": rows, "stats": result["stats"]}
+
+
+def _season(n: int = 40) -> list[tuple[dict, dict]]:
+    entries = synthetic_schedule(n, random.Random(1))
+    rows = parse_schedule(entries)
+    return [(synthetic_timeline(entry, 1), _schedule_row_for_extract(row)) for entry, row in zip(entries, rows)]
+
+
+def test_scan_matches_json_loads():
+    own_goals = 0
+    for data, row in _season():
+        for body in (json.dumps(data).encode("utf-8"), json.dumps(data, indent=2).encode("utf-8")):
+            trimmed, count = timeline_scan.scan(body, detectors.wants())
+            assert count == len(data["timeline"])
+            assert trimmed["sport_event_status"] == data["sport_event_status"]
+            assert _csv(extract_match(trimmed, row, count)) == _csv(extract_match(json.loads(body), row))
+        own_goals += len(detectors.run(data, row)["own_goals"])
+    assert own_goals  # the season exercises the own-goal detector, not just empty rows
+
+
+def test_read_timeline_low_memory_matches_default():
+    with tempfile.TemporaryDirectory() as directory:
+        store = timeline_store.DirStore(directory)
+        season = _season(10)
+        for data, row in season:
+            store.put(row["sport_event_id"], data)
+        for _, row in season:
+            full = read_timeline(store, row["sport_event_id"])
+            scanned = read_timeline(store, row["sport_event_id"], low_memory=True)
+            assert full[1] == scanned[1]
+            assert _csv(extract_match(full[0], row, full[1])) == _csv(extract_match(scanned[0], row, scanned[1]))
+        assert read_timeline(store, "sr:sport_event:missing", low_memory=True) is None
+
+
+def test_truncated_body_is_rejected():
+    data, _ = _season(1)[0]
+    body = json.dumps(data).encode("utf-8")
+    for cut in (len(body) // 2, len(body) - 1):
+        try:
+            timeline_scan.scan(body[:cut], detectors.wants())
+        except ValueError:
+            continue
+        raise AssertionError(f"truncated body ({cut} bytes) was accepted")
+
+
+if __name__ == "__main__":
+    test_scan_matches_json_loads()
+    test_read_timeline_low_memory_matches_default()
+    test_truncated_body_is_rejected()
+    print("OK")
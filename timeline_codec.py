@@ -0,0 +1,136 @@
+"""
+Compression for stored timeline bodies.
+
+Timeline JSON is very repetitive: the same keys, team names and commentary
+templates appear in every match. A zstd dictionary trained on our own
+timelines captures that shared vocabulary, so each body compresses well even
+though it is compressed on its own. gzip is the fallback when the optional
+`zstandard` package is not installed.
+
+Codec.decode() recognises the format from the first bytes (zstd frame, gzip
+member or plain JSON), so a store can mix bodies written under different
+settings and switching TIMELINE_COMPRESSION never strands old data. zstd
+frames record the id of the dictionary they were written with; every
+dictionary ever trained is kept so older frames stay readable.
+
+Install: pip install zstandard   (optional)
+"""
+
+from __future__ import annotations
+
+import gzip
+import threading
+import zlib
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC = b"\x1f\x8b"
+METHODS = ("none", "gzip", "zstd")
+
+ZSTD_LEVEL = 9
+GZIP_LEVEL = 6
+DICT_SIZE = 112 * 1024
+DICT_SAMPLES = 300
+
+
+class CorruptBody(ValueError):
+    """A stored body that claims a compression format but does not decode."""
+
+
+class MissingDictionary(LookupError):
+    """A zstd body written with a dictionary this codec was not given (a store or
+    config problem, not damaged data: the body is fine once the dictionary is back)."""
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def train_dictionary(samples: list[bytes], size: int = DICT_SIZE) -> bytes:
+    """Train a zstd dictionary on sample timeline bodies; raises if zstandard is missing."""
+    zstd = _zstd()
+    if zstd is None:
+        raise RuntimeError("Training a dictionary needs zstandard: pip install zstandard")
+    return zstd.train_dictionary(size, samples).as_bytes()
+
+
+class Codec:
+    """Encode/decode timeline bodies with one method; decode accepts any of them."""
+
+    def __init__(self, method: str = "none", dictionaries: dict[int, bytes] | None = None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown compression {method!r} (expected one of {', '.join(METHODS)})")
+        if method == "zstd" and _zstd() is None:
+            print("  zstandard not installed — compressing timelines with gzip instead")
+            method = "gzip"
+        self.method = method
+        self._dictionaries: dict[int, object] = {}
+        self._active: int | None = None
+        self._local = threading.local()
+        for data in (dictionaries or {}).values():
+            self.add_dictionary(data)
+
+    def add_dictionary(self, data: bytes) -> int:
+        """Register a trained dictionary, make it the one new bodies use, and return its id."""
+        zstd = _zstd()
+        if zstd is None:
+            return 0
+        d = zstd.ZstdCompressionDict(data)
+        self._dictionaries[d.dict_id()] = d
+        self._active = d.dict_id()
+        self._local = threading.local()  # drop per-thread (de)compressors built for the old one
+        return d.dict_id()
+
+    def _compressor(self):
+        # zstd (de)compressor objects must not be shared between threads
+        c = getattr(self._local, "compressor", None)
+        if c is None:
+            zstd = _zstd()
+            d = self._dictionaries.get(self._active)
+            c = zstd.ZstdCompressor(level=ZSTD_LEVEL, dict_data=d) if d else zstd.ZstdCompressor(level=ZSTD_LEVEL)
+            self._local.compressor = c
+        return c
+
+    def _decompressor(self, dict_id: int):
+        cache = getattr(self._local, "decompressors", None)
+        if cache is None:
+            cache = self._local.decompressors = {}
+        d = cache.get(dict_id)
+        if d is None:
+            zstd = _zstd()
+            if dict_id and dict_id not in self._dictionaries:
+                raise MissingDictionary(f"Timeline was compressed with unknown zstd dictionary {dict_id}")
+            d = cache[dict_id] = zstd.ZstdDecompressor(dict_data=self._dictionaries.get(dict_id))
+        return d
+
+    def encode(self, body: bytes) -> bytes:
+        if self.method == "zstd":
+            return self._compressor().compress(body)
+        if self.method == "gzip":
+            return gzip.compress(body, GZIP_LEVEL, mtime=0)
+        return body
+
+    def decode(self, blob: bytes) -> bytes:
+        """
+        Decompress a stored body. Raises CorruptBody (a ValueError) if it is
+        damaged, MissingDictionary if its zstd dictionary is not loaded.
+        """
+        blob = bytes(blob)
+        if blob.startswith(ZSTD_MAGIC):
+            zstd = _zstd()
+            if zstd is None:
+                raise RuntimeError("Timeline is zstd-compressed: pip install zstandard")
+            try:
+                dict_id = zstd.get_frame_parameters(blob).dict_id
+                return self._decompressor(dict_id).decompress(blob)
+            except zstd.ZstdError as e:
+                raise CorruptBody(f"Corrupt zstd timeline: {e}") from e
+        if blob.startswith(GZIP_MAGIC):
+            try:
+                return gzip.decompress(blob)
+            except (OSError, EOFError, zlib.error) as e:
+                raise CorruptBody(f"Corrupt gzip timeline: {e}") from e
+        return blob
@@ -0,0 +1,528 @@
+"""
+Storage for cached timeline responses, keyed by sport_event_id.
+
+Two interchangeable backends:
+  - SqliteStore — one data/timelines.sqlite file; random access by id and a
+    single sequential scan for bulk reads, instead of one file open per match
+  - DirStore — the original layout, one JSON file per match in data/timelines/
+
+open_store() returns the backend selected by TIMELINE_STORE in config. The
+first time the SQLite store is opened it imports an existing data/timelines/
+directory, so switching backends loses nothing; an interrupted import picks
+up where it stopped on the next open. SqliteStore(path, read_only=True) opens
+an existing store without creating, migrating or importing anything.
+
+Both backends offer: `id in store`, len(), ids(), get(), put(), delete(),
+items() (sorted by id), body() / bodies() (the same as raw JSON bytes, for
+timeline_scan.scan()) and manifest().
+
+SqliteStore bodies can be compressed (TIMELINE_COMPRESSION = zstd / gzip,
+see timeline_codec.py); `compress` retrains the zstd dictionary on the
+cached timelines and rewrites every body with the chosen method. DirStore
+always holds plain JSON.
+
+The manifest holds one small entry per match — event count, own-goal count,
+sha256 and byte size of the timeline JSON, fetch time — written together with
+the timeline by put(). Summary stats (generate_report.py) read it instead of
+parsing every timeline; entries missing for timelines stored before the
+manifest existed are filled in on the next manifest() call.
+
+Usage:
+  python timeline_store.py import [DIR]   # load DIR (default data/timelines) into the SQLite store
+  python timeline_store.py export [DIR]   # write the SQLite store out as one JSON file per match
+  python timeline_store.py compress [none|gzip|zstd]   # recompress the SQLite store (default: TIMELINE_COMPRESSION)
+  python timeline_store.py stats
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Iterator
+
+import cache_state
+import own_goal
+import timeline_codec
+import timeline_scan
+from config import TIMELINES_DIR, TIMELINES_DB, TIMELINE_STORE, TIMELINE_COMPRESSION
+
+MANIFEST_NAME = ".manifest.json"  # DirStore manifest, inside the timelines directory
+MANIFEST_LOG_NAME = ".manifest.log"  # DirStore: entries changed since the manifest was last written
+MANIFEST_FIELDS = ("events", "own_goals", "sha256", "bytes", "fetched_at")
+DIR_IMPORTED = "dir_imported"  # SqliteStore meta key: open_store() finished importing TIMELINES_DIR
+
+
+def cache_path(sport_event_id: str, directory: str = TIMELINES_DIR) -> str:
+    safe_id = sport_event_id.replace(":", "_")
+    return os.path.join(directory, f"{safe_id}.json")
+
+
+def _id_from_filename(filename: str) -> str:
+    return filename.replace("sr_sport_event_", "sr:sport_event:").replace(".json", "")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+Predicate = Callable[[dict], bool]
+
+
+def manifest_entry(data: dict, body: bytes, fetched_at: str, is_own_goal: Predicate) -> dict:
+    """Manifest entry for one timeline, given its decoded data and JSON body."""
+    timeline = data.get("timeline", [])
+    return {
+        "events": len(timeline),
+        "own_goals": sum(1 for ev in timeline if is_own_goal(ev)),
+        "sha256": hashlib.sha256(body).hexdigest(),
+        "bytes": len(body),
+        "fetched_at": fetched_at,
+    }
+
+
+def _manifest_entry_from_body(body: bytes, fetched_at: str, is_own_goal: Predicate) -> dict:
+    """manifest_entry() for a stored body, without parsing the whole timeline."""
+    own_goals, events = timeline_scan.scan(body, is_own_goal)
+    entry = manifest_entry(own_goals, body, fetched_at, is_own_goal)
+    entry["events"] = events
+    return entry
+
+
+def unreadable(sport_event_id: str, error: Exception) -> None:
+    """
+    Report a stored timeline that can't be decoded: JSON truncated by a crash
+    before cache writes were atomic, or a damaged compressed body
+    (timeline_codec.CorruptBody). Callers treat it as missing. The entry is
+    left in place, since deleting it would throw away a paid-for response on
+    what may be a codec problem; step 3 refetches and overwrites it instead.
+    """
+    record_unreadable({sport_event_id: error})
+
+
+def record_unreadable(errors: dict) -> None:
+    """unreadable() for a batch of {sport_event_id: error}, recorded in one write."""
+    for sport_event_id, error in sorted(errors.items()):
+        print(f"  Unreadable timeline {sport_event_id} ({error}) — skipped, step 3 will refetch it")
+    if errors:
+        cache_state.mark_unreadable(errors)
+
+
+class DirStore:
+    """
+    One JSON file per match: <dir>/<sport_event_id with ':' -> '_'>.json.
+
+    put() and delete() append their manifest change to .manifest.log instead of
+    rewriting .manifest.json; the log is folded into the manifest by manifest()
+    and close(), and replayed on load if a run ended without either.
+    """
+
+    def __init__(self, directory: str = TIMELINES_DIR, is_own_goal: Predicate = own_goal.is_own_goal):
+        self.directory = directory
+        self.is_own_goal = is_own_goal
+        self._manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self._log_path = os.path.join(directory, MANIFEST_LOG_NAME)
+        self._manifest: dict[str, dict] | None = None
+        self._log_dirty = False
+        self._lock = threading.Lock()
+
+    def _files(self) -> list[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            f for f in os.listdir(self.directory)
+            if f.endswith(".json") and not f.startswith(".")
+        )
+
+    def _load_manifest(self) -> dict[str, dict]:
+        # Caller holds self._lock
+        if self._manifest is None:
+            try:
+                with open(self._manifest_path, encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._manifest = {}
+            try:
+                with open(self._log_path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            change = json.loads(line)
+                        except json.JSONDecodeError:
+                            break  # torn last line from a crash
+                        if change["entry"] is None:
+                            self._manifest.pop(change["id"], None)
+                        else:
+                            self._manifest[change["id"]] = change["entry"]
+                        self._log_dirty = True
+            except FileNotFoundError:
+                pass
+        return self._manifest
+
+    def _log_change(self, sport_event_id: str, entry: dict | None) -> None:
+        # Caller holds self._lock
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"id": sport_event_id, "entry": entry}) + "\n")
+        self._log_dirty = True
+
+    def _save_manifest(self) -> None:
+        # Caller holds self._lock
+        with cache_state.atomic_write(self._manifest_path, encoding="utf-8") as f:
+            json.dump(self._manifest, f, indent=1, sort_keys=True)
+        # Everything in the log is now in the manifest
+        try:
+            os.remove(self._log_path)
+        except FileNotFoundError:
+            pass
+        self._log_dirty = False
+
+    def __contains__(self, sport_event_id: str) -> bool:
+        return os.path.exists(cache_path(sport_event_id, self.directory))
+
+    def __len__(self) -> int:
+        return len(self._files())
+
+    def ids(self) -> set[str]:
+        return {_id_from_filename(f) for f in self._files()}
+
+    def _load(self, path: str) -> dict | None:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            unreadable(_id_from_filename(os.path.basename(path)), e)
+            return None
+
+    def get(self, sport_event_id: str) -> dict | None:
+        return self._load(cache_path(sport_event_id, self.directory))
+
+    def body(self, sport_event_id: str) -> bytes | None:
+        try:
+            with open(cache_path(sport_event_id, self.directory), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, sport_event_id: str, data: dict) -> None:
+        text = json.dumps(data, ensure_ascii=False)
+        entry = manifest_entry(data, text.encode("utf-8"), _now(), self.is_own_goal)
+        with cache_state.atomic_write(cache_path(sport_event_id, self.directory), encoding="utf-8") as f:
+            f.write(text)
+        with self._lock:
+            self._load_manifest()[sport_event_id] = entry
+            self._log_change(sport_event_id, entry)
+
+    def delete(self, sport_event_id: str) -> None:
+        try:
+            os.remove(cache_path(sport_event_id, self.directory))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            if self._load_manifest().pop(sport_event_id, None) is not None:
+                self._log_change(sport_event_id, None)
+
+    def manifest(self) -> dict[str, dict]:
+        """Return {sport_event_id: entry} for every cached timeline."""
+        ids = self.ids()
+        with self._lock:
+            manifest = self._load_manifest()
+            missing = ids - manifest.keys()
+            dropped = manifest.keys() - ids
+            for sport_event_id in dropped:
+                del manifest[sport_event_id]
+            for sport_event_id in sorted(missing):
+                path = cache_path(sport_event_id, self.directory)
+                if self._load(path) is None:
+                    continue
+                with open(path, "rb") as f:
+                    body = f.read()
+                fetched_at = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+                manifest[sport_event_id] = _manifest_entry_from_body(
+                    body, fetched_at.isoformat(timespec="seconds"), self.is_own_goal
+                )
+            if missing or dropped or self._log_dirty:
+                self._save_manifest()
+            return dict(manifest)
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        for filename in self._files():
+            data = self._load(os.path.join(self.directory, filename))
+            if data is not None:
+                yield _id_from_filename(filename), data
+
+    def bodies(self) -> Iterator[tuple[str, bytes]]:
+        for filename in self._files():
+            try:
+                with open(os.path.join(self.directory, filename), "rb") as f:
+                    yield _id_from_filename(filename), f.read()
+            except FileNotFoundError:
+                continue
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log_dirty:
+                self._save_manifest()
+
+
+class SqliteStore:
+    """All timelines in one SQLite file; safe to share between step 3's worker threads."""
+
+    def __init__(self, path: str = TIMELINES_DB, compression: str = TIMELINE_COMPRESSION,
+                 is_own_goal: Predicate = own_goal.is_own_goal, read_only: bool = False):
+        self.path = path
+        self.is_own_goal = is_own_goal
+        self._lock = threading.Lock()
+        if read_only:
+            # An existing store, opened for reading only: nothing is created or migrated
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            self._load_codec(compression)
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS timelines ("
+            " sport_event_id TEXT PRIMARY KEY,"
+            " body BLOB NOT NULL,"
+            " fetched_at TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            " sport_event_id TEXT PRIMARY KEY,"
+            " events INTEGER NOT NULL,"
+            " own_goals INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " bytes INTEGER NOT NULL,"
+            " fetched_at TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dictionaries ("
+            " dict_id INTEGER PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " created_at TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._load_codec(compression)
+
+    def _load_codec(self, compression: str) -> None:
+        dictionaries = self._conn.execute("SELECT dict_id, data FROM dictionaries ORDER BY created_at")
+        self.codec = timeline_codec.Codec(compression, dict(dictionaries.fetchall()))
+
+    def _write_manifest(self, sport_event_id: str, entry: dict) -> None:
+        # Caller holds self._lock and commits
+        self._conn.execute(
+            "INSERT OR REPLACE INTO manifest (sport_event_id, events, own_goals, sha256, bytes, fetched_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (sport_event_id, *(entry[k] for k in MANIFEST_FIELDS)),
+        )
+
+    def get_meta(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+    def __contains__(self, sport_event_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM timelines WHERE sport_event_id = ?", (sport_event_id,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM timelines").fetchone()[0]
+
+    def ids(self) -> set[str]:
+        with self._lock:
+            return {r[0] for r in self._conn.execute("SELECT sport_event_id FROM timelines")}
+
+    def get(self, sport_event_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body FROM timelines WHERE sport_event_id = ?", (sport_event_id,)
+            ).fetchone()
+        return json.loads(self.codec.decode(row[0])) if row else None
+
+    def body(self, sport_event_id: str) -> bytes | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body FROM timelines WHERE sport_event_id = ?", (sport_event_id,)
+            ).fetchone()
+        return self.codec.decode(row[0]) if row else None
+
+    def put(self, sport_event_id: str, data: dict) -> None:
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        fetched_at = _now()
+        entry = manifest_entry(data, body, fetched_at, self.is_own_goal)
+        blob = self.codec.encode(body)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO timelines (sport_event_id, body, fetched_at) VALUES (?, ?, ?)",
+                (sport_event_id, blob, fetched_at),
+            )
+            self._write_manifest(sport_event_id, entry)
+            self._conn.commit()
+
+    def delete(self, sport_event_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM timelines WHERE sport_event_id = ?", (sport_event_id,))
+            self._conn.execute("DELETE FROM manifest WHERE sport_event_id = ?", (sport_event_id,))
+            self._conn.commit()
+
+    def manifest(self) -> dict[str, dict]:
+        """Return {sport_event_id: entry} for every cached timeline."""
+        with self._lock:
+            missing = self._conn.execute(
+                "SELECT t.sport_event_id, t.body, t.fetched_at FROM timelines t"
+                " LEFT JOIN manifest m USING (sport_event_id) WHERE m.sport_event_id IS NULL"
+            ).fetchall()
+            for sport_event_id, blob, fetched_at in missing:
+                self._write_manifest(sport_event_id, _manifest_entry_from_body(
+                    self.codec.decode(blob), fetched_at, self.is_own_goal
+                ))
+            if missing:
+                self._conn.commit()
+            rows = self._conn.execute(
+                f"SELECT sport_event_id, {', '.join(MANIFEST_FIELDS)} FROM manifest"
+            ).fetchall()
+        return {row[0]: dict(zip(MANIFEST_FIELDS, row[1:])) for row in rows}
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        # A separate read-only connection so a long scan does not hold the write lock
+        conn = sqlite3.connect(self.path)
+        try:
+            for sport_event_id, body in conn.execute(
+                "SELECT sport_event_id, body FROM timelines ORDER BY sport_event_id"
+            ):
+                yield sport_event_id, json.loads(self.codec.decode(body))
+        finally:
+            conn.close()
+
+    def bodies(self) -> Iterator[tuple[str, bytes]]:
+        conn = sqlite3.connect(self.path)
+        try:
+            for sport_event_id, body in conn.execute(
+                "SELECT sport_event_id, body FROM timelines ORDER BY sport_event_id"
+            ):
+                yield sport_event_id, self.codec.decode(body)
+        finally:
+            conn.close()
+
+    def compress(self, method: str) -> tuple[int, int]:
+        """Rewrite every body with `method` (training a fresh zstd dictionary first); return (bytes before, after)."""
+        codec = timeline_codec.Codec(method)
+        with self._lock:
+            rows = self._conn.execute("SELECT sport_event_id, body FROM timelines ORDER BY sport_event_id").fetchall()
+            bodies = [(sport_event_id, self.codec.decode(blob)) for sport_event_id, blob in rows]
+            if codec.method == "zstd" and len(bodies) >= 2:
+                step = max(1, len(bodies) // timeline_codec.DICT_SAMPLES)
+                data = timeline_codec.train_dictionary([body for _, body in bodies[::step]])
+                dict_id = self.codec.add_dictionary(data)
+                codec.add_dictionary(data)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dictionaries (dict_id, data, created_at) VALUES (?, ?, ?)",
+                    (dict_id, data, _now()),
+                )
+            before = sum(len(blob) for _, blob in rows)
+            after = 0
+            for sport_event_id, body in bodies:
+                blob = codec.encode(body)
+                after += len(blob)
+                self._conn.execute("UPDATE timelines SET body = ? WHERE sport_event_id = ?", (blob, sport_event_id))
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+            self.codec.method = codec.method
+        return before, after
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def import_dir(store, directory: str = TIMELINES_DIR, skip_existing: bool = False) -> int:
+    """Copy every timeline file in `directory` into `store` (unless already there, with skip_existing); return how many."""
+    source = DirStore(directory)
+    existing = store.ids() if skip_existing else set()
+    count = 0
+    for sport_event_id in sorted(source.ids() - existing):
+        data = source.get(sport_event_id)
+        if data is not None:
+            store.put(sport_event_id, data)
+            count += 1
+    return count
+
+
+def export_dir(store, directory: str = TIMELINES_DIR) -> int:
+    """Write every timeline in `store` out as one JSON file per match; return how many."""
+    target = DirStore(directory)
+    count = 0
+    for sport_event_id, data in store.items():
+        target.put(sport_event_id, data)
+        count += 1
+    target.close()
+    return count
+
+
+def open_store():
+    """Return the configured timeline store ("sqlite" or "dir")."""
+    if TIMELINE_STORE == "dir":
+        return DirStore(TIMELINES_DIR)
+    store = SqliteStore(TIMELINES_DB)
+    # Marked done only once every file is in, so an interrupted import resumes where it stopped
+    if store.get_meta(DIR_IMPORTED) is None:
+        if DirStore(TIMELINES_DIR).ids():
+            n = import_dir(store, TIMELINES_DIR, skip_existing=True)
+            print(f"Imported {n} cached timelines from {TIMELINES_DIR}/ into {TIMELINES_DB}")
+        store.set_meta(DIR_IMPORTED, _now())
+    return store
+
+
+def main() -> int:
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    directory = sys.argv[2] if len(sys.argv) > 2 else TIMELINES_DIR
+    if command == "import":
+        store = SqliteStore(TIMELINES_DB)
+        print(f"Imported {import_dir(store, directory)} timelines into {TIMELINES_DB}")
+    elif command == "export":
+        store = SqliteStore(TIMELINES_DB)
+        print(f"Exported {export_dir(store, directory)} timelines to {directory}/")
+    elif command == "compress":
+        method = sys.argv[2] if len(sys.argv) > 2 else TIMELINE_COMPRESSION
+        store = SqliteStore(TIMELINES_DB)
+        before, after = store.compress(method)
+        print(f"Recompressed {len(store)} timelines with {store.codec.method}: "
+              f"{before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+    elif command == "stats":
+        store = open_store()
+        manifest = store.manifest().values()
+        print(f"{type(store).__name__}: {len(manifest)} timelines, "
+              f"{sum(e['events'] for e in manifest):,} events, "
+              f"{sum(e['own_goals'] for e in manifest)} own goals, "
+              f"{sum(e['bytes'] for e in manifest) / 1e6:.1f} MB of JSON")
+        if isinstance(store, SqliteStore):
+            print(f"{TIMELINES_DB}: {os.path.getsize(TIMELINES_DB) / 1e6:.1f} MB on disk")
+    else:
+        print("Usage: python timeline_store.py import|export [DIR] | compress [METHOD] | stats")
+        return 1
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())